@@ -86,7 +86,48 @@ function updatePageCounter(totalRoutes) {
   document.getElementById("nextPage").disabled = currentPage >= totalPages - 1;
 }
 
+// Lädt nur die Routen des angeklickten AS; fällt auf alle Routen zurück,
+// falls (noch) keine Shards pro AS erzeugt wurden
+function fetchRoutesForAsn(startAsn) {
+  return fetch(`/routes/asn/${encodeURIComponent(startAsn)}`)
+    .then((response) => (response.ok ? response : fetch("/routes")))
+    .then((response) => response.json());
+}
+
+// Vorberechnete AS-Statistiken des Start-AS (durchquerte AS -> Anzahl); null, falls
+// der Python-Updater (noch) keine erzeugt hat
+function fetchAsStats(startAsn) {
+  return fetch(`/as/${encodeURIComponent(startAsn)}/stats`)
+    .then((response) => (response.ok ? response.json() : null))
+    .catch(() => null);
+}
+
+// Fallback ohne vorberechnete Statistiken: durchquerte AS selbst zählen
+function countTraversedAsns(routes) {
+  const asnCount = new Map();
+  routes.forEach((route) => {
+    route.as_path.forEach((asn) => {
+      if (asn) {
+        asnCount.set(asn, (asnCount.get(asn) || 0) + 1);
+      }
+    });
+  });
+  return asnCount;
+}
+
 let tempVisibleMarkers = [];
+// Marker eines durchquerten AS sichtbar machen, falls er es nicht ist
+function revealMarker(asn) {
+  const marker = globalMarkerMap.get(asn);
+  if (marker && !map.hasLayer(marker)) {
+    marker.addTo(map);
+    // Nur temporäre Marker mit routes_count === 0 merken
+    if (globalPointMap.get(asn)?.routes_count === 0) {
+      tempVisibleMarkers.push(marker);
+    }
+  }
+}
+
 // Funktion zum Laden der Routen für einen bestimmten ASN
 function loadRoutesForPoint(startAsn) {
   clearRoutes(); // Vorherige Routen löschen
@@ -98,15 +139,13 @@ function loadRoutesForPoint(startAsn) {
   });
   tempVisibleMarkers = [];
 
-  fetch("/routes")
-    .then((response) => response.json())
-    .then((routes) => {
+  Promise.all([fetchRoutesForAsn(startAsn), fetchAsStats(startAsn)])
+    .then(([routes, stats]) => {
       let colorIndex = 0;
       uniqueEdges.clear();
-      let asnCount = new Map();
       const routeMap = new Map();
 
-      const relevantRoutes = routes.filter((route) => route.as_path && route.as_path[0] === startAsn);
+      const relevantRoutes = routes.filter((route) => Array.isArray(route?.as_path) && route.as_path[0] === startAsn);
 
       // Gesamtanzahl der Seiten aktualisieren
       updatePageCounter(relevantRoutes.length);
@@ -116,55 +155,40 @@ function loadRoutesForPoint(startAsn) {
       const end = start + routesPerPage;
       const paginatedRoutes = relevantRoutes.slice(start, end);
 
+      const asnCount = stats ? new Map(Object.entries(stats.traversed)) : countTraversedAsns(relevantRoutes);
+      asnCount.forEach((_, asn) => revealMarker(asn));
+
       if (relevantRoutes.length === 0) {
         console.log("Keine Routen gefunden.");
-        updateDurchquerteKnotenListe(asnCount, globalPoints, startAsn, globalMarkerMap);
-        updateDurchquerteRoutenListe(startAsn, paginatedRoutes, routeMap);
-        return;
       }
 
-      relevantRoutes.forEach((route) => {
-        if (!route || !Array.isArray(route.as_path)) return;
-        let pathCoordinates = [];
-
+      paginatedRoutes.forEach((route) => {
+        const pathCoordinates = [];
         route.as_path.forEach((asn) => {
-          if (!asn) return;
-
-          const point = globalPoints.find((p) => p.asn === asn);
+          const point = asn ? globalPointMap.get(asn) : undefined;
           if (point?.coordinates) {
             pathCoordinates.push(point.coordinates);
-            asnCount.set(asn, (asnCount.get(asn) || 0) + 1);
-
-            // Marker sichtbar machen, falls er es nicht ist
-            const marker = globalMarkerMap.get(asn);
-            if (marker && !map.hasLayer(marker)) {
-              marker.addTo(map);
-              // Nur temporäre Marker mit routes_count === 0 merken
-              if (point.routes_count === 0) {
-                tempVisibleMarkers.push(marker);
-              }
-            }
           }
         });
 
-          if (pathCoordinates.length > 1 && paginatedRoutes.includes(route)) {
-            try {
-              const polyline = L.polyline(pathCoordinates, {
-                color: getRandomColor(colorIndex++),
-                weight: 2,
-              }).addTo(map);
-              polyline.on("click", handleRouteClick);
-              uniqueEdges.set(route.as_path.join('-'), polyline);
-              currentRoutePolylines.push(polyline);
-
-              routeMap.set(route.timestamp, polyline);
-            } catch (error) {
-              console.error("Fehler bei der Polyline:", error);
-            }
+        if (pathCoordinates.length > 1) {
+          try {
+            const polyline = L.polyline(pathCoordinates, {
+              color: getRandomColor(colorIndex++),
+              weight: 2,
+            }).addTo(map);
+            polyline.on("click", handleRouteClick);
+            uniqueEdges.set(route.as_path.join('-'), polyline);
+            currentRoutePolylines.push(polyline);
+
+            routeMap.set(route.timestamp, polyline);
+          } catch (error) {
+            console.error("Fehler bei der Polyline:", error);
           }
-        });
+        }
+      });
 
-      updateDurchquerteKnotenListe(asnCount, globalPoints, startAsn, globalMarkerMap);
+      updateDurchquerteKnotenListe(asnCount, globalPointMap, startAsn, globalMarkerMap);
       updateDurchquerteRoutenListe(startAsn, paginatedRoutes, routeMap);
     })
     .catch((error) => console.error("Fehler beim Laden der Routen:", error));
@@ -184,7 +208,7 @@ function showPreviousRoutes() {
   }
 }
 
-function updateDurchquerteKnotenListe(asnCount, points, startAsn, markerMap) {
+function updateDurchquerteKnotenListe(asnCount, pointMap, startAsn, markerMap) {
   const listContainer = document.getElementById("route-list");
   listContainer.innerHTML = ""; // Setze den Inhalt der Liste zurück
 
@@ -214,8 +238,8 @@ function updateDurchquerteKnotenListe(asnCount, points, startAsn, markerMap) {
 
   // Gehe durch das sortierte Array von ASNs und ihrer Durchquerungsanzahl
   sortedAsnCount.forEach(([asn, count]) => {
-    // Suche den Punkt, um Stadt und Region zu bekommen
-    const point = points.find(p => p.asn === asn);
+    // Punkt per ASN nachschlagen, um den AS-Namen zu bekommen
+    const point = pointMap.get(asn);
     if (point) {
       hasEntries = true; // Es gibt mindestens einen Eintrag
       const row = document.createElement("tr");
@@ -365,6 +389,7 @@ function updateKnotenListe(points, markerMap) {
 }
 
 let globalPoints = [];
+let globalPointMap = new Map(); // ASN -> Punkt, für Nachschlagen ohne Suche in globalPoints
 let globalMarkerMap = new Map();
 let globalStartAsn = null;
 
@@ -388,6 +413,7 @@ fetch("/points")
 
       if (isValidCoordinates && hasValidAsn) {
         globalPoints.push(point)
+        globalPointMap.set(point.asn, point);
         // Berechne die Markerfarbe basierend auf der Routenanzahl
         const markerColor = getMarkerColor(point.routes_count);
 
@@ -1,18 +1,80 @@
 const express = require("express");
+const fs = require("fs");
 const app = express();
 const port = 3000;
 
+const dataDir = __dirname.replace("backend","") + "data/";
+
+// Liefert eine JSON-Datei aus; vom Python-Updater vorkomprimierte Sidecars (.br/.gz)
+// werden bevorzugt und ohne erneute Kompression direkt gesendet
+function sendJson(req, res, fileName) {
+  const accepted = req.headers["accept-encoding"] || "";
+  const variants = [["br", ".br"], ["gzip", ".gz"]];
+  res.set("Vary", "Accept-Encoding");
+
+  for (const [encoding, suffix] of variants) {
+    const compressedPath = dataDir + fileName + suffix;
+    if (accepted.includes(encoding) && fs.existsSync(compressedPath)) {
+      res.set("Content-Encoding", encoding);
+      res.type("application/json");
+      return res.sendFile(compressedPath);
+    }
+  }
+  res.sendFile(dataDir + fileName);
+}
+
 // JSON-Endpunkte für Punkte und Verbindungen
 app.get("/points", (req, res) => {
-  let Path = __dirname.replace("backend","") + "data/points.json"
-  res.sendFile(Path);
-  //res.sendFile(__dirname + "/../data/points.json");
+  sendJson(req, res, "points.json");
 });
 
 app.get("/routes", (req, res) => {
-  let Path = __dirname.replace("backend","") + "data/routes.json"
-  res.sendFile(Path);
-  //res.sendFile(__dirname + "/../data/routes.json");
+  sendJson(req, res, "routes.json");
+});
+
+// Routen eines einzelnen Start-AS (vom Python-Updater nach AS aufgeteilt)
+app.get("/routes/manifest", (req, res) => {
+  sendJson(req, res, "routes_by_asn/manifest.json");
+});
+
+app.get("/routes/asn/:asn", (req, res) => {
+  const asn = req.params.asn;
+  if (!/^\d+$/.test(asn)) {
+    return res.status(400).json({ error: "Ungültige ASN" });
+  }
+  if (fs.existsSync(dataDir + `routes_by_asn/AS${asn}.json`)) {
+    return sendJson(req, res, `routes_by_asn/AS${asn}.json`);
+  }
+  // Manifest vorhanden, aber kein Shard: dieses AS hat keine Routen
+  if (fs.existsSync(dataDir + "routes_by_asn/manifest.json")) {
+    return res.json([]);
+  }
+  res.status(404).json({ error: "Keine Routen-Shards vorhanden" });
+});
+
+// Vorberechnete AS-Statistiken: durchquerte AS pro Start-AS und Nachbarn im AS-Graphen
+app.get("/as/manifest", (req, res) => {
+  sendJson(req, res, "as_stats/manifest.json");
+});
+
+app.get("/as/:asn/stats", (req, res) => {
+  const asn = req.params.asn;
+  if (!/^\d+$/.test(asn)) {
+    return res.status(400).json({ error: "Ungültige ASN" });
+  }
+  if (fs.existsSync(dataDir + `as_stats/AS${asn}.json`)) {
+    return sendJson(req, res, `as_stats/AS${asn}.json`);
+  }
+  // Manifest vorhanden, aber keine Datei: dieses AS kommt in keiner Route vor
+  if (fs.existsSync(dataDir + "as_stats/manifest.json")) {
+    return res.json({ traversed: {}, neighbors: {} });
+  }
+  res.status(404).json({ error: "Keine AS-Statistiken vorhanden" });
+});
+
+// Kompakte Kodierung (nur vorhanden, wenn OUTPUT_COMPACT=1 gesetzt ist)
+app.get("/routes/compact", (req, res) => {
+  sendJson(req, res, "routes.compact.json");
 });
 
 // Statische Dateien bereitstellen (HTML, JS, CSS)
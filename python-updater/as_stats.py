@@ -0,0 +1,224 @@
+import hashlib
+import logging
+
+import numpy as np
+
+import metrics
+from route_shards import update_shards, write_shards
+
+# Vorberechnete Statistiken pro ASN für das Frontend, plus Manifest ASN -> {file, count, bytes, digest}
+AS_STATS_DIR = "../data/as_stats/"
+
+logger = logging.getLogger(__name__)
+
+
+# Konstanten des splitmix64-Finalizers für die Pfad-Schlüssel
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+# Schlüssel von AS_SETs und anderen Texten haben das oberste Bit gesetzt und treffen so keine ASN
+_TEXT_BIT = 1 << 63
+
+
+def _sorted_counts(counts):
+    """Zählungen absteigend, bei Gleichstand nach ASN – stabile Reihenfolge für den Digest"""
+    return dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+
+
+@metrics.instrumented("as_stats", records_in=lambda routes: len(routes))
+def build_as_stats(routes):
+    """
+    Berechnet in einem Durchlauf über den RouteStore pro ASN:
+      traversed – für Routen mit diesem Start-AS: durchquertes AS -> Anzahl
+                  (jedes Vorkommen im Pfad zählt, wie bisher im Frontend)
+      neighbors – gewichteter AS-Adjazenzgraph: benachbartes AS -> wie oft beide in
+                  einer Route direkt aufeinander folgen (Prepending zählt nicht)
+    Gibt ein Dict ASN (Text) -> {"traversed": {...}, "neighbors": {...}} zurück.
+    """
+    members, route_index = routes.path_members()
+    if not len(members):
+        return {}
+    codes, member_ids = np.unique(members, return_inverse=True)
+    member_ids = member_ids.reshape(-1)
+    texts = [routes.asn_text(code) for code in codes.tolist()]
+    size = len(codes)
+
+    # Start-AS jeder Route als Index in codes (erstes Element ihres Pfads)
+    first = np.ones(len(members), dtype=bool)
+    first[1:] = route_index[1:] != route_index[:-1]
+    start_ids = member_ids[first][np.cumsum(first) - 1]
+
+    stats = {}
+    keys, counts = np.unique(start_ids * size + member_ids, return_counts=True)
+    for key, count in zip(keys.tolist(), counts.tolist()):
+        start, asn = divmod(key, size)
+        stats.setdefault(texts[start], {"traversed": {}, "neighbors": {}})["traversed"][texts[asn]] = count
+
+    # Kanten zwischen direkt aufeinanderfolgenden, verschiedenen AS derselben Route (ungerichtet)
+    hop = (~first[1:]) & (member_ids[1:] != member_ids[:-1])
+    left, right = member_ids[:-1][hop], member_ids[1:][hop]
+    keys, weights = np.unique(np.minimum(left, right) * size + np.maximum(left, right), return_counts=True)
+    for key, weight in zip(keys.tolist(), weights.tolist()):
+        a, b = divmod(key, size)
+        stats.setdefault(texts[a], {"traversed": {}, "neighbors": {}})["neighbors"][texts[b]] = weight
+        stats.setdefault(texts[b], {"traversed": {}, "neighbors": {}})["neighbors"][texts[a]] = weight
+
+    for entry in stats.values():
+        entry["traversed"] = _sorted_counts(entry["traversed"])
+        entry["neighbors"] = _sorted_counts(entry["neighbors"])
+    metrics.count(as_stats_asns=len(stats), as_stats_edges=len(keys))
+    return stats
+
+
+def write_as_stats(stats, stats_dir=AS_STATS_DIR):
+    """
+    Schreibt pro ASN eine Datei AS<asn>.json mit traversed und neighbors sowie ein
+    Manifest (count = Anzahl durchquerter AS). Nur Dateien, deren Inhalt sich seit
+    dem letzten Zyklus geändert hat, werden neu geschrieben; ASNs ohne Routen werden
+    entfernt.
+    """
+    return write_shards(stats, stats_dir, "AS-Statistiken",
+                        count=lambda entry: len(entry["traversed"]))
+
+
+def _mix(values):
+    """splitmix64-Finalizer, vektorisiert über ein uint64-Array (Überlauf ist gewollt)"""
+    values = values ^ (values >> np.uint64(30))
+    values = values * _MIX_1
+    values = values ^ (values >> np.uint64(27))
+    values = values * _MIX_2
+    return values ^ (values >> np.uint64(31))
+
+
+def _text_key(text):
+    return int.from_bytes(hashlib.blake2b(repr(text).encode("utf-8"), digest_size=8).digest(), "big") | _TEXT_BIT
+
+
+def path_keys(routes):
+    """
+    64-Bit-Schlüssel des AS-Pfads jeder Route, berechnet aus dem Pfadinhalt (ASN und
+    Position). Er hängt nicht von den Pfad-IDs des Stores ab und ist damit zwischen
+    den RouteStores aufeinanderfolgender Zyklen vergleichbar.
+    """
+    offsets = routes.path_offsets
+    asns = routes.path_asns
+    codes = asns.astype(np.uint64)
+    texts = asns < 0
+    if texts.any():
+        codes[texts] = np.array([_text_key(routes.asn_text(code)) for code in asns[texts].tolist()],
+                                dtype=np.uint64)
+    lengths = np.diff(offsets)
+    positions = np.arange(len(asns), dtype=np.uint64) - np.repeat(offsets[:-1], lengths).astype(np.uint64)
+    # Summe über die Positionen als Differenz der kumulierten Summe (modulo 2**64)
+    mixed = _mix(codes ^ _mix(positions + np.uint64(1)))
+    totals = np.concatenate((np.zeros(1, dtype=np.uint64), np.cumsum(mixed, dtype=np.uint64)))
+    keys = (totals[offsets[1:]] - totals[offsets[:-1]]) ^ _mix(lengths.astype(np.uint64))
+    return keys[routes.path_id.astype(np.int64)]
+
+
+class AsStats:
+    """
+    Inkrementell gepflegte AS-Statistiken (Inhalt wie build_as_stats). Die Statistiken
+    hängen nur von der Menge der veröffentlichten AS-Pfade ab: pro Zyklus werden die
+    Pfad-Schlüssel mit denen des Vorzyklus verglichen, und nur Pfade, deren Anzahl
+    Routen sich geändert hat, fließen in die Zähler ein. Neu sortiert und geschrieben
+    werden nur die ASNs, die in einem dieser Pfade vorkommen.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Verwirft den Zustand; der nächste Zyklus baut alles neu auf und gleicht alle Dateien ab"""
+        # Sortierte Pfad-Schlüssel des letzten Zyklus und Anzahl Routen pro Schlüssel
+        self.keys = np.empty(0, dtype=np.uint64)
+        self.counts = np.empty(0, dtype=np.int64)
+        # Pfad-Schlüssel -> Pfad als Tupel von ASN-Texten
+        self.paths = {}
+        # Start-AS -> {durchquertes AS: Anzahl}, AS -> {benachbartes AS: Gewicht}
+        self.traversed = {}
+        self.neighbors = {}
+        self.complete = False
+
+    def _apply(self, as_path, delta, dirty):
+        """Rechnet einen Pfad delta-mal in die Zähler ein (negativ: heraus) und merkt die betroffenen ASNs vor"""
+        if not as_path:
+            return
+        start = as_path[0]
+        dirty.add(start)
+        traversed = self.traversed.setdefault(start, {})
+        for asn in as_path:
+            traversed[asn] = traversed.get(asn, 0) + delta
+            if not traversed[asn]:
+                del traversed[asn]
+        for left, right in zip(as_path, as_path[1:]):
+            if left == right:
+                continue
+            dirty.add(left)
+            dirty.add(right)
+            for a, b in ((left, right), (right, left)):
+                weights = self.neighbors.setdefault(a, {})
+                weights[b] = weights.get(b, 0) + delta
+                if not weights[b]:
+                    del weights[b]
+
+    def _entry(self, asn):
+        """Aktueller Inhalt der Statistik-Datei eines ASN oder None, wenn es in keinem Pfad mehr vorkommt"""
+        traversed = self.traversed.get(asn)
+        neighbors = self.neighbors.get(asn)
+        if not traversed:
+            self.traversed.pop(asn, None)
+        if not neighbors:
+            self.neighbors.pop(asn, None)
+        if not traversed and not neighbors:
+            return None
+        return {"traversed": _sorted_counts(traversed or {}), "neighbors": _sorted_counts(neighbors or {})}
+
+    @metrics.instrumented("as_stats", records_in=lambda self, routes: len(routes))
+    def update(self, routes):
+        """
+        Gleicht die Zähler mit den Routen des Zyklus ab. Gibt ein Dict ASN (Text) ->
+        Inhalt wie bei build_as_stats bzw. None (ASN entfällt) für alle ASNs zurück,
+        deren Statistik sich geändert haben kann.
+        """
+        keys, first, counts = np.unique(path_keys(routes), return_index=True, return_counts=True)
+        merged = np.union1d(self.keys, keys)
+        delta = np.zeros(len(merged), dtype=np.int64)
+        delta[np.searchsorted(merged, keys)] += counts
+        delta[np.searchsorted(merged, self.keys)] -= self.counts
+        changed = np.flatnonzero(delta)
+
+        offsets, asns, text = routes.path_offsets, routes.path_asns, routes.asn_text
+        dirty = set()
+        for key, count in zip(merged[changed].tolist(), delta[changed].tolist()):
+            as_path = self.paths.get(key)
+            if as_path is None:
+                path_id = int(routes.path_id[first[np.searchsorted(keys, key)]])
+                codes = asns[offsets[path_id]:offsets[path_id + 1]].tolist()
+                as_path = self.paths[key] = tuple(text(code) for code in codes)
+            self._apply(as_path, count, dirty)
+        for key in self.keys[np.isin(self.keys, keys, invert=True)].tolist():
+            del self.paths[key]
+
+        self.keys, self.counts = keys, counts.astype(np.int64)
+        changes = {asn: self._entry(asn) for asn in dirty}
+        metrics.count(as_stats_changed_paths=len(changed), as_stats_changed_asns=len(changes))
+        return changes
+
+    def publish(self, routes, stats_dir=AS_STATS_DIR):
+        """
+        Schreibt die Statistiken des Zyklus: beim ersten Aufruf alle ASNs (write_as_stats,
+        entfernt auch Dateien eines früheren Laufs), danach nur die geänderten. Schlägt
+        das Schreiben fehl, wird der Zustand verworfen und beim nächsten Mal neu aufgebaut.
+        """
+        try:
+            changes = self.update(routes)
+            if self.complete:
+                return update_shards(changes, stats_dir, "AS-Statistiken",
+                                     count=lambda entry: len(entry["traversed"]))
+            stats = {asn: entry for asn, entry in changes.items() if entry is not None}
+            result = write_as_stats(stats, stats_dir)
+            self.complete = True
+            return result
+        except BaseException:
+            self.reset()
+            raise
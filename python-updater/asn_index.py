@@ -0,0 +1,372 @@
+import csv
+import logging
+import mmap
+import os
+import socket
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+# GeoLite2-ASN-Blöcke beider Adressfamilien und das vorkompilierte Binärformat (erzeugt von update_geolite.py);
+# das Binärformat liegt immer im Verzeichnis der CSVs, aus denen es erzeugt wurde
+ASN_CSV_PATH = "../data/geolite_database/GeoLite2-ASN-Blocks-IPv4.csv"
+ASN_CSV_PATH_V6 = "../data/geolite_database/GeoLite2-ASN-Blocks-IPv6.csv"
+ASN_CSV_PATHS = (ASN_CSV_PATH, ASN_CSV_PATH_V6)
+ASN_ARTIFACT_FILE = "GeoLite2-ASN-Blocks.idx"
+ARTIFACT_MAGIC = b"ASNIDX2\0"
+# Magic, Byte-Order ('<' oder '>'), Anzahl Intervalle, Länge des Namens-Blobs
+ARTIFACT_HEADER = struct.Struct("8s1s3xII")
+# Schlüsselspalten (je 16 Byte) und uint32-Spalten des Binärformats
+ARTIFACT_KEY_COLUMNS = ("starts", "ends")
+ARTIFACT_COLUMNS = ("asns", "name_starts", "name_ends", "by_asn", "asn_keys")
+
+# Gemeinsamer 128-Bit-Adressraum: IPv4-Adressen liegen wie IPv4-mapped IPv6 in ::ffff:0:0/96
+V4_MAPPED = 0xFFFF << 32
+# Schlüssel als 16 Byte big-endian: bei fester Breite entspricht der Byte-Vergleich dem numerischen
+KEY_DTYPE = np.dtype("S16")
+NO_ASN = -1
+
+logger = logging.getLogger(__name__)
+
+
+def ipv4_to_int(ip):
+    """Wandelt eine IPv4-Adresse in eine Ganzzahl um (None bei ungültiger Adresse)"""
+    try:
+        return int.from_bytes(socket.inet_aton(ip), "big")
+    except (OSError, TypeError):
+        return None
+
+
+def address_key(address):
+    """
+    128-Bit-Schlüssel einer IPv4-/IPv6-Adresse im gemeinsamen Adressraum oder None.
+    Bei einem Prefix ("a/len") zählt die Netzadresse.
+    """
+    if not isinstance(address, str):
+        return None
+    address = address.partition("/")[0]
+    try:
+        if ":" in address:
+            return int.from_bytes(socket.inet_pton(socket.AF_INET6, address), "big")
+        return V4_MAPPED | int.from_bytes(socket.inet_pton(socket.AF_INET, address), "big")
+    except (OSError, ValueError):
+        return None
+
+
+def format_key(key):
+    """Adresse zu einem 128-Bit-Schlüssel (IPv4 in ::ffff:0:0/96 wieder als IPv4)"""
+    if key >> 32 == 0xFFFF:
+        return socket.inet_ntoa((key & 0xFFFFFFFF).to_bytes(4, "big"))
+    return socket.inet_ntop(socket.AF_INET6, key.to_bytes(16, "big"))
+
+
+def to_asn(asn):
+    """Wandelt eine ASN (String oder int) in int um (None z. B. bei AS_SETs wie "{1,2}")"""
+    try:
+        return int(asn)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_network(network):
+    """Liefert (Start, Ende) eines IPv4-/IPv6-CIDR-Blocks als 128-Bit-Schlüssel"""
+    ip, _, bits = network.partition("/")
+    start = address_key(ip)
+    if start is None:
+        return None
+    width = 128 if ":" in ip else 32
+    host_bits = width - int(bits or width)
+    start = (start >> host_bits) << host_bits
+    return start, start + (1 << host_bits) - 1
+
+
+def _keys(values):
+    """Spalte von 128-Bit-Schlüsseln (Ganzzahlen) als KEY_DTYPE-Array"""
+    return np.array([value.to_bytes(16, "big") for value in values], dtype=KEY_DTYPE)
+
+
+def _key_at(column, row):
+    """128-Bit-Schlüssel einer Zeile (über die Rohbytes: Einzelelemente verlieren abschließende Nullbytes)"""
+    return int.from_bytes(column[row:row + 1].tobytes(), "big")
+
+
+def disjoint_intervals(blocks):
+    """
+    Zerlegt CIDR-Blöcke (Start, Ende, Nutzlast) in disjunkte, sortierte Intervalle
+    mit der Nutzlast des jeweils längsten Prefix. Blöcke sind entweder
+    verschachtelt oder disjunkt; bei gleichem Block gewinnt der spätere.
+    Blöcke mit Nutzlast None reservieren ihren Bereich ohne eigenes Intervall.
+    """
+    intervals = []
+    stack = []
+    position = 0
+
+    def emit(end, block):
+        nonlocal position
+        if position <= end and block[2] is not None:
+            intervals.append((position, end, block[2]))
+        position = end + 1
+
+    for _, block in sorted(enumerate(blocks), key=lambda item: (item[1][0], -item[1][1], item[0])):
+        while stack and stack[-1][1] < block[0]:
+            emit(stack[-1][1], stack.pop())
+        if stack:
+            emit(block[0] - 1, stack[-1])
+        stack.append(block)
+        position = block[0]
+    while stack:
+        emit(stack[-1][1], stack.pop())
+    return intervals
+
+
+class MappedNames:
+    """AS-Namen als Offsets in einen UTF-8-Blob; dekodiert wird erst beim Zugriff"""
+
+    def __init__(self, blob, starts, ends):
+        self.blob = blob
+        self.starts = starts
+        self.ends = ends
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, row):
+        return bytes(self.blob[self.starts[row]:self.ends[row]]).decode("utf-8")
+
+
+class AsnIndex:
+    """
+    Longest-Prefix-Match über die GeoLite2-ASN-Blöcke von IPv4 und IPv6 in einem
+    gemeinsamen 128-Bit-Adressraum. Die Blöcke werden beim Aufbau in disjunkte,
+    sortierte Intervalle zerlegt; "welches AS besitzt IP X" und "liegt IP X in
+    einem Block von AS Y" sind damit eine Binärsuche, für ganze Stapel von IPs
+    oder Prefixen vektorisiert (lookup_many).
+    """
+
+    def __init__(self, starts, ends, asns, names, by_asn=None, asn_keys=None, mapping=None):
+        # Intervallgrenzen als KEY_DTYPE-Arrays, nach Start sortiert und disjunkt
+        self.starts = starts
+        self.ends = ends
+        self.asns = asns
+        self.names = names
+        self.mapping = mapping  # offenes mmap, falls aus dem Binärformat geladen
+        self._asns = np.frombuffer(asns, dtype=np.uint32) if len(asns) else np.zeros(0, dtype=np.uint32)
+
+        # Zweite Sortierung nach (ASN, Blockanfang) für Abfragen pro AS; die Zeilen sind bereits nach Start sortiert
+        if by_asn is None:
+            by_asn = array("I", sorted(range(len(asns)), key=lambda i: (asns[i], i)))
+            asn_keys = array("I", (asns[i] for i in by_asn))
+        self.by_asn = by_asn
+        self.asn_keys = asn_keys
+
+    @classmethod
+    def from_csv(cls, csv_paths):
+        """
+        Baut den Index aus den GeoLite2-ASN-Blocks-CSVs (IPv4 und IPv6, Header wird
+        übersprungen). Fehlende Dateien werden ausgelassen, solange eine vorhanden ist.
+        """
+        if isinstance(csv_paths, str):
+            csv_paths = (csv_paths,)
+        existing = [path for path in csv_paths if os.path.exists(path)] or list(csv_paths[:1])
+        # ::ffff:0:0/96 gehört den IPv4-Blöcken: IPv6-Blöcke wie ::/64 dürfen IPv4-Adressen nicht auflösen
+        blocks = [(V4_MAPPED, V4_MAPPED | 0xFFFFFFFF, None)]
+        for csv_path in existing:
+            with open(csv_path, newline='', encoding="utf-8") as csvfile:
+                reader = csv.reader(csvfile)
+                for row in reader:
+                    # Spalte 0 = Netz, 1 = ASN, 2 = AS-Name; Header und kaputte Zeilen ignorieren
+                    if len(row) < 3 or not row[1].strip().isdigit():
+                        continue
+                    block = parse_network(row[0].strip())
+                    if block is None:
+                        continue
+                    blocks.append((block[0], block[1], (int(row[1]), row[2].strip())))
+        for missing in set(csv_paths) - set(existing):
+            logger.warning("ASN-CSV %s fehlt und wird übersprungen.", missing)
+
+        intervals = disjoint_intervals(blocks)
+        return cls(
+            _keys(start for start, _, _ in intervals),
+            _keys(end for _, end, _ in intervals),
+            array("I", (asn for _, _, (asn, _) in intervals)),
+            [name for _, _, (_, name) in intervals],
+        )
+
+    @classmethod
+    def from_artifact(cls, artifact_path):
+        """Öffnet das vorkompilierte Binärformat per mmap, ohne die Daten zu kopieren"""
+        with open(artifact_path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, byteorder, count, blob_len = ARTIFACT_HEADER.unpack_from(mapping, 0)
+        native = "<" if sys.byteorder == "little" else ">"
+        if magic != ARTIFACT_MAGIC or byteorder.decode() != native:
+            mapping.close()
+            raise ValueError(f"Ungültiges ASN-Artefakt: {artifact_path}")
+
+        view = memoryview(mapping)
+        columns = {}
+        offset = ARTIFACT_HEADER.size
+        for name in ARTIFACT_KEY_COLUMNS:
+            columns[name] = np.frombuffer(view, dtype=KEY_DTYPE, count=count, offset=offset)
+            offset += KEY_DTYPE.itemsize * count
+        for name in ARTIFACT_COLUMNS:
+            columns[name] = view[offset:offset + 4 * count].cast("I")
+            offset += 4 * count
+        names = MappedNames(view[offset:offset + blob_len], columns["name_starts"], columns["name_ends"])
+        return cls(columns["starts"], columns["ends"], columns["asns"], names,
+                   columns["by_asn"], columns["asn_keys"], (mapping, view))
+
+    def write_artifact(self, artifact_path):
+        """Schreibt den Index als Binärformat (Schlüssel als 16 Byte, übrige Spalten als uint32, Namen dedupliziert)"""
+        blob = bytearray()
+        offsets = {}
+        name_starts = array("I")
+        name_ends = array("I")
+        for row in range(len(self.names)):
+            name = self.names[row]
+            if name not in offsets:
+                encoded = name.encode("utf-8")
+                offsets[name] = (len(blob), len(blob) + len(encoded))
+                blob += encoded
+            start, end = offsets[name]
+            name_starts.append(start)
+            name_ends.append(end)
+
+        columns = {
+            "asns": self.asns, "name_starts": name_starts, "name_ends": name_ends,
+            "by_asn": self.by_asn, "asn_keys": self.asn_keys,
+        }
+        native = "<" if sys.byteorder == "little" else ">"
+        tmp_path = artifact_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(ARTIFACT_HEADER.pack(ARTIFACT_MAGIC, native.encode(), len(self), len(blob)))
+            for name in ARTIFACT_KEY_COLUMNS:
+                f.write(np.ascontiguousarray(getattr(self, name), dtype=KEY_DTYPE).tobytes())
+            for name in ARTIFACT_COLUMNS:
+                f.write(array("I", columns[name]).tobytes())
+            f.write(blob)
+        os.replace(tmp_path, artifact_path)
+
+    def close(self):
+        """Gibt das mmap frei (nur beim Binärformat relevant)"""
+        if self.mapping is not None:
+            mapping, view = self.mapping
+            # Erst alle Sichten auf das mmap freigeben, sonst lässt es sich nicht schließen
+            self.starts = self.ends = self._asns = None
+            for column in (self.asns, self.by_asn, self.asn_keys,
+                           self.names.starts, self.names.ends, self.names.blob):
+                column.release()
+            view.release()
+            mapping.close()
+            self.mapping = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _rows(self, keys):
+        """Zeile des Intervalls pro Schlüssel (KEY_DTYPE-Array), -1 wenn keines die Adresse enthält"""
+        rows = np.searchsorted(self.starts, keys, side="right") - 1
+        found = rows >= 0
+        found[found] = keys[found] <= self.ends[rows[found]]
+        return np.where(found, rows, -1)
+
+    def _row_for_ip(self, ip):
+        """Index des Intervalls, das die IP enthält, oder None"""
+        key = address_key(ip)
+        if key is None:
+            return None
+        key = key.to_bytes(16, "big")
+        row = int(np.searchsorted(self.starts, key, side="right")) - 1
+        if row >= 0 and key <= self.ends[row:row + 1].tobytes():
+            return row
+        return None
+
+    def lookup(self, ip):
+        """Liefert die ASN (int), der die IP gehört, oder None"""
+        row = self._row_for_ip(ip)
+        return None if row is None else self.asns[row]
+
+    def lookup_many(self, addresses):
+        """
+        Longest-Prefix-Match für einen ganzen Stapel von IPs oder Prefixen (Netzadresse)
+        in einem Durchlauf. Liefert ein int64-Array der ASNs, NO_ASN wenn nicht gefunden
+        oder nicht parsebar.
+        """
+        keys = [address_key(address) for address in addresses]
+        result = np.full(len(keys), NO_ASN, dtype=np.int64)
+        valid = np.fromiter((key is not None for key in keys), dtype=bool, count=len(keys))
+        if not valid.any() or not len(self):
+            return result
+        rows = self._rows(_keys(key for key in keys if key is not None))
+        result[valid] = np.where(rows >= 0, self._asns[rows].astype(np.int64), NO_ASN)
+        return result
+
+    def _asn_range(self, asn):
+        """Bereich [lo, hi) in der ASN-Sortierung, der zu einem AS gehört"""
+        asn = to_asn(asn)
+        if asn is None:
+            return 0, 0
+        return bisect_left(self.asn_keys, asn), bisect_right(self.asn_keys, asn)
+
+    def has_asn(self, asn):
+        """Prüft, ob für das AS mindestens ein Block existiert"""
+        lo, hi = self._asn_range(asn)
+        return hi > lo
+
+    def has_asn_many(self, asns):
+        """Boolesche Maske: für welche ASNs (int, NO_ASN = ungültig) mindestens ein Block existiert"""
+        asns = np.asarray(asns, dtype=np.int64)
+        if not len(self.asn_keys):
+            return np.zeros(len(asns), dtype=bool)
+        asn_keys = np.frombuffer(self.asn_keys, dtype=np.uint32).astype(np.int64)
+        positions = np.minimum(np.searchsorted(asn_keys, asns), len(asn_keys) - 1)
+        return asn_keys[positions] == asns
+
+    def block_spans(self, asn):
+        """Liefert alle Blöcke eines AS als Liste von (Netzadresse, Anzahl Adressen, AS-Name)"""
+        lo, hi = self._asn_range(asn)
+        spans = []
+        for row in (self.by_asn[j] for j in range(lo, hi)):
+            start = _key_at(self.starts, row)
+            end = _key_at(self.ends, row)
+            spans.append((format_key(start), end - start + 1, self.names[row]))
+        return spans
+
+
+def asn_artifact_path(csv_paths=ASN_CSV_PATHS):
+    """Pfad des Binärformats zu den CSVs: ASN_ARTIFACT_FILE im Verzeichnis der ersten CSV"""
+    if isinstance(csv_paths, str):
+        csv_paths = (csv_paths,)
+    return os.path.join(os.path.dirname(csv_paths[0]), ASN_ARTIFACT_FILE)
+
+
+def compile_asn_artifact(csv_paths=ASN_CSV_PATHS, artifact_path=None):
+    """Kompiliert die ASN-CSVs einmalig ins Binärformat (aufgerufen von update_geolite.py)"""
+    artifact_path = artifact_path or asn_artifact_path(csv_paths)
+    index = AsnIndex.from_csv(csv_paths)
+    index.write_artifact(artifact_path)
+    logger.info("ASN-Index kompiliert: %s (%d Intervalle)", artifact_path, len(index))
+    return artifact_path
+
+
+def load_asn_index(csv_paths=ASN_CSV_PATHS, artifact_path=None):
+    """
+    Gemeinsamer Loader für updater.py und eval_attack.py. Nutzt das
+    vorkompilierte Binärformat neben den CSVs (bzw. artifact_path), solange
+    es nicht älter als eine der CSVs ist, und fällt sonst auf das Parsen der
+    CSVs zurück.
+    """
+    if isinstance(csv_paths, str):
+        csv_paths = (csv_paths,)
+    artifact_path = artifact_path or asn_artifact_path(csv_paths)
+    if os.path.exists(artifact_path) and all(
+            not os.path.exists(path) or os.path.getmtime(artifact_path) >= os.path.getmtime(path)
+            for path in csv_paths):
+        try:
+            return AsnIndex.from_artifact(artifact_path)
+        except ValueError as e:
+            logger.warning("%s – lade stattdessen die CSV.", e)
+    return AsnIndex.from_csv(csv_paths)
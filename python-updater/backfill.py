@@ -0,0 +1,259 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import metrics
+import pipeline
+import update_routeviews
+import updater
+from collectors import COLLECTORS, fetch_collector, read_local_dump, tag_points
+from json_writer import dumps_compact, write_bytes_atomic
+from update_routeviews import INTERVAL, floor_interval, interval_stamp
+
+# Ablage der Backfill-Läufe: ein Unterordner pro Zeitraum mit Snapshots, Fortschritt und Zusammenfassung
+BACKFILL_DIR = "../data/backfill/"
+PROGRESS_FILENAME = "progress.json"
+SUMMARY_FILENAME = "summary.json"
+
+logger = logging.getLogger(__name__)
+
+# Pipeline-Kontext des Worker-Prozesses (GeoLite-Reader, ASN-Index und Geo-Cache bleiben offen)
+_context = None
+
+
+def iter_intervals(start, end):
+    """Alle 15-Minuten-Intervalle im Bereich [start, end)"""
+    current = floor_interval(start)
+    while current < end:
+        yield current
+        current += INTERVAL
+
+
+def _local_dump(directories, stamp):
+    for directory in directories:
+        for ext in (".bz2", ".txt"):
+            path = os.path.join(directory, f"updates.{stamp}{ext}")
+            if os.path.exists(path):
+                return path
+    return None
+
+
+def dump_sources(interval, collectors, source_dir=None):
+    """
+    Quellen eines Intervalls pro Collector: ohne source_dir die Archiv-URL,
+    sonst die lokale Datei <source_dir>/<collector>/updates.<stamp>.bz2 bzw. .txt
+    (bei nur einem Collector auch direkt in source_dir). Fehlende Dateien werden ausgelassen.
+    """
+    stamp = interval_stamp(interval)
+    sources = {}
+    for collector in collectors:
+        if source_dir is None:
+            sources[collector] = update_routeviews.update_url_for(collector, interval)
+            continue
+        directories = [os.path.join(source_dir, collector)] + ([source_dir] if len(collectors) == 1 else [])
+        path = _local_dump(directories, stamp)
+        if path:
+            sources[collector] = path
+    return sources
+
+
+def _init_worker(max_distance_km):
+    global _context
+    metrics.setup_logging()
+    _context = pipeline.PipelineContext(rib_path=None, max_distance_km=max_distance_km, stage_cache_dir=None,
+                                        origin_history_path=None)
+
+
+def process_interval(stamp, sources, output_dir):
+    """
+    Worker-Prozess: wertet die Dumps eines Intervalls aus (parse → enrich → evaluate)
+    und schreibt routes.json und points.json nach <output_dir>/<stamp>/.
+    Jedes Intervall wird für sich betrachtet, ohne Routing-Tabelle und ohne
+    Prefix-Origin-Historie (Ergebnis unabhängig von der Reihenfolge der Worker).
+    """
+    started = time.perf_counter()
+    tmp_root = os.path.join(update_routeviews.LOCAL_DIR_TMP, f"backfill-{stamp}")
+    per_collector = {}
+    missing = {}
+    try:
+        for collector, source in sources.items():
+            try:
+                if source.startswith(("http://", "https://")):
+                    per_collector[collector] = fetch_collector(collector, source, os.path.join(tmp_root, collector))
+                else:
+                    per_collector[collector] = read_local_dump(source)
+            except Exception as e:
+                missing[collector] = str(e)
+    finally:
+        shutil.rmtree(tmp_root, ignore_errors=True)
+    if not per_collector:
+        raise RuntimeError(f"Kein Dump lesbar: {missing}")
+
+    ctx = _context
+    unique_as, _first_as_count, routes, asn_with_outgoing_routes = pipeline.stage_parse(ctx, per_collector)
+    points = pipeline.stage_enrich(ctx, unique_as, asn_with_outgoing_routes)
+    tag_points(points, routes)
+    routes, points = pipeline.stage_evaluate(ctx, routes, points)
+
+    snapshot_dir = os.path.join(output_dir, stamp)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    updater.save_routes(routes.to_routes(), os.path.join(snapshot_dir, "routes.json"))
+    updater.save_points(points, os.path.join(snapshot_dir, "points.json"))
+
+    stages = {record["stage"]: record["wall_s"] for record in metrics.collect() if record["parent"] is None}
+    return {
+        "status": "done",
+        "routes": len(routes),
+        "points": len(points),
+        "suspicious": int((routes.is_legit != 0).sum()),
+        "collectors": list(per_collector),
+        "missing_collectors": missing,
+        "stages": stages,
+        "duration_s": round(time.perf_counter() - started, 3),
+    }
+
+
+def load_progress(output_dir):
+    try:
+        with open(os.path.join(output_dir, PROGRESS_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_progress(output_dir, progress):
+    """Fortschritt nach jedem Intervall atomar sichern, damit ein Abbruch nicht von vorn beginnt"""
+    write_bytes_atomic(dumps_compact(progress), os.path.join(output_dir, PROGRESS_FILENAME), compression=())
+
+
+def _is_done(output_dir, stamp, entry):
+    return (entry is not None and entry.get("status") == "done"
+            and os.path.exists(os.path.join(output_dir, stamp, "routes.json")))
+
+
+def run_backfill(start, end, collectors=None, source_dir=None, output_dir=None, workers=None, max_distance_km=100):
+    """
+    Wertet alle 15-Minuten-Dumps im Bereich [start, end) parallel auf allen Kernen aus.
+    Bereits fertige Intervalle (laut progress.json) werden bei einem erneuten Lauf
+    übersprungen, fehlgeschlagene oder fehlende erneut versucht.
+    """
+    collectors = collectors or COLLECTORS
+    output_dir = output_dir or os.path.join(BACKFILL_DIR, f"{interval_stamp(start)}-{interval_stamp(end)}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    progress = load_progress(output_dir)
+    progress.update(start=start.isoformat(), end=end.isoformat(), collectors=collectors)
+    intervals = progress.setdefault("intervals", {})
+
+    pending = {}
+    for interval in iter_intervals(start, end):
+        stamp = interval_stamp(interval)
+        if _is_done(output_dir, stamp, intervals.get(stamp)):
+            continue
+        sources = dump_sources(interval, collectors, source_dir)
+        if sources:
+            pending[stamp] = sources
+        else:
+            intervals[stamp] = {"status": "missing"}
+    save_progress(output_dir, progress)
+    logger.info("Backfill %s: %d Intervalle offen, %d bereits erledigt",
+                output_dir, len(pending), sum(1 for s, e in intervals.items() if _is_done(output_dir, s, e)))
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                                 initargs=(max_distance_km,)) as pool:
+            futures = {pool.submit(process_interval, stamp, sources, output_dir): stamp
+                       for stamp, sources in pending.items()}
+            for finished, future in enumerate(as_completed(futures), 1):
+                stamp = futures[future]
+                try:
+                    intervals[stamp] = future.result()
+                except Exception as e:
+                    intervals[stamp] = {"status": "failed", "error": str(e)}
+                    logger.warning("Intervall %s fehlgeschlagen: %s", stamp, e)
+                save_progress(output_dir, progress)
+                logger.info("[%d/%d] Intervall %s: %s", finished, len(futures), stamp, intervals[stamp]["status"])
+
+    return write_summary(output_dir, progress)
+
+
+def write_summary(output_dir, progress):
+    """
+    Zusammenfassung über alle fertigen Snapshots: Status pro Intervall, Anzahl
+    eindeutiger AS-Pfade und AS sowie alle verdächtigen Routen (is_legit > 0)
+    mit erstem und letztem Auftreten.
+    """
+    intervals = progress.get("intervals", {})
+    done = sorted(stamp for stamp, entry in intervals.items() if _is_done(output_dir, stamp, entry))
+    paths = set()
+    autonomous_systems = set()
+    suspicious = {}
+
+    for stamp in done:
+        with open(os.path.join(output_dir, stamp, "routes.json"), "r", encoding="utf-8") as f:
+            routes = json.load(f)
+        for route in routes:
+            as_path = tuple(route["as_path"])
+            if as_path not in paths:
+                paths.add(as_path)
+                autonomous_systems.update(as_path)
+            if not route["is_legit"]:
+                continue
+            key = (route["prefix"], as_path)
+            entry = suspicious.get(key)
+            if entry is None:
+                suspicious[key] = {
+                    "prefix": route["prefix"],
+                    "as_path": route["as_path"],
+                    "start_system": route["start_system"],
+                    "target_system": route["target_system"],
+                    "first_seen": stamp,
+                    "last_seen": stamp,
+                    "intervals": 1,
+                    "max_is_legit": route["is_legit"],
+                }
+            else:
+                entry["last_seen"] = stamp
+                entry["intervals"] += 1
+                entry["max_is_legit"] = max(entry["max_is_legit"], route["is_legit"])
+
+    summary = {
+        "start": progress.get("start"),
+        "end": progress.get("end"),
+        "collectors": progress.get("collectors"),
+        "completed": len(done),
+        "failed": sorted(s for s, e in intervals.items() if e.get("status") == "failed"),
+        "missing": sorted(s for s, e in intervals.items() if e.get("status") == "missing"),
+        "unique_paths": len(paths),
+        "unique_as": len(autonomous_systems),
+        "intervals": {stamp: intervals[stamp] for stamp in sorted(intervals)},
+        "suspicious_routes": sorted(suspicious.values(), key=lambda e: (e["first_seen"], e["prefix"] or "")),
+    }
+    write_bytes_atomic(dumps_compact(summary), os.path.join(output_dir, SUMMARY_FILENAME), compression=())
+    logger.info("Zusammenfassung: %d Intervalle fertig, %d fehlgeschlagen, %d ohne Dump, %d verdächtige Routen",
+                summary["completed"], len(summary["failed"]), len(summary["missing"]), len(suspicious))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wertet historische Update-Dumps eines Zeitraums parallel aus")
+    parser.add_argument("--start", required=True, type=datetime.fromisoformat, help="Beginn (UTC), z. B. 2025-10-14T12:00")
+    parser.add_argument("--end", required=True, type=datetime.fromisoformat, help="Ende (UTC, exklusiv)")
+    parser.add_argument("--collectors", nargs="+", help="Collectoren (Standard: ROUTEVIEWS_COLLECTORS)")
+    parser.add_argument("--source-dir", help="Lokale Dumps statt Download aus dem Archiv")
+    parser.add_argument("--output", help="Zielverzeichnis (Standard: ../data/backfill/<start>-<ende>/)")
+    parser.add_argument("--workers", type=int, help="Anzahl Prozesse (Standard: alle Kerne)")
+    parser.add_argument("--max-distance", type=float, default=100, help="Maximale Distanz für den Geo-Filter in km")
+    args = parser.parse_args()
+
+    metrics.setup_logging()
+    run_backfill(args.start, args.end, args.collectors, args.source_dir, args.output, args.workers, args.max_distance)
+
+
+if __name__ == "__main__":
+    main()
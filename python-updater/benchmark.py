@@ -0,0 +1,195 @@
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import eval_attack
+import synth_workload
+import updater
+from asn_index import load_asn_index
+from geo_cache import GeoCache
+
+# Ablage der Benchmark-Ergebnisse (eine JSON-Datei pro Lauf)
+RESULTS_DIR = "../data/bench/results/"
+
+
+class StubGeoReader:
+    """Ersatz für geoip2.database.Reader: liefert feste Geodaten ohne .mmdb-Datei"""
+
+    def metadata(self):
+        return SimpleNamespace(build_epoch=0)
+
+    def city(self, ip):
+        return SimpleNamespace(
+            city=SimpleNamespace(name="Synth"),
+            subdivisions=SimpleNamespace(most_specific=SimpleNamespace(name="Synth")),
+            location=SimpleNamespace(latitude=50.1, longitude=8.7),
+        )
+
+
+# tracemalloc liefert den Spitzenverbrauch pro Stage, verlangsamt aber die Ausführung deutlich
+TRACE_MEMORY = False
+
+
+def measure(name, func, *args, **kwargs):
+    """Führt func einmal aus und misst Wall-Zeit, CPU-Zeit, max. RSS und optional
+       den Spitzen-Speicher der Stage (tracemalloc, siehe TRACE_MEMORY)"""
+    gc.collect()
+    if TRACE_MEMORY:
+        tracemalloc.start()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    # Ausgaben der Stages würden die Messung verfälschen
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        result = func(*args, **kwargs)
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    metrics = {"stage": name, "wall_s": round(wall, 6), "cpu_s": round(cpu, 6), "max_rss_bytes": max_rss_bytes()}
+    line = f"  {name:<32} {wall:9.3f} s wall {cpu:9.3f} s cpu"
+    if TRACE_MEMORY:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        metrics["peak_mem_bytes"] = peak
+        line += f" {peak / 2**20:9.1f} MiB peak"
+    print(line)
+    return result, metrics
+
+
+def max_rss_bytes():
+    """Maximaler Resident Set Size des Prozesses bisher (None ohne resource-Modul, z. B. unter Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux liefert KiB, macOS Bytes
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def run_size(lines, fixture_dir, regenerate=False):
+    """Erzeugt (falls nötig) die Fixtures für eine Größe und misst alle Stages"""
+    paths = {
+        "updates": os.path.join(fixture_dir, f"updates-{lines}.txt"),
+        "asn_csv": os.path.join(fixture_dir, f"asn-blocks-{lines}.csv"),
+        "points": os.path.join(fixture_dir, f"points-{lines}.json"),
+    }
+    if regenerate or not all(os.path.exists(p) for p in paths.values()):
+        print(f"Erzeuge Fixtures für {lines} Zeilen...")
+        paths = synth_workload.generate_fixtures(lines, fixture_dir)
+
+    print(f"Benchmark mit {lines} Zeilen:")
+    stages = []
+    with open(paths["points"], encoding="utf-8") as f:
+        points = json.load(f)
+
+    _, m = measure("extract_unique_as", updater.extract_unique_as, paths["updates"])
+    stages.append(m)
+
+    def create_routes(path, output_file):
+        _, _, routes, outgoing = updater.ingest_updates(updater.iter_update_records(path))
+        updater.save_routes(routes.to_routes(), output_file)
+        return routes, outgoing
+
+    with tempfile.TemporaryDirectory() as tmp:
+        (routes, outgoing), m = measure("create_routes", create_routes, paths["updates"], os.path.join(tmp, "routes.json"))
+        stages.append(m)
+    m["records_out"] = len(routes)
+
+    asn_index, m = measure("load_asn_index", load_asn_index, paths["asn_csv"])
+    stages.append(m)
+
+    unique_as = routes.unique_as()
+    with GeoCache("bench", ":memory:") as cache:
+        result, m = measure("create_points", updater.build_points, unique_as, outgoing, StubGeoReader(), cache, asn_index)
+    m["records_in"], m["records_out"] = len(unique_as), len(result)
+    stages.append(m)
+
+    (mask, _summary), m = measure("filter_routes_by_geo_distance", eval_attack.geo_distance_mask, routes, points, 3000)
+    m["records_in"], m["records_out"] = len(routes), int(mask.sum())
+    stages.append(m)
+
+    pairs = eval_attack.unique_ip_and_start_as_in_routes(routes)
+    treffer, m = measure("check_ip_in_asn", eval_attack.check_ip_in_asn, pairs, asn_index)
+    m["records_in"], m["records_out"] = len(pairs), len(treffer)
+    stages.append(m)
+
+    _, m = measure("update_is_legit", eval_attack.update_is_legit, routes, treffer, 5)
+    m["records_in"] = len(routes)
+    stages.append(m)
+
+    return {"lines": lines, "stages": stages}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new_path):
+    """Vergleicht zwei Ergebnisdateien stage- und größenweise (Faktor neu/alt)"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    old_stages = {(run["lines"], s["stage"]): s for run in old["runs"] for s in run["stages"]}
+    print(f"{'Zeilen':>10} {'Stage':<32} {'alt [s]':>10} {'neu [s]':>10} {'Faktor':>8} {'Speicher':>9}")
+    for run in new["runs"]:
+        for stage in run["stages"]:
+            before = old_stages.get((run["lines"], stage["stage"]))
+            if before is None:
+                continue
+            factor = stage["wall_s"] / before["wall_s"] if before["wall_s"] else float("inf")
+            if stage.get("peak_mem_bytes") and before.get("peak_mem_bytes"):
+                mem = f"{stage['peak_mem_bytes'] / before['peak_mem_bytes']:>8.2f}x"
+            else:
+                mem = f"{'-':>9}"
+            print(f"{run['lines']:>10} {stage['stage']:<32} {before['wall_s']:>10.3f} {stage['wall_s']:>10.3f} {factor:>7.2f}x {mem}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark der Pipeline-Stages auf synthetischen Daten")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="Dump-Größen in Zeilen")
+    parser.add_argument("--fixtures", default=synth_workload.FIXTURE_DIR, help="Verzeichnis der Fixtures")
+    parser.add_argument("--output", default=RESULTS_DIR, help="Verzeichnis für Ergebnis-JSON")
+    parser.add_argument("--regenerate", action="store_true", help="Fixtures neu erzeugen")
+    parser.add_argument("--trace-memory", action="store_true", help="Spitzen-Speicher pro Stage mit tracemalloc messen (langsamer)")
+    parser.add_argument("--compare", nargs=2, metavar=("ALT", "NEU"), help="Zwei Ergebnisdateien vergleichen")
+    args = parser.parse_args()
+
+    global TRACE_MEMORY
+    TRACE_MEMORY = args.trace_memory
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    started = datetime.now(timezone.utc)
+    runs = [run_size(lines, args.fixtures, args.regenerate) for lines in args.sizes]
+    results = {
+        "timestamp": started.isoformat(),
+        "git_revision": git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "trace_memory": TRACE_MEMORY,
+        "runs": runs,
+    }
+
+    os.makedirs(args.output, exist_ok=True)
+    output_file = os.path.join(args.output, f"bench-{started.strftime('%Y%m%dT%H%M%SZ')}.json")
+    with open(output_file, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Ergebnisse gespeichert: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import logging
+import os
+import shutil
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+import mrt_reader
+import update_routeviews
+import updater
+from route_store import RouteStoreBuilder
+from stage_cache import file_digest
+
+# Kommagetrennte Liste der RouteViews-Collectoren, z. B. "route-views2,route-views.linx,route-views.amsix"
+COLLECTORS = [c.strip() for c in os.getenv("ROUTEVIEWS_COLLECTORS", update_routeviews.DEFAULT_COLLECTOR).split(",") if c.strip()]
+# Anzahl Worker-Prozesse (0 = ein Prozess pro Collector)
+COLLECTOR_WORKERS = int(os.getenv("COLLECTOR_WORKERS", "0"))
+
+# Nur diese Felder der bgpdump-Records werden von updater.py und rib.py gelesen
+RECORD_FIELDS = 12
+
+logger = logging.getLogger(__name__)
+
+# Ergebnis pro Collector: SHA-256 des Dumps (für den Stage-Cache) und die geparsten Records
+CollectorDump = namedtuple("CollectorDump", ["digest", "records"])
+
+
+def _relevant_records(records):
+    """Filtert auf A-/W-Records und kürzt sie, damit weniger Daten zwischen den Prozessen übertragen werden"""
+    return [parts[:RECORD_FIELDS] for parts in records if len(parts) > 5 and parts[2] in ("A", "W")]
+
+
+def read_local_dump(path):
+    """Liest einen lokal vorliegenden Dump (.bz2 im MRT-Format oder bgpdump -m Text)"""
+    return CollectorDump(file_digest(path), _relevant_records(updater.iter_update_records(path)))
+
+
+def fetch_collector(collector, update_url, tmp_dir=None):
+    """
+    Worker-Prozess: lädt, entpackt und parst den Dump eines Collectors in einem
+    eigenen temporären Verzeichnis. Gibt ein CollectorDump zurück.
+    """
+    tmp_dir = tmp_dir or os.path.join(update_routeviews.LOCAL_DIR_TMP, collector)
+    try:
+        if update_routeviews.PARSER_BACKEND == "mrt":
+            update_file = update_routeviews.download_update_dump(update_url, tmp_dir, decompress=False)
+            digest = file_digest(update_file)
+            records = _relevant_records(mrt_reader.read_bz2_updates(update_file))
+        else:
+            update_file = update_routeviews.download_update_dump(update_url, tmp_dir)
+            digest = file_digest(update_file)
+            parsed_file = update_routeviews.parse_update_with_bgpdump(update_file, tmp_dir, "updates.txt")
+            records = _relevant_records(updater.iter_update_records(parsed_file))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return CollectorDump(digest, records)
+
+
+def fetch_collectors(collectors=None, interval=None, workers=COLLECTOR_WORKERS):
+    """
+    Holt den Dump desselben 15-Minuten-Intervalls von allen Collectoren parallel
+    (ein Prozess pro Collector, die Laufzeit entspricht etwa der des langsamsten).
+    Liefert ein Dict Collector -> CollectorDump in der konfigurierten Reihenfolge;
+    Collectoren, deren Dump fehlt oder fehlerhaft ist, werden ausgelassen.
+    """
+    collectors = collectors or COLLECTORS
+    interval = interval or update_routeviews.latest_interval()
+    urls = {collector: update_routeviews.update_url_for(collector, interval) for collector in collectors}
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers or len(collectors)) as pool:
+        futures = {collector: pool.submit(fetch_collector, collector, url) for collector, url in urls.items()}
+        for collector, future in futures.items():
+            try:
+                dump = future.result()
+            except Exception as e:
+                logger.warning("Collector %s übersprungen (%s): %s", collector, urls[collector], e)
+                continue
+            results[collector] = dump
+            metrics.count(**{f"records_{collector}": len(dump.records)})
+            logger.info("Collector %s: %d Update-Records", collector, len(dump.records))
+    return results
+
+
+def merge_collector_updates(per_collector, track_announcements=False):
+    """
+    Liest die Records aller Collectoren in einen gemeinsamen RouteStore:
+    Routen werden über alle Collectoren nach AS-Pfad dedupliziert und im Feld
+    'collectors' mit ihren Quellen versehen. Rückgabe wie updater.ingest_updates.
+    """
+    builder = RouteStoreBuilder(track_announcements)
+    for collector, records in per_collector.items():
+        metrics.count(records_read=builder.ingest(records, collector))
+    return updater.summarize_routes(builder.build())
+
+
+def tag_points(points, routes):
+    """Ergänzt jeden Punkt um die Collectoren, über die Routen mit diesem AS gesehen wurden"""
+    as_collectors = routes.as_collectors()
+    for point in points:
+        point["collectors"] = as_collectors.get(str(point["asn"]), [])
+    return points
@@ -1,13 +1,25 @@
 import json
-import csv
-import ipaddress
+import logging
 import math
+from collections import namedtuple
+import numpy as np
+import metrics
+from as_stats import build_as_stats, write_as_stats
+from asn_index import NO_ASN, load_asn_index, to_asn
+from origin_history import ORIGIN_RULE_WEIGHTS
+from route_shards import write_route_shards
+from route_store import RouteStore
+from json_writer import OUTPUT_COMPACT, compact_path, write_json_stream, write_routes_compact
 
 json_points = "../data/points.json"
 json_routes = "../data/routes.json"
 
 geo_db_path_geo = "../data/geolite_database/GeoLite2-City.mmdb"
 geo_csv_path_ip = "../data/geolite_database/GeoLite2-ASN-Blocks-IPv4.csv"
+geo_csv_path_ip6 = "../data/geolite_database/GeoLite2-ASN-Blocks-IPv6.csv"
+geo_csv_paths = (geo_csv_path_ip, geo_csv_path_ip6)
+
+logger = logging.getLogger(__name__)
 
 def read_json(file_path):
     """Findet alle uniquen AS in einem Update-Dump und zählt, wie oft ein AS an Platz [0] steht"""
@@ -17,26 +29,17 @@ def read_json(file_path):
 
 def save_json(json_data, file_path):
     try:
-        with open(file_path, 'w', encoding='utf-8') as json_file:
-            json.dump(json_data, json_file, ensure_ascii=False, indent=4)
-        print(f"Die JSON-Daten wurden erfolgreich in {file_path} gespeichert.")
+        # Gestreamt über eine temporäre Datei mit atomarem Umbenennen (inkl. .gz/.br-Sidecars)
+        write_json_stream(json_data, file_path)
+        logger.info("Die JSON-Daten wurden erfolgreich in %s gespeichert.", file_path)
     except Exception as e:
-        print(f"Fehler beim Speichern der Datei: {e}")
-
-def unique_ip_and_start_as_in_routes(daten):
-    eintraege_set = set()
-    einzigartige_objekte = []
-
-    for eintrag in daten:
-        kombi = (eintrag['ip'], eintrag['start_system'])
-        if kombi not in eintraege_set:
-            eintraege_set.add(kombi)
-            einzigartige_objekte.append({
-                'ip': eintrag['ip'],
-                'start_system': eintrag['start_system']
-            })
+        logger.error("Fehler beim Speichern der Datei: %s", e)
 
-    return einzigartige_objekte
+def unique_ip_and_start_as_in_routes(routes):
+    """Eindeutige Kombinationen aus Peer-IP und Start-System im RouteStore"""
+    pairs, _ = routes.unique_peer_pairs()
+    return [{'ip': routes.peers[peer_id], 'start_system': routes.asn_text(start_as)}
+            for peer_id, start_as in pairs.tolist()]
 
 def haversine_distance(coord1, coord2):
     """Berechnet die Entfernung zwischen zwei Koordinatenpaaren in Kilometern."""
@@ -50,7 +53,7 @@ def haversine_distance(coord1, coord2):
         lat2, lon2 = float(coord2[0]), float(coord2[1])
     except (TypeError, ValueError) as e:
         # Logmeldung für Debugging und None zurückgeben, damit Aufrufer entscheiden kann
-        print(f"Ungültige Koordinaten für Distanzberechnung: {e} — coord1={coord1}, coord2={coord2}")
+        logger.debug("Ungültige Koordinaten für Distanzberechnung: %s — coord1=%s, coord2=%s", e, coord1, coord2)
         return 1000000
     R = 6371  # Erdradius in km
     lat1, lon1 = coord1
@@ -64,41 +67,91 @@ def haversine_distance(coord1, coord2):
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
     return R * c
 
-def filter_routes_by_geo_distance(routes, points, max_distance_km=3000):
-    """
-    Entfernt Routen aus 'routes', bei denen die geografische Entfernung zwischen
-    start_system und target_system (aus 'points') größer als max_distance_km ist.
-
-    Gibt eine gefilterte Routenliste zurück.
-    """
-    # Punkte in ein Dict umwandeln, damit wir schnell über ASN zugreifen können
-    as_coords = {str(p["asn"]): p["coordinates"] for p in points if "coordinates" in p}
+def haversine_distances(coords1, coords2):
+    """Vektorisierte Haversine-Distanz in km für zwei (n, 2)-Arrays aus (lat, lon) in Grad"""
+    R = 6371  # Erdradius in km
+    lat1, lon1 = np.radians(coords1[:, 0]), np.radians(coords1[:, 1])
+    lat2, lon2 = np.radians(coords2[:, 0]), np.radians(coords2[:, 1])
 
-    neue_routes = []
-    entfernte_routen = 0
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    # Rundungsfehler bei (fast) antipodalen Punkten: a darf 1 nicht überschreiten, sonst sqrt(1 - a) = nan
+    a = np.clip(a, 0.0, 1.0)
+    return 2 * R * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
 
-    for route in routes:
-        start_as = str(route.get("start_system"))
-        target_as = str(route.get("target_system"))
+def _as_coordinate(coordinates):
+    """Liefert (lat, lon) als Floats oder (nan, nan) bei fehlenden/ungültigen Koordinaten"""
+    try:
+        lat, lon = float(coordinates[0]), float(coordinates[1])
+        if len(coordinates) == 2:
+            return lat, lon
+    except (TypeError, ValueError, IndexError):
+        pass
+    return math.nan, math.nan
+
+@metrics.instrumented("geo_distance_mask", records_in=lambda routes, *a, **k: len(routes),
+                      records_out=lambda result: result[1]["kept"])
+def geo_distance_mask(routes, points, max_distance_km=3000):
+    """
+    Berechnet für alle Routen (RouteStore) in einem Schritt, ob die Entfernung
+    zwischen start_system und target_system höchstens max_distance_km beträgt.
+    Gleiche (Start, Ziel)-Paare werden nur einmal berechnet.
 
-        if start_as in as_coords and target_as in as_coords:
-            coord1 = as_coords[start_as]
-            coord2 = as_coords[target_as]
+    Gibt eine boolesche Maske (True = behalten) und eine Zusammenfassung zurück.
+    """
+    # Koordinaten nach ASN-Code sortiert, damit die Zuordnung per Binärsuche erfolgt
+    as_coords = {}
+    for p in points:
+        code = routes.asn_code(p["asn"]) if "coordinates" in p else None
+        if code is not None:
+            as_coords[code] = _as_coordinate(p["coordinates"])
+    coord_codes = np.array(sorted(as_coords), dtype=np.int64)
+    coords = np.array([as_coords[code] for code in coord_codes.tolist()], dtype=float).reshape(-1, 2)
+
+    pairs = np.column_stack((routes.start_as, routes.target_as()))
+    if len(pairs):
+        pairs, route_pairs = np.unique(pairs, axis=0, return_inverse=True)
+        route_pairs = route_pairs.reshape(-1)
+    else:
+        route_pairs = np.empty(0, dtype=np.intp)
+
+    def lookup(codes):
+        result = np.full((len(codes), 2), math.nan)
+        if len(coord_codes):
+            pos = np.minimum(np.searchsorted(coord_codes, codes), len(coord_codes) - 1)
+            found = coord_codes[pos] == codes
+            result[found] = coords[pos[found]]
+        return result
+
+    start_arr = lookup(pairs[:, 0])
+    target_arr = lookup(pairs[:, 1])
+    pair_has_coords = ~(np.isnan(start_arr).any(axis=1) | np.isnan(target_arr).any(axis=1))
+    pair_keep = pair_has_coords & (haversine_distances(start_arr, target_arr) <= max_distance_km)
+
+    keep_mask = pair_keep[route_pairs]
+    missing_mask = ~pair_has_coords[route_pairs]
+    summary = {
+        "total": len(routes),
+        "kept": int(keep_mask.sum()),
+        "removed_distance": int((~keep_mask & ~missing_mask).sum()),
+        "removed_missing_coordinates": int(missing_mask.sum()),
+        "unique_pairs": len(pairs),
+    }
+    return keep_mask, summary
 
-            distance = haversine_distance(coord1, coord2)
+def filter_routes_by_geo_distance(routes, points, max_distance_km=3000):
+    """
+    Entfernt Routen aus 'routes', bei denen die geografische Entfernung zwischen
+    start_system und target_system (aus 'points') größer als max_distance_km ist
+    oder für eines der beiden AS keine Koordinaten vorliegen.
 
-            if distance <= max_distance_km:
-                neue_routes.append(route)
-            else:
-                entfernte_routen += 1
-                print(f"Entferne Route: {start_as} → {target_as} ({distance:.1f} km)")
-        else:
-            # Wenn einer der AS keine Koordinaten hat, Route löschen oder loggen
-            print(f"Keine Koordinaten für {start_as} oder {target_as}, Route wird entfernt.")
-            entfernte_routen += 1
-            #neue_routes.append(route)
+    Gibt einen gefilterten RouteStore zurück.
+    """
+    keep_mask, summary = geo_distance_mask(routes, points, max_distance_km)
+    neue_routes = routes.select(keep_mask)
 
-    print(f"\n➡️ {entfernte_routen} Routen entfernt (max. Distanz {max_distance_km} km).")
+    entfernte_routen = summary["removed_distance"] + summary["removed_missing_coordinates"]
+    logger.info("%d Routen entfernt (max. Distanz %s km, davon %d ohne Koordinaten).",
+                entfernte_routen, max_distance_km, summary["removed_missing_coordinates"])
     return neue_routes
 
 def update_routes_count(points, routes):
@@ -107,125 +160,132 @@ def update_routes_count(points, routes):
     Anzahl der aktuell verbleibenden Routen, die von diesem AS starten.
     """
     # Zähle, wie oft jedes start_system in routes vorkommt
-    route_counts = {}
-    for route in routes:
-        start_as = str(route.get("start_system"))
-        route_counts[start_as] = route_counts.get(start_as, 0) + 1
+    route_counts = routes.start_counts()
 
     # Update in den points-Daten
+    changed = 0
     for point in points:
         asn = str(point.get("asn"))
         new_count = route_counts.get(asn, 0)
         old_count = point.get("routes_count", 0)
         if old_count != new_count:
-            print(f"🔄 Aktualisiere routes_count für AS{asn}: {old_count} → {new_count}")
+            logger.debug("Aktualisiere routes_count für AS%s: %s → %s", asn, old_count, new_count)
+            changed += 1
         point["routes_count"] = new_count
+    logger.info("routes_count für %d AS aktualisiert.", changed)
 
     return points
 
-def load_csv_data_asn(csv_path):
+@metrics.instrumented("check_ip_in_asn", records_in=lambda json_data, *a, **k: len(json_data))
+def check_ip_in_asn(json_data, asn_index):
     """
-    Lädt die CSV-Datei und baut ein Dictionary auf, in dem der Schlüssel
-    die ASN (als String) ist und der Wert eine Liste von IP-Ranges (hier wird
-    z. B. die erste IP als Anhaltspunkt genutzt).
+    Überprüft, ob eine IP-Adresse (IPv4 oder IPv6) aus der JSON in einem Block des
+    Start-Systems (= ASN) liegt. Alle IPs werden in einem Durchlauf im ASN-Index
+    nachgeschlagen (lookup_many).
     """
-    csv_data = {}
-    with open(csv_path, newline='', encoding="utf-8") as csvfile:
-        reader = csv.reader(csvfile)
-        for row in reader:
-            # Annahme: Spalte 0 = ip, 1 = as_number, 2 = as_name
-            asn = row[1].strip()
-            entry = {
-                "ip": row[0].strip(),
-                "name": row[2].strip()
-            }
-            csv_data.setdefault(asn, []).append(entry)
-    return csv_data
+    treffer = []
+    owners = asn_index.lookup_many([obj["ip"] for obj in json_data])
+    asns = np.fromiter((NO_ASN if (asn := to_asn(obj["start_system"])) is None else asn for obj in json_data),
+                       dtype=np.int64, count=len(json_data))
+    # Nur ASNs prüfen, die im Index vorhanden sind
+    mismatch = asn_index.has_asn_many(asns) & (owners != asns)
+
+    for row in np.flatnonzero(mismatch).tolist():
+        obj = json_data[row]
+        # Wenn kein Treffer gefunden wurde, füge die IP zur Liste hinzu
+        logger.debug("Kein Treffer gefunden für IP %s (ASN %s)", obj["ip"], obj["start_system"])
+        treffer.append({
+            "ip": obj["ip"],
+            "start_system": obj["start_system"],
+            "not_found": True  # Markiere als Nicht-Treffer
+        })
+
+    logger.info("%d von %d Peer-IPs liegen in keinem Block ihres Start-AS.", len(treffer), len(json_data))
+    return treffer
+
+# Eine Bewertungsregel: Name, Gewicht und Prädikat, das für einen RouteStore eine
+# boolesche Maske (True = Regel trifft zu) über alle Routen liefert
+ScoringRule = namedtuple("ScoringRule", ["name", "weight", "matches"])
 
-def check_ip_in_asn(json_data, csv_data):
+def suspicious_peer_rule(treffer, weight=5):
     """
-    Überprüft, ob eine IP-Adresse aus der JSON zu einer der IPs in der CSV-Daten passt
-    (basierend auf dem Start-System = ASN).
+    Regel: Die Peer-IP der Route liegt in keinem Block ihres Start-Systems.
+    Die Nicht-Treffer aus check_ip_in_asn werden einmalig in ein Set mit
+    Schlüssel (ip, start_system) übernommen; geprüft wird nur pro eindeutigem
+    Paar, das Ergebnis wird per Index auf alle Routen übertragen.
     """
-    treffer = []
+    keys = {(eintrag["ip"], eintrag["start_system"]) for eintrag in treffer}
 
-    for obj in json_data:
-        ip = obj["ip"]
-        asn = obj["start_system"]
-
-        print(f"Überprüfe IP {ip} für ASN {asn}...")
-
-        # Wenn der ASN in den CSV-Daten vorhanden ist
-        if asn in csv_data:
-            #print(f"ASN {asn} gefunden, durchsuche die CSV-Daten...")
-            gefunden = False  # Flag für Treffer
-            for eintrag in csv_data[asn]:
-                #print(f"Vergleiche IP {ip} mit CSV-IP {eintrag['ip']} (aus AS {eintrag['name']})")
-                try:
-                    # Überprüfen, ob die IP in der CIDR-Range enthalten ist
-                    network = ipaddress.ip_network(eintrag["ip"], strict=False)
-                    if ipaddress.ip_address(ip) in network:
-                        gefunden = True
-                        break  # Wenn ein Treffer gefunden wurde, reicht das
-                except ValueError as e:
-                    print(f"Ungültige IP-Adresse in der CSV oder JSON: {e}")
-
-            # Wenn kein Treffer gefunden wurde, füge die IP zur Liste hinzu
-            if not gefunden:
-                print(f"Kein Treffer gefunden für IP {ip} (ASN {asn})")
-                treffer.append({
-                    "ip": ip,
-                    "start_system": asn,
-                    "not_found": True  # Markiere als Nicht-Treffer
-                })
+    def matches(routes):
+        pairs, route_pairs = routes.unique_peer_pairs()
+        flagged = np.array([(routes.peers[peer_id], routes.asn_text(start_as)) in keys
+                            for peer_id, start_as in pairs.tolist()], dtype=bool)
+        return flagged[route_pairs]
 
-    return treffer
+    return ScoringRule("peer_ip_not_in_start_as", weight, matches)
 
-def update_is_legit(json_data, csv_data, ammount):
+def origin_rules(findings, weights=None):
     """
-    Durchläuft die JSON-Daten und erhöht den 'is_legit' Zähler um 5,
-    wenn für das start_system keine passende IP in den CSV-Daten gefunden wurde.
+    Regeln aus den Befunden der Prefix-Origin-Historie (OriginHistory.observe):
+    eine Regel pro Befundart, die alle Routen mit einem betroffenen AS-Pfad
+    trifft. Gewichte aus ORIGIN_RULE_WEIGHTS, sofern nicht übergeben.
     """
-    for obj in json_data:
-        start_system = obj["start_system"]
-        ip = obj["ip"]
-
-        #print(f"Überprüfe IP {ip} für start_system {start_system}...")
+    weights = ORIGIN_RULE_WEIGHTS if weights is None else weights
+    rules = []
+    for name, path_ids in findings.items():
+        flagged = np.fromiter(path_ids, dtype=np.int64, count=len(path_ids))
+        rules.append(ScoringRule(f"origin_{name}", weights.get(name, 0),
+                                 lambda routes, flagged=flagged: np.isin(routes.path_id, flagged)))
+    return rules
+
+@metrics.instrumented("score_routes", records_in=lambda routes, *a, **k: len(routes))
+def score_routes(routes, rules):
+    """
+    Bewertet alle Routen spaltenweise: jede Regel liefert eine Maske über den
+    RouteStore, zutreffende Routen erhalten ihr Gewicht auf 'is_legit'. Neue
+    Heuristiken werden als weitere ScoringRule übergeben.
+    """
+    for rule in rules:
+        mask = rule.matches(routes)
+        routes.is_legit[mask] += rule.weight
+        metrics.count(**{f"rule_{rule.name}": int(mask.sum())})
 
-        # Flag für Treffer
-        gefunden = False
+    return routes
 
-        # Durchsuche die CSV-Daten nach dem start_system
-        for eintrag in csv_data:
-            if eintrag["start_system"] == start_system:
-                #print(f"Gefundenes CSV-Eintrag für {start_system}: IP {eintrag['ip']}")
+def update_is_legit(json_data, csv_data, ammount):
+    """
+    Erhöht den 'is_legit' Zähler um 'ammount', wenn für das start_system
+    keine passende IP in den CSV-Daten gefunden wurde (csv_data = Treffer
+    aus check_ip_in_asn).
+    """
+    return score_routes(json_data, [suspicious_peer_rule(csv_data, ammount)])
 
-                # Wenn die IP übereinstimmt, setzen wir gefunden auf True
-                if ip == eintrag["ip"]:
-                    #print(f"Treffer: IP {ip} passt zu CSV-IP {eintrag['ip']}")
-                    gefunden = True
-                    break
+def evaluate_routes(routes, points, asn_index, max_distance_km=100, rules=()):
+    """
+    Komplette Bewertung im Speicher: Geo-Filter, Aktualisierung von routes_count
+    und is_legit-Scoring. Weitere Regeln (z. B. origin_rules) werden im selben
+    Scoring-Durchlauf angewendet. Gibt (routes, points) zurück.
+    """
+    routes = filter_routes_by_geo_distance(routes, points, max_distance_km=max_distance_km)
+    points = update_routes_count(points, routes)
 
-        # Wenn keine passende IP gefunden wurde, erhöhe 'is_legit' um 5
-        if gefunden:
-            #print(f"Kein Treffer gefunden für start_system {start_system}. Erhöhe 'is_legit' um 5.")
-            obj["is_legit"] += ammount
+    einzigartige_objekte = unique_ip_and_start_as_in_routes(routes)
+    treffer = check_ip_in_asn(einzigartige_objekte, asn_index)
 
-    return json_data
+    routes = score_routes(routes, [suspicious_peer_rule(treffer, 5), *rules])
+    return routes, points
 
 if __name__ == "__main__":
+    metrics.setup_logging()
     points = read_json(json_points)
-    routes = read_json(json_routes)
-
-    routes = filter_routes_by_geo_distance(routes, points, max_distance_km=100)
-    points = update_routes_count(points, routes)
-
-    einzigartige_objekte = unique_ip_and_start_as_in_routes(routes)
-
-    csv_data = load_csv_data_asn(geo_csv_path_ip)
-    treffer = check_ip_in_asn(einzigartige_objekte,csv_data)
+    routes = RouteStore.from_routes(read_json(json_routes))
 
-    routes = update_is_legit(routes, treffer, 5)
+    routes, points = evaluate_routes(routes, points, load_asn_index(geo_csv_paths))
+    write_as_stats(build_as_stats(routes))
+    routes = routes.to_routes()
 
     save_json(routes, json_routes)
+    write_route_shards(routes)
     save_json(points, json_points)
+    if OUTPUT_COMPACT:
+        write_routes_compact(routes, compact_path(json_routes))
@@ -0,0 +1,97 @@
+import os
+import sqlite3
+
+# Standardpfad für den persistenten ASN-Geo-Cache
+GEO_CACHE_PATH = "../data/cache/asn_geo.sqlite"
+# Bei Änderungen an der Standortermittlung erhöhen, damit alte Einträge verworfen werden
+GEO_CACHE_VERSION = 3
+
+
+def geolite_build_id(reader, csv_paths):
+    """
+    Kennung des aktuellen GeoLite-Stands: Build-Zeitpunkt der City-Datenbank
+    plus Größe und Änderungszeit der ASN-CSVs. Ändert sich nach jedem update_geolite.py.
+    """
+    build_epoch = reader.metadata().build_epoch
+    csv_parts = []
+    for csv_path in (csv_paths,) if isinstance(csv_paths, str) else csv_paths:
+        try:
+            stat = os.stat(csv_path)
+            csv_parts.append(f"{stat.st_size}-{int(stat.st_mtime)}")
+        except OSError:
+            csv_parts.append("nocsv")
+    return f"{build_epoch}-{'-'.join(csv_parts)}-v{GEO_CACHE_VERSION}"
+
+
+class GeoCache:
+    """
+    SQLite-Cache ASN -> {ip, as_name, city, region, coordinates}.
+    Alle Einträge gehören zu genau einem GeoLite-Build; wechselt der Build,
+    wird der Cache beim Öffnen automatisch geleert. ASNs ohne Standort (kein
+    Block, nicht geolokalisierbar, AS_SET) werden als negativer Eintrag (ip NULL)
+    gespeichert und bis zum nächsten Build nicht erneut aufgelöst.
+    """
+
+    def __init__(self, build_id, db_path=GEO_CACHE_PATH):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        # Mehrere Prozesse (z. B. backfill.py) teilen sich den Cache: WAL und Wartezeit bei Sperren
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        if db_path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS asn_geo ("
+            "asn TEXT PRIMARY KEY, ip TEXT, as_name TEXT, city TEXT, region TEXT, lat REAL, lon REAL)"
+        )
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'build'").fetchone()
+        if row is None or row[0] != build_id:
+            # Neuer GeoLite-Build: alle alten Zuordnungen verwerfen
+            self.conn.execute("DELETE FROM asn_geo")
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('build', ?)", (build_id,))
+            self.conn.commit()
+        self.build_id = build_id
+
+    def get_many(self, asns):
+        """Liefert ein Dict ASN -> Eintrag (None bei negativem Eintrag) für alle bereits gecachten ASNs"""
+        found = {}
+        asns = [str(asn) for asn in asns]
+        # SQLite begrenzt die Anzahl der Parameter pro Abfrage
+        for i in range(0, len(asns), 500):
+            chunk = asns[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for asn, ip, as_name, city, region, lat, lon in self.conn.execute(
+                f"SELECT asn, ip, as_name, city, region, lat, lon FROM asn_geo WHERE asn IN ({placeholders})",
+                chunk,
+            ):
+                if ip is None:
+                    found[asn] = None
+                    continue
+                found[asn] = {
+                    "ip": ip,
+                    "as_name": as_name,
+                    "city": city,
+                    "region": region,
+                    "coordinates": [lat, lon],
+                }
+        return found
+
+    def put_many(self, entries):
+        """Speichert ein Dict ASN -> Eintrag; None speichert einen negativen Eintrag"""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO asn_geo (asn, ip, as_name, city, region, lat, lon) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (str(asn), None, None, None, None, None, None) if e is None else
+                (str(asn), e["ip"], e["as_name"], e["city"], e["region"], e["coordinates"][0], e["coordinates"][1])
+                for asn, e in entries.items()
+            ],
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,119 @@
+import os
+from collections import OrderedDict
+
+import geoip2.database
+import geoip2.errors
+from maxminddb import MODE_MMAP
+
+from route_store import parse_address
+
+# Maximale Anzahl zwischengespeicherter GeoLite-Netze (LRU)
+GEO_LOOKUP_CACHE_SIZE = int(os.getenv("GEO_LOOKUP_CACHE_SIZE", "100000"))
+
+_ADDRESS_BITS = {4: 32, 6: 128}
+
+
+def open_city_reader(path):
+    """Öffnet die GeoLite2-City-Datenbank per mmap: Seiten werden nur bei Bedarf gelesen
+       und zwischen Prozessen (z. B. den Backfill-Workern) geteilt"""
+    return geoip2.database.Reader(path, mode=MODE_MMAP)
+
+
+def _network_of(response_or_error, version, value):
+    """(Version, Netzadresse, Prefix-Länge) des GeoLite-Netzes; ohne Angabe die Einzeladresse"""
+    network = getattr(getattr(response_or_error, "traits", response_or_error), "network", None)
+    if network is None:
+        return version, value, _ADDRESS_BITS[version]
+    return version, int(network.network_address), network.prefixlen
+
+
+class GeoLookup:
+    """
+    Geolokalisierung über den GeoLite-Reader mit Cache pro GeoLite-Netz: das
+    Ergebnis einer Abfrage gilt für das ganze Netz, das die Datenbank dazu
+    liefert (Prefix-Länge aus der Datenbank). Weitere IPs im selben Netz werden
+    ohne Zugriff auf die Datenbank beantwortet. Der Cache ist per LRU auf
+    max_entries Netze begrenzt; hits und misses zählen die Abfragen.
+    """
+
+    def __init__(self, reader, max_entries=GEO_LOOKUP_CACHE_SIZE):
+        self.reader = reader
+        self.max_entries = max_entries
+        # (Version, Netzadresse, Prefix-Länge) -> Eintrag oder None (nicht in der Datenbank)
+        self._networks = OrderedDict()
+        # Version -> {Prefix-Länge: Anzahl gecachter Netze}; nur diese Längen werden geprüft
+        self._prefix_lens = {4: {}, 6: {}}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._networks)
+
+    def _cached(self, version, value):
+        bits = _ADDRESS_BITS[version]
+        for length in self._prefix_lens[version]:
+            host_bits = bits - length
+            key = (version, value >> host_bits << host_bits, length)
+            if key in self._networks:
+                self._networks.move_to_end(key)
+                return key
+        return None
+
+    def _store(self, key, entry):
+        self._networks[key] = entry
+        lengths = self._prefix_lens[key[0]]
+        lengths[key[2]] = lengths.get(key[2], 0) + 1
+        while len(self._networks) > self.max_entries:
+            (version, _, length), _ = self._networks.popitem(last=False)
+            lengths = self._prefix_lens[version]
+            if lengths[length] == 1:
+                del lengths[length]
+            else:
+                lengths[length] -= 1
+
+    def lookup(self, ip):
+        """Liefert {city, region, coordinates} für die IP oder None, wenn sie nicht in der Datenbank ist"""
+        parsed = parse_address(ip)
+        if parsed is None:
+            raise ValueError(f"Ungültige IP-Adresse: {ip}")
+        key = self._cached(*parsed)
+        if key is not None:
+            self.hits += 1
+            return self._networks[key]
+
+        self.misses += 1
+        try:
+            response = self.reader.city(ip)
+        except geoip2.errors.AddressNotFoundError as e:
+            self._store(_network_of(e, *parsed), None)
+            return None
+        entry = {
+            "city": response.city.name or "Unknown",
+            "region": response.subdivisions.most_specific.name or "Unknown",
+            "coordinates": [response.location.latitude, response.location.longitude]
+        }
+        self._store(_network_of(response, *parsed), entry)
+        return entry
+
+    def locate(self, blocks):
+        """
+        Geolokalisiert alle Blöcke (IP, Gewicht) eines AS und liefert (IP, Eintrag)
+        des Standorts mit dem höchsten Gesamtgewicht, bei Gleichstand den zuerst
+        gesehenen. IP ist der erste Block an diesem Standort. None, wenn kein
+        Block in der Datenbank gefunden wurde.
+        """
+        locations = {}  # (city, region, lat, lon) -> [Gewicht, IP, Eintrag]
+        for ip, weight in blocks:
+            entry = self.lookup(ip)
+            if entry is None:
+                continue
+            key = (entry["city"], entry["region"], *entry["coordinates"])
+            location = locations.get(key)
+            if location is None:
+                locations[key] = [weight, ip, entry]
+            else:
+                location[0] += weight
+        if not locations:
+            return None
+        _, ip, entry = max(locations.values(), key=lambda location: location[0])
+        return ip, entry
@@ -0,0 +1,177 @@
+import gzip
+import json
+import os
+
+try:
+    import brotli  # optional: .br-Sidecars nur, wenn das Paket installiert ist
+except ImportError:
+    brotli = None
+
+# Zusätzlich erzeugte, vorkomprimierte Dateien ("gzip", "br"), die der Webserver direkt ausliefert
+OUTPUT_COMPRESSION = [c for c in os.getenv("OUTPUT_COMPRESSION", "gzip,br").split(",") if c]
+# Kompakte Routen-Datei (routes.compact.json) mit Lookup-Tabellen für ASNs und AS-Pfade
+OUTPUT_COMPACT = os.getenv("OUTPUT_COMPACT", "0") == "1"
+
+SIDECAR_SUFFIX = {"gzip": ".gz", "br": ".br"}
+COMPACT_VERSION = 1
+
+
+class _BrotliFile:
+    """Minimaler Datei-Wrapper um den Streaming-Kompressor von brotli"""
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.compressor = brotli.Compressor(mode=brotli.MODE_TEXT)
+
+    def write(self, data):
+        self.file.write(self.compressor.process(data))
+
+    def close(self):
+        self.file.write(self.compressor.finish())
+        self.file.close()
+
+
+def _open_sidecars(tmp_path, compression):
+    """Öffnet die Sidecar-Dateien passend zur gewünschten Kompression"""
+    sidecars = {}
+    for method in compression:
+        suffix = SIDECAR_SUFFIX.get(method)
+        if suffix is None or (method == "br" and brotli is None):
+            continue
+        path = tmp_path + suffix
+        sidecars[suffix] = gzip.open(path, "wb", compresslevel=6) if method == "gzip" else _BrotliFile(path)
+    return sidecars
+
+
+def write_json_stream(records, output_file, compression=None):
+    """
+    Schreibt eine JSON-Liste Eintrag für Eintrag (records darf ein Generator sein),
+    ohne den gesamten JSON-String im Speicher aufzubauen. Geschrieben wird in
+    temporäre Dateien, die erst am Ende atomar umbenannt werden; Leser sehen nie
+    eine halb geschriebene Datei. Zusätzlich entstehen .gz/.br-Sidecars.
+    Gibt die Anzahl geschriebener Einträge zurück.
+    """
+    compression = OUTPUT_COMPRESSION if compression is None else compression
+    tmp_path = output_file + ".tmp"
+    sidecars = _open_sidecars(tmp_path, compression)
+    count = 0
+
+    try:
+        with open(tmp_path, "wb") as out_file:
+            def emit(text):
+                data = text.encode("utf-8")
+                out_file.write(data)
+                for sidecar in sidecars.values():
+                    sidecar.write(data)
+
+            emit("[")
+            for record in records:
+                emit(("\n" if count == 0 else ",\n") + json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+                count += 1
+            emit("\n]\n")
+    finally:
+        for sidecar in sidecars.values():
+            sidecar.close()
+
+    # Sidecars zuerst, damit nie eine neue Hauptdatei mit alten Sidecars ausgeliefert wird
+    for suffix in SIDECAR_SUFFIX.values():
+        if suffix in sidecars:
+            os.replace(tmp_path + suffix, output_file + suffix)
+        elif os.path.exists(output_file + suffix):
+            os.remove(output_file + suffix)  # veraltete Sidecars entfernen
+    os.replace(tmp_path, output_file)
+    return count
+
+
+def encode_routes_compact(routes):
+    """
+    Kompakte Kodierung: ASNs und AS-Pfade werden in Lookup-Tabellen interniert,
+    jede Route referenziert nur noch Indizes.
+    Format: {"version", "fields", "asns": [...], "paths": [[asn_idx, ...]], "routes": [[...]]}
+    """
+    asn_ids = {}
+    path_ids = {}
+    paths = []
+    rows = []
+
+    def asn_id(asn):
+        idx = asn_ids.get(asn)
+        if idx is None:
+            idx = asn_ids[asn] = len(asn_ids)
+        return idx
+
+    for route in routes:
+        as_path = tuple(route.get("as_path") or ())
+        path_id = path_ids.get(as_path)
+        if path_id is None:
+            path_id = path_ids[as_path] = len(paths)
+            paths.append([asn_id(asn) for asn in as_path])
+        rows.append([
+            route.get("timestamp"), route.get("ip"), asn_id(route.get("start_system")),
+            route.get("prefix"), path_id, route.get("is_legit"), route.get("additional_info"),
+        ])
+
+    return {
+        "version": COMPACT_VERSION,
+        "fields": ["timestamp", "ip", "start_system", "prefix", "as_path", "is_legit", "additional_info"],
+        "asns": list(asn_ids),
+        "paths": paths,
+        "routes": rows,
+    }
+
+
+def decode_routes_compact(data):
+    """Gegenstück zu encode_routes_compact: liefert die Routen im Format von routes.json"""
+    asns = data["asns"]
+    paths = [[asns[i] for i in path] for path in data["paths"]]
+    for timestamp, ip, start_id, prefix, path_id, is_legit, additional_info in data["routes"]:
+        as_path = paths[path_id]
+        yield {
+            "timestamp": timestamp,
+            "status": "A",
+            "ip": ip,
+            "start_system": asns[start_id],
+            "target_system": as_path[-1] if as_path else None,
+            "prefix": prefix,
+            "as_path": list(as_path),
+            "is_legit": is_legit,
+            "additional_info": additional_info
+        }
+
+
+def compact_path(output_file):
+    """routes.json -> routes.compact.json"""
+    root, ext = os.path.splitext(output_file)
+    return f"{root}.compact{ext}"
+
+
+def write_bytes_atomic(data, output_file, compression=None):
+    """Schreibt bereits serialisierte Daten inkl. Sidecars über temporäre Dateien atomar"""
+    compression = OUTPUT_COMPRESSION if compression is None else compression
+    tmp_path = output_file + ".tmp"
+    with open(tmp_path, "wb") as out_file:
+        out_file.write(data)
+    for method in compression:
+        suffix = SIDECAR_SUFFIX.get(method)
+        if method == "gzip":
+            with gzip.open(tmp_path + suffix, "wb", compresslevel=6) as f:
+                f.write(data)
+        elif method == "br" and brotli is not None:
+            with open(tmp_path + suffix, "wb") as f:
+                f.write(brotli.compress(data, mode=brotli.MODE_TEXT))
+    for suffix in SIDECAR_SUFFIX.values():
+        if os.path.exists(tmp_path + suffix):
+            os.replace(tmp_path + suffix, output_file + suffix)
+        elif os.path.exists(output_file + suffix):
+            os.remove(output_file + suffix)
+    os.replace(tmp_path, output_file)
+
+
+def dumps_compact(data):
+    """JSON ohne Leerzeichen als UTF-8-Bytes"""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def write_routes_compact(routes, output_file, compression=None):
+    """Schreibt die kompakte Routen-Kodierung inkl. Sidecars atomar"""
+    write_bytes_atomic(dumps_compact(encode_routes_compact(routes)), output_file, compression)
@@ -0,0 +1,214 @@
+import cProfile
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Ablage der Metriken: JSON-Lines (eine Zeile pro Lauf) und Prometheus-Textfile
+METRICS_DIR = "../data/metrics/"
+METRICS_JSONL = os.path.join(METRICS_DIR, "pipeline_metrics.jsonl")
+METRICS_PROM = os.path.join(METRICS_DIR, "pipeline.prom")
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+
+def setup_logging(level=None):
+    """Einheitliche Log-Ausgabe für alle CLIs; Level über LOG_LEVEL (Standard INFO)"""
+    level = level or os.getenv("LOG_LEVEL", "INFO").upper()
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+
+def _rss_bytes():
+    """Aktueller Resident Set Size (nur Linux, sonst None)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _max_rss_bytes():
+    """Bisher maximaler RSS des Prozesses (None ohne resource-Modul, z. B. unter Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _stack():
+    if not hasattr(_state, "stack"):
+        _state.stack = []
+        _state.records = []
+    return _state.stack
+
+
+@contextmanager
+def stage(name):
+    """
+    Misst einen Abschnitt: Wall- und CPU-Zeit, RSS, Ein-/Ausgabe-Zähler und
+    beliebige Zähler (z. B. Cache-Treffer), die innerhalb per count() gesetzt werden.
+    Verschachtelte Stages werden mit ihrem Elternnamen festgehalten.
+    """
+    stack = _stack()
+    record = {"stage": name, "parent": stack[-1]["stage"] if stack else None, "counters": {}}
+    stack.append(record)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["wall_s"] = round(time.perf_counter() - wall_start, 6)
+        record["cpu_s"] = round(time.process_time() - cpu_start, 6)
+        record["rss_bytes"] = _rss_bytes()
+        record["max_rss_bytes"] = _max_rss_bytes()
+        stack.pop()
+        _state.records.append(record)
+        logger.debug("Stage %s: %.3f s wall, %.3f s cpu", name, record["wall_s"], record["cpu_s"])
+
+
+def count(**counters):
+    """Addiert Zähler zur aktuell laufenden Stage (ohne aktive Stage wirkungslos)"""
+    stack = _stack()
+    if not stack:
+        return
+    target = stack[-1]["counters"]
+    for key, value in counters.items():
+        target[key] = target.get(key, 0) + value
+
+
+def instrumented(name=None, records_in=None, records_out=None):
+    """
+    Decorator: führt die Funktion innerhalb einer Stage aus. records_in wird optional
+    aus den Argumenten, records_out aus dem Ergebnis bestimmt (Standard: len() des
+    Ergebnisses, sofern es keine Tupel-Rückgabe ist).
+    """
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name) as record:
+                if records_in is not None:
+                    record["records_in"] = _safe_size(records_in, *args, **kwargs)
+                result = func(*args, **kwargs)
+                if records_out is not None:
+                    record["records_out"] = _safe_size(records_out, result)
+                elif not isinstance(result, tuple):
+                    record["records_out"] = _safe_size(len, result)
+                return result
+        return wrapper
+    return decorator
+
+
+def _safe_size(func, *args, **kwargs):
+    try:
+        return int(func(*args, **kwargs))
+    except (TypeError, ValueError):
+        return None
+
+
+def collect():
+    """
+    Liefert alle seit dem letzten Aufruf abgeschlossenen Stages und leert die Liste.
+    Aus Zählerpaaren <name>_hits/<name>_misses wird die Trefferquote berechnet.
+    """
+    _stack()
+    records, _state.records = _state.records, []
+    for record in records:
+        ratios = {}
+        for key, hits in record["counters"].items():
+            if not key.endswith("_hits"):
+                continue
+            cache = key[:-len("_hits")]
+            total = hits + record["counters"].get(cache + "_misses", 0)
+            ratios[cache] = round(hits / total, 4) if total else None
+        if ratios:
+            record["hit_ratios"] = ratios
+    return records
+
+
+def _prom_escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def write_metrics(records, run_info=None, jsonl_path=METRICS_JSONL, prom_path=METRICS_PROM):
+    """Hängt den Lauf als JSON-Zeile an und ersetzt das Prometheus-Textfile atomar"""
+    os.makedirs(os.path.dirname(jsonl_path) or ".", exist_ok=True)
+    run = {"timestamp": datetime.now(timezone.utc).isoformat(), **(run_info or {}), "stages": records}
+    with open(jsonl_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run, separators=(",", ":")) + "\n")
+
+    gauges = {
+        "wall_s": ("bgp_pipeline_stage_wall_seconds", "Wall-Zeit der Stage"),
+        "cpu_s": ("bgp_pipeline_stage_cpu_seconds", "CPU-Zeit der Stage"),
+        "max_rss_bytes": ("bgp_pipeline_stage_max_rss_bytes", "Maximaler RSS nach der Stage"),
+        "records_in": ("bgp_pipeline_stage_records_in", "Eingangsdatensätze der Stage"),
+        "records_out": ("bgp_pipeline_stage_records_out", "Ausgangsdatensätze der Stage"),
+    }
+    lines = []
+    for key, (metric, help_text) in gauges.items():
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        for record in records:
+            if record.get(key) is not None:
+                lines.append(f'{metric}{{stage="{_prom_escape(record["stage"])}"}} {record[key]}')
+    lines.append("# HELP bgp_pipeline_stage_hit_ratio Cache-Trefferquote der Stage")
+    lines.append("# TYPE bgp_pipeline_stage_hit_ratio gauge")
+    for record in records:
+        for cache, ratio in record.get("hit_ratios", {}).items():
+            if ratio is not None:
+                lines.append(f'bgp_pipeline_stage_hit_ratio{{stage="{_prom_escape(record["stage"])}",cache="{_prom_escape(cache)}"}} {ratio}')
+    lines.append("# HELP bgp_pipeline_stage_counter Zähler der Stage (Datensätze, Cache-Treffer, ...)")
+    lines.append("# TYPE bgp_pipeline_stage_counter gauge")
+    for record in records:
+        for counter, value in record["counters"].items():
+            lines.append(f'bgp_pipeline_stage_counter{{stage="{_prom_escape(record["stage"])}",counter="{_prom_escape(counter)}"}} {value}')
+    lines.append("# HELP bgp_pipeline_last_run_timestamp_seconds Zeitpunkt des letzten Laufs")
+    lines.append("# TYPE bgp_pipeline_last_run_timestamp_seconds gauge")
+    lines.append(f"bgp_pipeline_last_run_timestamp_seconds {time.time():.0f}")
+
+    tmp_path = prom_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, prom_path)
+
+
+@contextmanager
+def profiled(enabled, output_dir=METRICS_DIR, top=25):
+    """
+    Optionales Profiling eines Zyklus: cProfile-Daten (.pstats) und die größten
+    Speicher-Allokationen laut tracemalloc (.txt) landen in output_dir.
+    """
+    if not enabled:
+        yield
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        profile_path = os.path.join(output_dir, f"profile-{stamp}.pstats")
+        profiler.dump_stats(profile_path)
+        memory_path = os.path.join(output_dir, f"tracemalloc-{stamp}.txt")
+        with open(memory_path, "w", encoding="utf-8") as f:
+            for stat in snapshot.statistics("lineno")[:top]:
+                f.write(f"{stat}\n")
+        logger.info("Profil gespeichert: %s, %s", profile_path, memory_path)
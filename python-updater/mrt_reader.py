@@ -0,0 +1,241 @@
+import bz2
+import ipaddress
+import struct
+
+# MRT-Typen (RFC 6396)
+MRT_BGP4MP = 16
+MRT_BGP4MP_ET = 17
+
+# BGP4MP-Subtypen, die BGP-Nachrichten enthalten (State-Changes werden ignoriert)
+BGP4MP_MESSAGE = 1
+BGP4MP_MESSAGE_AS4 = 4
+BGP4MP_MESSAGE_LOCAL = 6
+BGP4MP_MESSAGE_AS4_LOCAL = 7
+AS4_SUBTYPES = (BGP4MP_MESSAGE_AS4, BGP4MP_MESSAGE_AS4_LOCAL)
+MESSAGE_SUBTYPES = (BGP4MP_MESSAGE, BGP4MP_MESSAGE_AS4, BGP4MP_MESSAGE_LOCAL, BGP4MP_MESSAGE_AS4_LOCAL)
+
+BGP_UPDATE = 2
+AFI_IPV4 = 1
+AFI_IPV6 = 2
+
+# BGP-Pfadattribute
+ATTR_ORIGIN = 1
+ATTR_AS_PATH = 2
+ATTR_NEXT_HOP = 3
+ATTR_MED = 4
+ATTR_LOCAL_PREF = 5
+ATTR_ATOMIC_AGGREGATE = 6
+ATTR_AGGREGATOR = 7
+ATTR_COMMUNITIES = 8
+ATTR_MP_REACH_NLRI = 14
+ATTR_MP_UNREACH_NLRI = 15
+ATTR_AS4_PATH = 17
+ATTR_AS4_AGGREGATOR = 18
+
+ORIGIN_NAMES = {0: "IGP", 1: "EGP", 2: "INCOMPLETE"}
+AS_SET = 1
+
+MRT_HEADER = struct.Struct("!IHHI")
+READ_CHUNK = 1 << 16
+
+
+def iter_mrt_records(stream):
+    """Liest rohe MRT-Records (Header + Body) aus einem binären Stream"""
+    header_size = MRT_HEADER.size
+    while True:
+        header = stream.read(header_size)
+        if len(header) < header_size:
+            return
+        timestamp, mrt_type, subtype, length = MRT_HEADER.unpack(header)
+        body = stream.read(length)
+        if len(body) < length:
+            return  # abgeschnittener Dump
+        yield timestamp, mrt_type, subtype, body
+
+
+def _ip_to_str(raw):
+    """Wandelt 4 oder 16 Bytes in eine IP-Adresse als String um"""
+    return str(ipaddress.ip_address(bytes(raw)))
+
+
+def _parse_prefixes(data, afi):
+    """Dekodiert eine NLRI-Liste (Länge in Bit + gekürzte Adresse) in CIDR-Strings"""
+    prefixes = []
+    size = 4 if afi == AFI_IPV4 else 16
+    pos = 0
+    while pos < len(data):
+        bits = data[pos]
+        pos += 1
+        nbytes = (bits + 7) // 8
+        raw = bytes(data[pos:pos + nbytes]) + b"\x00" * (size - nbytes)
+        pos += nbytes
+        prefixes.append(f"{ipaddress.ip_address(raw)}/{bits}")
+    return prefixes
+
+
+def _parse_as_path(data, asn_size):
+    """Dekodiert AS_PATH-Segmente im bgpdump-Format (AS_SET als {a,b})"""
+    segments = []
+    fmt = "!I" if asn_size == 4 else "!H"
+    pos = 0
+    while pos + 2 <= len(data):
+        seg_type, count = data[pos], data[pos + 1]
+        pos += 2
+        asns = [str(struct.unpack_from(fmt, data, pos + i * asn_size)[0]) for i in range(count)]
+        pos += count * asn_size
+        if seg_type == AS_SET:
+            segments.append("{" + ",".join(asns) + "}")
+        else:
+            segments.extend(asns)
+    return " ".join(segments)
+
+
+def _merge_as4_path(as_path, as4_path):
+    """
+    Setzt den Pfad einer 2-Byte-Session wie bgpdump zusammen (RFC 6793, 4.2.3): AS4_PATH
+    kann kürzer als AS_PATH sein, die fehlenden führenden AS stammen dann aus AS_PATH.
+    Ein AS_SET zählt als ein AS. Ist AS4_PATH länger, gilt AS_PATH.
+    """
+    hops, hops4 = as_path.split(), as4_path.split()
+    if len(hops4) > len(hops):
+        return as_path
+    return " ".join(hops[:len(hops) - len(hops4)] + hops4)
+
+
+def _parse_attributes(data, asn_size):
+    """Dekodiert die Pfadattribute einer UPDATE-Nachricht in ein Dictionary"""
+    attrs = {}
+    pos = 0
+    while pos + 3 <= len(data):
+        flags, type_code = data[pos], data[pos + 1]
+        if flags & 0x10:  # Extended Length
+            length = struct.unpack_from("!H", data, pos + 2)[0]
+            pos += 4
+        else:
+            length = data[pos + 2]
+            pos += 3
+        value = data[pos:pos + length]
+        pos += length
+
+        if type_code == ATTR_ORIGIN:
+            attrs["origin"] = ORIGIN_NAMES.get(value[0], "INCOMPLETE")
+        elif type_code == ATTR_AS_PATH:
+            attrs["as_path"] = _parse_as_path(value, asn_size)
+        elif type_code == ATTR_AS4_PATH:
+            attrs["as4_path"] = _parse_as_path(value, 4)
+        elif type_code == ATTR_NEXT_HOP:
+            attrs["next_hop"] = _ip_to_str(value)
+        elif type_code == ATTR_MED:
+            attrs["med"] = struct.unpack("!I", value)[0]
+        elif type_code == ATTR_LOCAL_PREF:
+            attrs["local_pref"] = struct.unpack("!I", value)[0]
+        elif type_code == ATTR_ATOMIC_AGGREGATE:
+            attrs["atomic_aggregate"] = True
+        elif type_code in (ATTR_AGGREGATOR, ATTR_AS4_AGGREGATOR):
+            agg_size = 4 if (type_code == ATTR_AS4_AGGREGATOR or length == 8) else 2
+            agg_as = struct.unpack_from("!I" if agg_size == 4 else "!H", value, 0)[0]
+            attrs["aggregator"] = f"{agg_as} {_ip_to_str(value[agg_size:agg_size + 4])}"
+        elif type_code == ATTR_COMMUNITIES:
+            attrs["communities"] = " ".join(
+                f"{value[i] << 8 | value[i + 1]}:{value[i + 2] << 8 | value[i + 3]}"
+                for i in range(0, length - 3, 4)
+            )
+        elif type_code == ATTR_MP_REACH_NLRI:
+            afi, _safi, nh_len = struct.unpack_from("!HBB", value, 0)
+            next_hop = value[4:4 + nh_len]
+            # Bei IPv6 kann eine zusätzliche Link-Local-Adresse folgen
+            nh_size = 4 if afi == AFI_IPV4 else 16
+            if len(next_hop) >= nh_size:
+                attrs["mp_next_hop"] = _ip_to_str(next_hop[:nh_size])
+            attrs["mp_announced"] = _parse_prefixes(value[5 + nh_len:], afi)
+        elif type_code == ATTR_MP_UNREACH_NLRI:
+            afi, _safi = struct.unpack_from("!HB", value, 0)
+            attrs["mp_withdrawn"] = _parse_prefixes(value[3:], afi)
+    return attrs
+
+
+def _parse_bgp4mp_message(subtype, body):
+    """Zerlegt den BGP4MP-Kopf und liefert (peer_ip, peer_as, asn_size, BGP-Nachricht)"""
+    asn_size = 4 if subtype in AS4_SUBTYPES else 2
+    fmt = "!II" if asn_size == 4 else "!HH"
+    peer_as, _local_as = struct.unpack_from(fmt, body, 0)
+    pos = 2 * asn_size
+    _if_index, afi = struct.unpack_from("!HH", body, pos)
+    pos += 4
+    ip_size = 4 if afi == AFI_IPV4 else 16
+    peer_ip = _ip_to_str(body[pos:pos + ip_size])
+    pos += 2 * ip_size  # Peer- und lokale IP
+    return peer_ip, peer_as, asn_size, body[pos:]
+
+
+def decode_update_records(records):
+    """
+    Dekodiert BGP4MP-UPDATE-Records und liefert pro Prefix eine Feldliste im
+    Format von 'bgpdump -m' (A- und W-Zeilen), sodass updater.ingest_updates
+    sie direkt verarbeiten kann.
+    """
+    for timestamp, mrt_type, subtype, body in records:
+        if mrt_type not in (MRT_BGP4MP, MRT_BGP4MP_ET) or subtype not in MESSAGE_SUBTYPES:
+            continue
+        body = memoryview(body)
+        record_type = "BGP4MP"
+        ts = str(timestamp)
+        if mrt_type == MRT_BGP4MP_ET:
+            # Extended Timestamp: Mikrosekunden stehen vor dem eigentlichen Body
+            microseconds = struct.unpack_from("!I", body, 0)[0]
+            body = body[4:]
+            record_type = "BGP4MP_ET"
+            ts = f"{timestamp}.{microseconds:06d}"
+
+        try:
+            peer_ip, peer_as, asn_size, message = _parse_bgp4mp_message(subtype, body)
+            # BGP-Header: 16 Byte Marker, 2 Byte Länge, 1 Byte Typ
+            if len(message) < 19 or message[18] != BGP_UPDATE:
+                continue
+            message = message[19:]
+
+            withdrawn_len = struct.unpack_from("!H", message, 0)[0]
+            withdrawn = _parse_prefixes(message[2:2 + withdrawn_len], AFI_IPV4)
+            pos = 2 + withdrawn_len
+            attr_len = struct.unpack_from("!H", message, pos)[0]
+            attrs = _parse_attributes(message[pos + 2:pos + 2 + attr_len], asn_size)
+            announced = _parse_prefixes(message[pos + 2 + attr_len:], AFI_IPV4)
+        except (struct.error, IndexError, ValueError):
+            continue  # defekte Nachricht überspringen
+
+        peer_as = str(peer_as)
+        for prefix in withdrawn + attrs.get("mp_withdrawn", []):
+            yield [record_type, ts, "W", peer_ip, peer_as, prefix]
+
+        announced_all = [(p, attrs.get("next_hop", "")) for p in announced]
+        announced_all += [(p, attrs.get("mp_next_hop", "")) for p in attrs.get("mp_announced", [])]
+        if not announced_all:
+            continue
+
+        # Bei 2-Byte-Sessions enthält AS4_PATH die vollständigen 4-Byte-ASNs (AS_TRANS in AS_PATH)
+        as_path = attrs.get("as_path", "")
+        if asn_size == 2 and "as4_path" in attrs:
+            as_path = _merge_as4_path(as_path, attrs["as4_path"])
+        for prefix, next_hop in announced_all:
+            yield [
+                record_type, ts, "A", peer_ip, peer_as, prefix, as_path,
+                attrs.get("origin", "INCOMPLETE"), next_hop,
+                str(attrs.get("local_pref", 0)), str(attrs.get("med", 0)),
+                attrs.get("communities", ""),
+                "AG" if attrs.get("atomic_aggregate") else "NAG",
+                attrs.get("aggregator", ""), ""
+            ]
+
+
+def iter_updates(stream):
+    """Liefert bgpdump-kompatible Update-Records aus einem (entpackten) MRT-Stream"""
+    return decode_update_records(iter_mrt_records(stream))
+
+
+def read_bz2_updates(source):
+    """
+    Liest einen .bz2-komprimierten MRT-Dump (Pfad oder binärer Stream, z. B. eine
+    HTTP-Antwort) und dekodiert ihn im Speicher, ohne entpackte Kopie auf der Platte.
+    """
+    with bz2.open(source, "rb") as stream:
+        yield from iter_updates(stream)
@@ -0,0 +1,211 @@
+import logging
+import math
+import os
+import sqlite3
+import time
+
+import metrics
+from route_store import parse_address
+
+# Persistente Historie Prefix -> Origin-AS
+ORIGIN_HISTORY_PATH = "../data/cache/prefix_origins.sqlite"
+# Zeitraum in Sekunden, in dem ein anderes Origin-AS des Prefix noch als aktiv gilt (MOAS)
+ORIGIN_MOAS_WINDOW = int(os.getenv("ORIGIN_MOAS_WINDOW", str(24 * 3600)))
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_weights(spec, defaults):
+    """Liest Gewichte im Format "moas=2,new_origin=3" über die Standardwerte"""
+    weights = dict(defaults)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        weights[name.strip()] = int(value)
+    return weights
+
+
+# Gewicht pro Befund für is_legit (per Umgebungsvariable überschreibbar)
+ORIGIN_RULE_WEIGHTS = _parse_weights(os.getenv("ORIGIN_RULE_WEIGHTS", ""),
+                                     {"moas": 2, "new_origin": 3, "more_specific": 4})
+
+_ADDRESS_BITS = {4: 32, 6: 128}
+
+
+def prefix_key(prefix):
+    """(Familie, Netzadresse als Bytes, Länge) eines Prefix oder None, falls nicht parsebar"""
+    address, _, length = prefix.partition("/") if isinstance(prefix, str) else ("", "", "")
+    parsed = parse_address(address)
+    if parsed is None or not length.isdigit():
+        return None
+    family, value = parsed
+    bits = _ADDRESS_BITS[family]
+    length = int(length)
+    if length > bits:
+        return None
+    host_bits = bits - length
+    return family, (value >> host_bits << host_bits).to_bytes(bits // 8, "big"), length
+
+
+def _covering_keys(key, lengths):
+    """Schlüssel aller weniger spezifischen Prefixe mit einer der bekannten Längen"""
+    family, network, length = key
+    bits = _ADDRESS_BITS[family]
+    value = int.from_bytes(network, "big")
+    for cover in lengths:
+        if cover < length:
+            host_bits = bits - cover
+            yield family, (value >> host_bits << host_bits).to_bytes(bits // 8, "big"), cover
+
+
+def _timestamp(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+class OriginHistory:
+    """
+    Persistente Historie, welches Origin-AS (letztes AS im Pfad) welches Prefix
+    angekündigt hat, mit erstem und letztem Auftreten. Pro Zyklus werden nur
+    die Prefixe des Zyklus per Primärschlüssel nachgeschlagen, der Aufwand hängt
+    also von der Anzahl der Updates ab, nicht von der Größe der Historie.
+
+    Befunde pro Ankündigung:
+      moas          – mehrere Origin-AS für dasselbe Prefix (im Zyklus oder kürzlich gesehen)
+      new_origin    – bekanntes Prefix, aber dieses Origin-AS wurde dafür noch nie gesehen
+      more_specific – neues Prefix innerhalb eines bekannten, weniger spezifischen
+                      Prefix, das nie von diesem Origin-AS angekündigt wurde
+    """
+
+    def __init__(self, db_path=ORIGIN_HISTORY_PATH, moas_window=ORIGIN_MOAS_WINDOW):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        if db_path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS prefix_origin ("
+            "family INTEGER NOT NULL, network BLOB NOT NULL, length INTEGER NOT NULL, origin TEXT NOT NULL, "
+            "first_seen REAL, last_seen REAL, sightings INTEGER NOT NULL DEFAULT 1, "
+            "PRIMARY KEY (family, network, length, origin)) WITHOUT ROWID"
+        )
+        # Vorkommende Prefix-Längen: nur diese werden bei der Suche nach weniger spezifischen Prefixen geprüft
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS prefix_lengths (family INTEGER, length INTEGER, "
+            "PRIMARY KEY (family, length)) WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS cycle_prefix (id INTEGER, family INTEGER, network BLOB, length INTEGER)")
+        self.conn.commit()
+        self.moas_window = moas_window
+        self.lengths = {4: set(), 6: set()}
+        for family, length in self.conn.execute("SELECT family, length FROM prefix_lengths"):
+            self.lengths[family].add(length)
+
+    def _lookup(self, rows):
+        """Origins mit letztem Auftreten für (id, Familie, Netz, Länge)-Zeilen: id -> {Origin: last_seen}"""
+        self.conn.execute("DELETE FROM temp.cycle_prefix")
+        self.conn.executemany("INSERT INTO temp.cycle_prefix VALUES (?, ?, ?, ?)", rows)
+        found = {}
+        for row_id, origin, last_seen in self.conn.execute(
+            "SELECT c.id, p.origin, p.last_seen FROM temp.cycle_prefix c JOIN prefix_origin p "
+            "ON p.family = c.family AND p.network = c.network AND p.length = c.length"
+        ):
+            found.setdefault(row_id, {})[origin] = last_seen
+        return found
+
+    @metrics.instrumented("origin_history", records_in=lambda self, routes: len(routes.announcements or ()))
+    def observe(self, routes):
+        """
+        Gleicht die Ankündigungen des Zyklus (routes.announcements, siehe RouteStoreBuilder)
+        mit der Historie ab und schreibt sie anschließend fort.
+        Gibt ein Dict Befund -> Menge der betroffenen Pfad-IDs im RouteStore zurück.
+        """
+        # Prefix -> Origin -> [erstes, letztes Auftreten, Pfad-IDs]
+        cycle = {}
+        origins = {}
+        for (prefix, path_id), timestamp in (routes.announcements or {}).items():
+            key = prefix_key(prefix)
+            if key is None:
+                continue
+            origin = origins.get(path_id)
+            if origin is None:
+                origin = origins[path_id] = routes.path_origin(path_id)
+            if origin is None:
+                continue
+            timestamp = _timestamp(timestamp)
+            entry = cycle.setdefault(key, {}).get(origin)
+            if entry is None:
+                cycle[key][origin] = [timestamp, timestamp, {path_id}]
+                continue
+            if timestamp is not None:
+                entry[0] = timestamp if entry[0] is None else min(entry[0], timestamp)
+                entry[1] = timestamp if entry[1] is None else max(entry[1], timestamp)
+            entry[2].add(path_id)
+
+        keys = list(cycle)
+        seen = [t for origin_entries in cycle.values() for entry in origin_entries.values() for t in entry[:2] if t]
+        now = max(seen) if seen else time.time()
+        known = self._lookup([(i, *key) for i, key in enumerate(keys)])
+
+        # Weniger spezifische Prefixe nur für Prefixe nachschlagen, die noch nie gesehen wurden
+        cover_rows = []
+        for i, key in enumerate(keys):
+            if i not in known:
+                cover_rows.extend((i, *cover) for cover in _covering_keys(key, self.lengths[key[0]]))
+        covering = self._lookup(cover_rows) if cover_rows else {}
+
+        findings = {"moas": set(), "new_origin": set(), "more_specific": set()}
+        for i, key in enumerate(keys):
+            history = known.get(i, {})
+            recent = {origin for origin, last_seen in history.items()
+                      if last_seen is None or last_seen >= now - self.moas_window}
+            moas = len(recent | set(cycle[key])) > 1
+            for origin, (_, _, path_ids) in cycle[key].items():
+                matched = []
+                if moas:
+                    matched.append("moas")
+                if history and origin not in history:
+                    matched.append("new_origin")
+                if i in covering and origin not in covering[i]:
+                    matched.append("more_specific")
+                for name in matched:
+                    findings[name].update(path_ids)
+                if matched:
+                    logger.debug("Prefix-Origin-Befund %s: AS%s, bekannt %s", ",".join(matched), origin,
+                                 sorted(history) or sorted(covering.get(i, ())))
+
+        self._record(cycle)
+        metrics.count(announcements=len(routes.announcements or ()), prefixes=len(keys),
+                      **{f"origin_{name}": len(path_ids) for name, path_ids in findings.items()})
+        logger.info("Prefix-Origin-Historie: %d Prefixe, %s", len(keys),
+                    ", ".join(f"{len(path_ids)} Pfade mit {name}" for name, path_ids in findings.items()))
+        return findings
+
+    def _record(self, cycle):
+        """Schreibt die Ankündigungen des Zyklus fort (Upsert pro Prefix und Origin)"""
+        rows = [(*key, origin, first_seen, last_seen)
+                for key, origin_entries in cycle.items()
+                for origin, (first_seen, last_seen, _) in origin_entries.items()]
+        self.conn.executemany(
+            "INSERT INTO prefix_origin (family, network, length, origin, first_seen, last_seen) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (family, network, length, origin) DO UPDATE SET "
+            "first_seen = min(coalesce(first_seen, excluded.first_seen), coalesce(excluded.first_seen, first_seen)), "
+            "last_seen = max(coalesce(last_seen, excluded.last_seen), coalesce(excluded.last_seen, last_seen)), "
+            "sightings = sightings + 1",
+            rows,
+        )
+        new_lengths = {(family, length) for family, _, length in cycle if length not in self.lengths[family]}
+        self.conn.executemany("INSERT OR IGNORE INTO prefix_lengths VALUES (?, ?)", new_lengths)
+        for family, length in new_lengths:
+            self.lengths[family].add(length)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
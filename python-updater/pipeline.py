@@ -0,0 +1,332 @@
+import argparse
+import logging
+import os
+import time
+
+import eval_attack
+import metrics
+import update_routeviews
+import updater
+from as_stats import AS_STATS_DIR, AsStats
+from asn_index import load_asn_index
+from collectors import COLLECTORS, fetch_collectors, merge_collector_updates, tag_points
+from geo_cache import GeoCache, geolite_build_id
+from geo_lookup import GeoLookup, open_city_reader
+from origin_history import ORIGIN_HISTORY_PATH, ORIGIN_RULE_WEIGHTS, OriginHistory
+from json_writer import OUTPUT_COMPACT, OUTPUT_COMPRESSION
+from rib import RIB_CHECKPOINT_PATH, RouteTable
+from route_shards import SHARD_DIR, write_route_shards
+from stage_cache import MISSING, STAGE_CACHE_DIR, StageCache, file_digest, fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineContext:
+    """
+    Langlebiger Zustand der Pipeline: GeoLite-Reader, ASN-Index und Geo-Cache
+    bleiben zwischen den Zyklen geöffnet und werden nur neu geladen, wenn
+    update_geolite.py neue Dateien installiert hat. Die Routing-Tabelle wird
+    aus dem Checkpoint geladen und pro Zyklus inkrementell fortgeschrieben
+    (rib_path=None: jeder Dump wird wie bisher einzeln ausgewertet).
+    Bei mehreren Collectoren werden deren Dumps parallel geholt und zusammengeführt.
+    Stage-Ergebnisse werden mit dem Fingerprint ihrer Eingaben zwischengespeichert
+    (stage_cache_dir=None: ohne Stage-Cache). Die Prefix-Origin-Historie fließt
+    in die Bewertung ein (origin_history_path=None: ohne Historie). Ist ein
+    query_service gesetzt, erhält er nach jedem Publish die neuen Routen.
+    """
+
+    def __init__(self, geo_db_path=updater.geo_db_path_geo, csv_paths=updater.geo_csv_paths,
+                 cache_path=updater.geo_cache_path, routes_path=eval_attack.json_routes,
+                 points_path=eval_attack.json_points, max_distance_km=100, rib_path=RIB_CHECKPOINT_PATH,
+                 shard_dir=SHARD_DIR, collectors=None, stage_cache_dir=STAGE_CACHE_DIR,
+                 origin_history_path=ORIGIN_HISTORY_PATH, as_stats_dir=AS_STATS_DIR):
+        self.geo_db_path = geo_db_path
+        self.csv_paths = (csv_paths,) if isinstance(csv_paths, str) else tuple(csv_paths)
+        self.cache_path = cache_path
+        self.routes_path = routes_path
+        self.points_path = points_path
+        self.max_distance_km = max_distance_km
+        self.shard_dir = shard_dir
+        self.as_stats_dir = as_stats_dir
+        # AS-Statistiken werden zwischen den Zyklen nur für geänderte AS-Pfade fortgeschrieben
+        self.as_stats = AsStats()
+        self.rib_path = rib_path
+        self.route_table = RouteTable.load(rib_path) if rib_path else None
+        self.collectors = collectors or COLLECTORS
+        self.stage_cache = StageCache(stage_cache_dir) if stage_cache_dir else None
+        self.origin_history = OriginHistory(origin_history_path) if origin_history_path else None
+        self.query_service = None
+
+        self.reader = None
+        self.geo_lookup = None
+        self.asn_index = None
+        self.geo_cache = None
+        self._geo_stamp = None
+
+    def _current_stamp(self):
+        """Inode und Änderungszeitpunkt der GeoLite-Dateien; ändern sich nach jedem Refresh"""
+        stamp = []
+        for path in (self.geo_db_path, *self.csv_paths):
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_ino, st.st_mtime))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def request_reload(self):
+        """Erzwingt beim nächsten refresh() das Neuladen (z. B. nach SIGHUP von update_geolite.py)"""
+        self._geo_stamp = None
+
+    def refresh(self):
+        """Öffnet die GeoLite-Ressourcen beim ersten Aufruf bzw. nach einem GeoLite-Update neu"""
+        stamp = self._current_stamp()
+        if self.reader is not None and stamp == self._geo_stamp:
+            return
+        self.close()
+        logger.info("Lade GeoLite-Datenbank und ASN-Index")
+        self.reader = open_city_reader(self.geo_db_path)
+        self.geo_lookup = GeoLookup(self.reader)
+        self.asn_index = load_asn_index(self.csv_paths)
+        self.geo_cache = GeoCache(geolite_build_id(self.reader, self.csv_paths), self.cache_path)
+        self._geo_stamp = stamp
+
+    def close(self):
+        if self.geo_cache is not None:
+            self.geo_cache.close()
+        if self.asn_index is not None:
+            self.asn_index.close()
+        if self.reader is not None:
+            self.reader.close()
+        self.reader = self.geo_lookup = self.asn_index = self.geo_cache = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        if self.origin_history is not None:
+            self.origin_history.close()
+
+
+@metrics.instrumented("fetch")
+def stage_fetch(ctx, update_url=None, interval=None):
+    """fetch: lädt den Dump des Intervalls (ohne Angabe den aktuellsten) und liefert den
+       Pfad zur Quelle für den Parser. Bei mehreren Collectoren: Dict Collector -> bereits
+       geparste Records."""
+    if len(ctx.collectors) > 1 and update_url is None:
+        return fetch_collectors(ctx.collectors, interval) or None
+    if update_url is None and interval is not None:
+        update_url = update_routeviews.update_url_for(ctx.collectors[0], interval)
+    return update_routeviews.fetch_latest_update(update_url, ctx.collectors[0])
+
+
+@metrics.instrumented("parse", records_out=lambda result: len(result[2]))
+def stage_parse(ctx, update_source, source_digest=None):
+    """parse: einmaliger, streamender Durchlauf über den Dump. Mit Routing-Tabelle
+       werden Announcements und Withdrawals als Delta angewendet und die aktuell
+       aktiven Routen geliefert; danach wird ein Checkpoint geschrieben. Ein Dump,
+       der bereits als letzter angewendet wurde (gleicher Digest), wird übersprungen.
+       Mit Prefix-Origin-Historie enthält der RouteStore alle Ankündigungen des Dumps."""
+    if ctx.route_table is not None and source_digest and source_digest == ctx.route_table.last_source:
+        logger.info("Dump bereits in der Routing-Tabelle, Delta wird übersprungen")
+        return _rib_result(ctx, {"announced": 0, "withdrawn": 0}, {}, save=False)
+
+    if isinstance(update_source, dict):
+        return _parse_collectors(ctx, update_source, source_digest)
+
+    logger.info("Lese Updates aus %s", update_source)
+    records = updater.iter_update_records(update_source)
+    if ctx.route_table is None:
+        return updater.ingest_updates(records, ctx.origin_history is not None)
+
+    announcements = {} if ctx.origin_history is not None else None
+    stats, first_as_count = ctx.route_table.apply(records, announcements=announcements)
+    if source_digest:
+        ctx.route_table.mark_applied(source_digest)
+    return _rib_result(ctx, stats, first_as_count, announcements=announcements)
+
+
+def _parse_collectors(ctx, per_collector, source_digest=None):
+    """Führt die Records mehrerer Collectoren zusammen (mit Routing-Tabelle getrennt pro Collector)"""
+    if ctx.route_table is None:
+        return merge_collector_updates({collector: dump.records for collector, dump in per_collector.items()},
+                                       ctx.origin_history is not None)
+
+    announcements = {} if ctx.origin_history is not None else None
+    stats, first_as_count = {"announced": 0, "withdrawn": 0}, {}
+    for collector, dump in per_collector.items():
+        collector_stats, collector_first = ctx.route_table.apply(dump.records, collector, announcements)
+        for key in stats:
+            stats[key] += collector_stats[key]
+        for asn, count in collector_first.items():
+            first_as_count[asn] = first_as_count.get(asn, 0) + count
+    if source_digest:
+        ctx.route_table.mark_applied(source_digest)
+    return _rib_result(ctx, stats, first_as_count, announcements=announcements)
+
+
+def _rib_result(ctx, stats, first_as_count, save=True, announcements=None):
+    if save:
+        ctx.route_table.save(ctx.rib_path)
+    metrics.count(announced=stats["announced"], withdrawn=stats["withdrawn"])
+    logger.info("RIB: %d Announcements, %d Withdrawals, %d aktive Routen",
+                stats["announced"], stats["withdrawn"], len(ctx.route_table))
+    return (ctx.route_table.unique_as(), first_as_count,
+            ctx.route_table.active_routes(announcements=announcements), ctx.route_table.outgoing_counts())
+
+
+@metrics.instrumented("enrich", records_in=lambda ctx, autonomous_systems, *a: len(autonomous_systems))
+def stage_enrich(ctx, autonomous_systems, asn_with_outgoing_routes):
+    """enrich: Geodaten für alle AS mit warmem Reader, Index und Cache"""
+    ctx.refresh()
+    return updater.build_points(autonomous_systems, asn_with_outgoing_routes,
+                                ctx.geo_lookup, ctx.geo_cache, ctx.asn_index)
+
+
+@metrics.instrumented("evaluate", records_in=lambda ctx, routes, *a: len(routes),
+                      records_out=lambda result: len(result[0]))
+def stage_evaluate(ctx, routes, points):
+    """evaluate: Abgleich mit der Prefix-Origin-Historie, Geo-Filter und is_legit-Scoring im Speicher"""
+    ctx.refresh()
+    rules = ()
+    if ctx.origin_history is not None:
+        rules = eval_attack.origin_rules(ctx.origin_history.observe(routes))
+    return eval_attack.evaluate_routes(routes, points, ctx.asn_index, ctx.max_distance_km, rules)
+
+
+@metrics.instrumented("publish", records_in=lambda ctx, routes, *a: len(routes))
+def stage_publish(ctx, routes, points):
+    """publish: schreibt routes.json, die Routen-Shards pro Start-AS, die AS-Statistiken
+       (durchquerte AS pro Start-AS und AS-Adjazenzgraph) und points.json genau einmal
+       pro Zyklus. Erst hier entstehen aus dem RouteStore Dictionaries.
+       Danach tauscht der Abfragedienst (falls vorhanden) seinen Index aus."""
+    store = routes
+    ctx.as_stats.publish(store, ctx.as_stats_dir)
+    routes = store.to_routes()
+    updater.save_routes(routes, ctx.routes_path)
+    write_route_shards(routes, ctx.shard_dir)
+    updater.save_points(points, ctx.points_path)
+    if ctx.query_service is not None:
+        ctx.query_service.publish(store)
+
+
+def run_cycle(ctx, update_url=None, update_source=None, profile=False, interval=None):
+    """
+    Führt einen vollständigen Zyklus fetch → parse → enrich → evaluate → publish aus.
+    Mit interval wird der Dump dieses 15-Minuten-Intervalls geladen statt des aktuellsten.
+    Die Metriken aller Stages werden danach als JSON-Zeile und Prometheus-Textfile
+    geschrieben; mit profile=True zusätzlich cProfile- und tracemalloc-Daten.
+    """
+    started = time.time()
+    result = None
+    try:
+        with metrics.profiled(profile):
+            result = _run_stages(ctx, update_url, update_source, interval)
+    finally:
+        metrics.write_metrics(metrics.collect(), {
+            "source": update_source or update_url or ",".join(ctx.collectors),
+            "interval": interval.strftime("%Y%m%d.%H%M") if interval else None,
+            "skipped": result is None,
+            "duration_s": round(time.time() - started, 3),
+        })
+    return result
+
+
+def source_fingerprint(update_source):
+    """Digest der Eingabe: SHA-256 der Dump-Datei bzw. aller Collector-Dumps"""
+    if isinstance(update_source, dict):
+        return fingerprint("collectors", sorted((collector, dump.digest) for collector, dump in update_source.items()))
+    return file_digest(update_source)
+
+
+def _cached(ctx, stage, key, func, *args):
+    """Führt func nur aus, wenn für den Fingerprint noch kein Artefakt vorliegt"""
+    if ctx.stage_cache is None:
+        return func(*args)
+    result = ctx.stage_cache.load(stage, key)
+    if result is MISSING:
+        result = func(*args)
+        ctx.stage_cache.store(stage, key, result)
+        metrics.count(stage_cache_misses=1)
+    else:
+        metrics.count(stage_cache_hits=1)
+    return result
+
+
+def _run_stages(ctx, update_url, update_source, interval=None):
+    if update_source is None:
+        update_source = stage_fetch(ctx, update_url, interval)
+    if not update_source:
+        logger.info("Kein Update verfügbar, Zyklus übersprungen")
+        return None
+
+    multi_collector = isinstance(update_source, dict)
+    source_digest = source_fingerprint(update_source)
+
+    # Fingerprints aller Stages vorab bestimmen. Mit Routing-Tabelle hängt das Ergebnis
+    # vom Zustand ab: Fingerprint ist der Zustand nach Anwenden des Dumps, das Delta
+    # selbst steckt im Checkpoint. Da sich dieser Zustand nicht wiederholt, werden dann
+    # auch Enrich und Evaluate nicht als Artefakt abgelegt, nur die Publish-Markierung.
+    if ctx.route_table is not None:
+        parse_key = fingerprint("parse-rib", ctx.route_table.state_after(source_digest))
+    else:
+        parse_key = fingerprint("parse", source_digest, ctx.origin_history is not None)
+    ctx.refresh()
+    enrich_key = fingerprint("enrich", parse_key, ctx.geo_cache.build_id, multi_collector)
+    evaluate_key = fingerprint("evaluate", enrich_key, ctx.max_distance_km,
+                               ORIGIN_RULE_WEIGHTS if ctx.origin_history is not None else None)
+    publish_key = fingerprint("publish", evaluate_key, ctx.routes_path, ctx.points_path, ctx.shard_dir,
+                              ctx.as_stats_dir, OUTPUT_COMPRESSION, OUTPUT_COMPACT)
+
+    cache = ctx.stage_cache
+    if (cache is not None and cache.has("publish", publish_key)
+            and os.path.exists(ctx.routes_path) and os.path.exists(ctx.points_path)):
+        logger.info("Eingaben seit dem letzten Zyklus unverändert, routes.json und points.json bleiben bestehen")
+        metrics.count(stage_cache_hits=1)
+        return None
+
+    def cached(stage, key, func, *args):
+        if ctx.route_table is not None:
+            return func(*args)
+        return _cached(ctx, stage, key, func, *args)
+
+    def parse_and_enrich():
+        parsed = cached("parse", parse_key, stage_parse, ctx, update_source, source_digest)
+        unique_as, _first_as_count, routes, asn_with_outgoing_routes = parsed
+
+        def enrich():
+            points = stage_enrich(ctx, unique_as, asn_with_outgoing_routes)
+            if multi_collector:
+                tag_points(points, routes)
+            return points
+
+        points = cached("enrich", enrich_key, enrich)
+        return stage_evaluate(ctx, routes, points)
+
+    routes, points = cached("evaluate", evaluate_key, parse_and_enrich)
+    stage_publish(ctx, routes, points)
+    if cache is not None:
+        cache.store("publish", publish_key, True)
+    return routes, points
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Führt einen Pipeline-Zyklus im selben Prozess aus")
+    parser.add_argument("--source", help="Bereits vorhandener Dump (updates.txt oder .bz2) statt Download")
+    parser.add_argument("--url", help="URL eines bestimmten Update-Dumps")
+    parser.add_argument("--no-rib", action="store_true", help="Dump einzeln auswerten statt die Routing-Tabelle fortzuschreiben")
+    parser.add_argument("--profile", action="store_true", help="Zyklus mit cProfile und tracemalloc profilieren")
+    parser.add_argument("--no-cache", action="store_true", help="Stage-Cache nicht verwenden (alle Stages neu berechnen)")
+    parser.add_argument("--no-history", action="store_true", help="Ohne Prefix-Origin-Historie bewerten")
+    args = parser.parse_args()
+
+    metrics.setup_logging()
+    with PipelineContext(rib_path=None if args.no_rib else RIB_CHECKPOINT_PATH,
+                         stage_cache_dir=None if args.no_cache else STAGE_CACHE_DIR,
+                         origin_history_path=None if args.no_history else ORIGIN_HISTORY_PATH) as ctx:
+        run_cycle(ctx, update_url=args.url, update_source=args.source, profile=args.profile)
+
+
+if __name__ == "__main__":
+    main()
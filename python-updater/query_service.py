@@ -0,0 +1,322 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+import metrics
+from json_writer import dumps_compact
+from route_store import RouteStore, parse_address
+
+# Adresse des Abfragedienstes (per Umgebungsvariable überschreibbar)
+QUERY_HOST = os.getenv("QUERY_HOST", "127.0.0.1")
+QUERY_PORT = int(os.getenv("QUERY_PORT", "3001"))
+# Seitengröße: Standard und Obergrenze pro Anfrage
+QUERY_DEFAULT_LIMIT = 100
+QUERY_MAX_LIMIT = int(os.getenv("QUERY_MAX_LIMIT", "1000"))
+# Eigenständiger Betrieb: so oft (Sekunden) wird routes.json auf Änderungen geprüft
+QUERY_RELOAD_INTERVAL = int(os.getenv("QUERY_RELOAD_INTERVAL", "30"))
+ROUTES_PATH = "../data/routes.json"
+
+_ADDRESS_BITS = {4: 32, 6: 128}
+_LOW_MASK = (1 << 64) - 1
+# Schlüssel des Prefix-Index: Familie, Netz (128 Bit), Länge als 18 Byte big-endian.
+# Sortiert liegen alle more-specifics eines Prefix direkt hinter ihm.
+_PREFIX_KEY = np.dtype([("family", "u1"), ("hi", ">u8"), ("lo", ">u8"), ("length", "u1")])
+_PREFIX_KEY_BYTES = np.dtype(f"S{_PREFIX_KEY.itemsize}")
+
+logger = logging.getLogger(__name__)
+
+
+class QueryError(ValueError):
+    """Ungültiger Abfrageparameter (HTTP 400)"""
+
+
+def _group(keys):
+    """
+    Invertierter Index über eine Schlüsselspalte: (eindeutige Schlüssel, Offsets,
+    Zeilen). Die Zeilen zum Schlüssel unique[i] sind rows[offsets[i]:offsets[i + 1]],
+    aufsteigend sortiert.
+    """
+    rows = np.argsort(keys, kind="stable")
+    unique, starts = np.unique(keys[rows], return_index=True)
+    return unique, np.append(starts, len(keys)), rows
+
+
+def _prefix_keys(family, hi, lo, length):
+    keys = np.zeros(len(family), dtype=_PREFIX_KEY)
+    keys["family"], keys["hi"], keys["lo"], keys["length"] = family, hi, lo, length
+    return keys.view(_PREFIX_KEY_BYTES)
+
+
+def _network(family, value, length):
+    """(hi, lo) des Netzes einer Adresse bei gegebener Prefix-Länge, wie im RouteStore abgelegt"""
+    host_bits = _ADDRESS_BITS[family] - length
+    value = value >> host_bits << host_bits
+    return value >> 64, value & _LOW_MASK
+
+
+def parse_prefix(text):
+    """(Familie, Adresse, Länge) eines Prefix "a/len" oder QueryError"""
+    address, _, length = text.partition("/")
+    parsed = parse_address(address)
+    if parsed is None or not length.isdigit() or int(length) > _ADDRESS_BITS[parsed[0]]:
+        raise QueryError(f"Ungültiger Prefix: {text}")
+    return parsed[0], parsed[1], int(length)
+
+
+class RouteIndex:
+    """
+    Unveränderliche Indizes über die Routen eines Zyklus (RouteStore):
+      origin  – Origin-AS (letztes AS im Pfad) -> Routen
+      transit – ASN -> Pfade, in denen sie irgendwo vorkommt (als Maske auf die Routen)
+      prefix  – sortierte Prefix-Schlüssel: exakter Prefix und more-specifics als
+                Bereich, alle Prefixe, die eine IP enthalten, per Suche über die
+                vorkommenden Prefix-Längen (Longest-Prefix-Match und weniger spezifische)
+    Nach dem Aufbau wird nichts mehr verändert, Abfragen brauchen also keine Sperren.
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.built_at = time.time()
+        self.origins = _group(routes.target_as())
+
+        path_offsets = routes.path_offsets
+        owners = np.repeat(np.arange(len(path_offsets) - 1), np.diff(path_offsets))
+        # Paare (ASN, Pfad) sortiert, jedes nur einmal (Prepending)
+        order = np.lexsort((owners, routes.path_asns))
+        asns, owners = routes.path_asns[order], owners[order]
+        distinct = np.ones(len(order), dtype=bool)
+        distinct[1:] = (asns[1:] != asns[:-1]) | (owners[1:] != owners[:-1])
+        asns, owners = asns[distinct], owners[distinct]
+        unique, starts = np.unique(asns, return_index=True)
+        self.transit = (unique, np.append(starts, len(asns)), owners)
+        self.path_count = len(path_offsets) - 1
+
+        family = routes.prefix_family
+        self.prefixes = _group(_prefix_keys(family, routes.prefix_hi, routes.prefix_lo, routes.prefix_len))
+        self.prefix_lengths = {f: np.unique(routes.prefix_len[family == f]).tolist() for f in _ADDRESS_BITS}
+
+    def __len__(self):
+        return len(self.routes)
+
+    @staticmethod
+    def _rows(group, key):
+        unique, offsets, rows = group
+        position = int(np.searchsorted(unique, key))
+        if position < len(unique) and unique[position] == key:
+            return rows[offsets[position]:offsets[position + 1]]
+        return rows[:0]
+
+    def by_origin(self, asn):
+        code = self.routes.asn_code(asn)
+        return self.origins[2][:0] if code is None else self._rows(self.origins, code)
+
+    def transit_mask(self, asn):
+        """Boolesche Maske über alle Routen, deren Pfad die ASN enthält"""
+        code = self.routes.asn_code(asn)
+        paths = np.zeros(self.path_count, dtype=bool)
+        if code is not None:
+            paths[self._rows(self.transit, code)] = True
+        return paths[self.routes.path_id]
+
+    def by_prefix(self, text, more_specific=False):
+        """Routen mit genau diesem Prefix bzw. zusätzlich allen more-specifics"""
+        family, value, length = parse_prefix(text)
+        hi, lo = _network(family, value, length)
+        low = _prefix_keys([family], [hi], [lo], [length])
+        if not more_specific:
+            return self._rows(self.prefixes, low[0])
+        last_hi, last_lo = _network(family, value | ((1 << (_ADDRESS_BITS[family] - length)) - 1), _ADDRESS_BITS[family])
+        high = _prefix_keys([family], [last_hi], [last_lo], [255])
+        unique, offsets, rows = self.prefixes
+        first, last = np.searchsorted(unique, low[0], side="left"), np.searchsorted(unique, high[0], side="right")
+        return np.sort(rows[offsets[first]:offsets[last]])
+
+    def covering(self, ip):
+        """Routen, deren Prefix die IP enthält (alle vorkommenden Prefix-Längen)"""
+        parsed = parse_address(ip)
+        if parsed is None:
+            raise QueryError(f"Ungültige IP-Adresse: {ip}")
+        family, value = parsed
+        lengths = self.prefix_lengths[family]
+        networks = [_network(family, value, length) for length in lengths]
+        keys = _prefix_keys([family] * len(lengths), [hi for hi, _ in networks], [lo for _, lo in networks], lengths)
+        unique, offsets, rows = self.prefixes
+        positions = np.minimum(np.searchsorted(unique, keys), max(len(unique) - 1, 0))
+        found = positions[unique[positions] == keys] if len(unique) else positions[:0]
+        if not len(found):
+            return rows[:0]
+        return np.sort(np.concatenate([rows[offsets[p]:offsets[p + 1]] for p in found.tolist()]))
+
+    def query(self, origin=None, transit=None, prefix=None, more_specific=False, ip=None,
+              since=None, until=None, offset=0, limit=QUERY_DEFAULT_LIMIT):
+        """
+        Gefilterte, seitenweise Abfrage; alle Filter werden kombiniert (UND).
+        Gibt (Gesamtanzahl, Routen der Seite als Dictionaries wie in routes.json) zurück.
+        """
+        candidates = []
+        if origin is not None:
+            candidates.append(self.by_origin(origin))
+        if prefix is not None:
+            candidates.append(self.by_prefix(prefix, more_specific))
+        if ip is not None:
+            candidates.append(self.covering(ip))
+
+        if candidates:
+            # Mit der kleinsten Kandidatenmenge beginnen, die übrigen als Maske anwenden
+            candidates.sort(key=len)
+            selected = candidates[0]
+            for other in candidates[1:]:
+                mask = np.zeros(len(self), dtype=bool)
+                mask[other] = True
+                selected = selected[mask[selected]]
+            if transit is not None:
+                selected = selected[self.transit_mask(transit)[selected]]
+        elif transit is not None:
+            selected = np.flatnonzero(self.transit_mask(transit))
+        else:
+            selected = np.arange(len(self))
+
+        if since is not None or until is not None:
+            timestamps = self.routes.timestamp[selected]
+            keep = np.ones(len(selected), dtype=bool)
+            if since is not None:
+                keep &= timestamps >= since
+            if until is not None:
+                keep &= timestamps < until
+            selected = selected[keep]
+
+        page = selected[offset:offset + limit]
+        return len(selected), list(self.routes.select(page).iter_routes())
+
+
+@metrics.instrumented("query_index", records_in=lambda routes: len(routes))
+def build_route_index(routes):
+    return RouteIndex(routes)
+
+
+class QueryService:
+    """
+    Hält den Index des letzten Zyklus. publish() baut den neuen Index neben dem
+    alten auf und tauscht danach nur die Referenz aus; laufende Abfragen arbeiten
+    mit dem Index weiter, den sie zu Beginn gelesen haben, und warten nie auf
+    die Verarbeitung.
+    """
+
+    def __init__(self):
+        self.index = None
+
+    def publish(self, routes):
+        index = build_route_index(routes)
+        self.index = index
+        logger.info("Abfrage-Index getauscht: %d Routen", len(index))
+
+    def load_routes_file(self, routes_path=ROUTES_PATH):
+        """Baut den Index aus einer routes.json (Start bzw. eigenständiger Betrieb)"""
+        with open(routes_path, "r", encoding="utf-8") as f:
+            self.publish(RouteStore.from_routes(json.load(f)))
+
+    def serve(self, host=QUERY_HOST, port=QUERY_PORT):
+        """Startet den HTTP-Server in einem Hintergrund-Thread und gibt ihn zurück"""
+        server = ThreadingHTTPServer((host, port), QueryHandler)
+        server.daemon_threads = True
+        server.service = self
+        threading.Thread(target=server.serve_forever, name="query-service", daemon=True).start()
+        logger.info("Abfragedienst läuft unter http://%s:%d", *server.server_address[:2])
+        return server
+
+
+def _params(query):
+    """Abfrageparameter (jeweils der letzte Wert) mit geprüften Zahlen"""
+    params = {key: values[-1] for key, values in parse_qs(query).items()}
+
+    def number(name, convert, default=None, minimum=None):
+        if name not in params:
+            return default
+        try:
+            value = convert(params[name])
+        except ValueError:
+            raise QueryError(f"Ungültiger Wert für {name}: {params[name]}") from None
+        if minimum is not None and value < minimum:
+            raise QueryError(f"{name} muss mindestens {minimum} sein")
+        return value
+
+    return {
+        "origin": params.get("origin"),
+        "transit": params.get("transit"),
+        "prefix": params.get("prefix"),
+        "more_specific": params.get("more_specific", "").lower() in ("1", "true", "yes"),
+        "ip": params.get("ip"),
+        "since": number("since", float),
+        "until": number("until", float),
+        "offset": number("offset", int, 0, 0),
+        "limit": min(number("limit", int, QUERY_DEFAULT_LIMIT, 1), QUERY_MAX_LIMIT),
+    }
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    GET /routes?origin=&transit=&prefix=&more_specific=&ip=&since=&until=&offset=&limit=
+    GET /health
+    """
+
+    def _send(self, status, body):
+        data = dumps_compact(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        index = self.server.service.index
+        if url.path == "/health":
+            return self._send(200, {"routes": len(index) if index else 0,
+                                    "built_at": index.built_at if index else None})
+        if url.path != "/routes":
+            return self._send(404, {"error": "Unbekannter Endpunkt"})
+        if index is None:
+            return self._send(503, {"error": "Noch kein Index geladen"})
+        try:
+            params = _params(url.query)
+            total, routes = index.query(**params)
+        except QueryError as e:
+            return self._send(400, {"error": str(e)})
+        self._send(200, {"total": total, "offset": params["offset"], "limit": params["limit"],
+                         "built_at": index.built_at, "routes": routes})
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Abfragedienst über die Routen des letzten Zyklus")
+    parser.add_argument("--routes", default=ROUTES_PATH, help="routes.json, die bei Änderungen neu geladen wird")
+    parser.add_argument("--host", default=QUERY_HOST)
+    parser.add_argument("--port", type=int, default=QUERY_PORT)
+    args = parser.parse_args()
+
+    metrics.setup_logging()
+    service = QueryService()
+    service.serve(args.host, args.port)
+    loaded = None
+    while True:
+        try:
+            stamp = os.path.getmtime(args.routes)
+            if stamp != loaded:
+                service.load_routes_file(args.routes)
+                loaded = stamp
+        except (OSError, ValueError) as e:
+            logger.warning("routes.json nicht lesbar: %s", e)
+        time.sleep(QUERY_RELOAD_INTERVAL)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+import hashlib
+import logging
+import os
+import pickle
+from array import array
+
+import numpy as np
+
+from route_store import ROUTE_COLUMNS, RouteStore, RouteStoreBuilder
+
+# Standardpfad für den Checkpoint der Routing-Tabelle; daneben liegt das Journal (<pfad>.journal)
+RIB_CHECKPOINT_PATH = "../data/cache/rib.pickle"
+RIB_CHECKPOINT_VERSION = 4
+# Nach so vielen Journal-Einträgen (Zyklen) wird wieder ein vollständiger Snapshot geschrieben
+RIB_SNAPSHOT_EVERY = int(os.getenv("RIB_SNAPSHOT_EVERY", "96"))
+
+logger = logging.getLogger(__name__)
+
+
+class RouteTable:
+    """
+    Persistente Routing-Tabelle mit Schlüssel (Peer-IP, Prefix, Collector).
+    Jeder Dump wird als Delta angewendet: A-Records ersetzen die Route des
+    Peers für das Prefix, W-Records entfernen sie. Zusätzlich werden pro
+    AS-Pfad die aktiven Routen, die Zähler für AS und Start-AS sowie eine
+    Zeile pro Pfad für den RouteStore inkrementell gepflegt, sodass der
+    Aufwand pro Zyklus nur von der Anzahl der Updates abhängt. Checkpoints
+    hängen nur die Änderungen an ein Journal an; ein vollständiger Snapshot
+    wird alle RIB_SNAPSHOT_EVERY Zyklen geschrieben.
+    """
+
+    def __init__(self):
+        # (peer_ip, prefix, collector) -> (timestamp, peer_as, as_path, additional_info)
+        self.routes = {}
+        # as_path -> (gemeinsames Pfad-Tupel, {(peer_ip, prefix, collector): None});
+        # die Einfügereihenfolge bestimmt die Repräsentanten-Route des Pfads
+        self.path_routes = {}
+        # ASN -> Anzahl aktiver AS-Pfade, die das AS enthalten
+        self.as_refs = {}
+        # Start-AS -> Anzahl aktiver AS-Pfade, die mit diesem AS beginnen
+        self.outgoing = {}
+        # Digest des zuletzt angewendeten Dumps und Kennung des daraus entstandenen Zustands
+        self.last_source = None
+        self.state_id = "empty"
+
+        # Änderungen seit dem letzten Checkpoint in Reihenfolge: (Schlüssel, Route bzw. None für entfernt)
+        self._changes = []
+        # Snapshot-Generation; Journal-Einträge gelten nur für den Snapshot derselben Generation
+        self._generation = 0
+        self._journal_entries = 0
+        # Zeilen für active_routes: eine pro Pfad, Pfade mit Änderungen werden beim nächsten Aufruf neu geschrieben
+        self._rows = None
+        self._row_alive = None
+        self._path_rows = {}
+        # Pfade mit Änderungen seit dem letzten active_routes; neue Pfade in der Reihenfolge ihres Entstehens
+        self._dirty_paths = {}
+
+    def __len__(self):
+        return len(self.routes)
+
+    def _add_path_ref(self, as_path, key):
+        """Registriert die Route beim Pfad und liefert das gemeinsame Pfad-Tupel"""
+        entry = self.path_routes.get(as_path)
+        if entry is None:
+            entry = self.path_routes[as_path] = (as_path, {})
+            self._dirty_paths.pop(as_path, None)
+            self._dirty_paths[as_path] = None
+            for asn in set(as_path):
+                self.as_refs[asn] = self.as_refs.get(asn, 0) + 1
+            self.outgoing[as_path[0]] = self.outgoing.get(as_path[0], 0) + 1
+        entry[1][key] = None
+        return entry[0]
+
+    def _remove_path_ref(self, as_path, key):
+        entry = self.path_routes.get(as_path)
+        if entry is None:
+            return
+        keys = entry[1]
+        keys.pop(key, None)
+        if keys:
+            return
+        # Letzte Route mit diesem Pfad entfernt: Zähler zurücknehmen und Zeile verwerfen
+        # (wird der Pfad wieder aktiv, bekommt er wie in path_routes einen Platz am Ende)
+        del self.path_routes[as_path]
+        row = self._path_rows.pop(as_path, None)
+        if row is not None:
+            self._row_alive[row] = 0
+        for asn in set(as_path):
+            if self.as_refs[asn] == 1:
+                del self.as_refs[asn]
+            else:
+                self.as_refs[asn] -= 1
+        if self.outgoing[as_path[0]] == 1:
+            del self.outgoing[as_path[0]]
+        else:
+            self.outgoing[as_path[0]] -= 1
+
+    def apply(self, records, collector=None, announcements=None):
+        """
+        Wendet bgpdump-kompatible Update-Records als Delta an. Bei mehreren
+        Collectoren werden die Routen getrennt pro Collector geführt.
+        Gibt Statistiken sowie die Häufigkeit des ersten AS in den A-Records zurück.
+        Ist announcements ein Dict, wird es mit (Prefix, AS-Pfad) -> erster
+        Zeitstempel aller A-Records des Deltas gefüllt.
+        """
+        stats = {"announced": 0, "withdrawn": 0, "ignored": 0}
+        first_as_count = {}
+
+        for parts in records:
+            status = parts[2] if len(parts) > 2 else None
+            if status == "W" and len(parts) > 5:
+                key = (parts[3], parts[5], collector)
+                old = self.routes.pop(key, None)
+                if old is not None:
+                    self._remove_path_ref(old[2], key)
+                    self._changes.append((key, None))
+                    self._dirty_paths[old[2]] = None
+                stats["withdrawn"] += 1
+                continue
+
+            if status != "A" or len(parts) <= 6:
+                stats["ignored"] += 1
+                continue
+            as_list = parts[6].split()
+            if not as_list:
+                stats["ignored"] += 1
+                continue
+
+            first_as_count[as_list[0]] = first_as_count.get(as_list[0], 0) + 1
+            key = (parts[3], parts[5], collector)
+            as_path = tuple(as_list)
+            old = self.routes.get(key)
+            if old is not None and old[2] == as_path:
+                as_path = old[2]
+            else:
+                if old is not None:
+                    self._remove_path_ref(old[2], key)
+                    self._dirty_paths[old[2]] = None
+                # Gemeinsames Pfad-Tupel wiederverwenden, um Speicher zu sparen
+                as_path = self._add_path_ref(as_path, key)
+            additional_info = parts[11] if len(parts) > 11 else None
+            route = self.routes[key] = (parts[1], parts[4], as_path, additional_info)
+            self._changes.append((key, route))
+            self._dirty_paths[as_path] = None
+            if announcements is not None:
+                announcements.setdefault((parts[5], as_path), parts[1])
+            stats["announced"] += 1
+
+        return stats, first_as_count
+
+    def state_after(self, source_digest):
+        """Zustandskennung nach Anwenden des Dumps; verkettet die Digests aller bisherigen Dumps"""
+        if source_digest == self.last_source:
+            return self.state_id
+        return hashlib.sha256(f"{self.state_id}:{source_digest}".encode("ascii")).hexdigest()
+
+    def mark_applied(self, source_digest):
+        """Vermerkt den angewendeten Dump"""
+        self.state_id = self.state_after(source_digest)
+        self.last_source = source_digest
+
+    def unique_as(self):
+        """Alle AS, die in mindestens einer aktiven Route vorkommen (sortiert)"""
+        return sorted(self.as_refs)
+
+    def outgoing_counts(self):
+        """Anzahl eindeutiger aktiver AS-Pfade pro Start-AS"""
+        return dict(self.outgoing)
+
+    def _write_row(self, as_path):
+        """Schreibt die Zeile eines Pfads (Repräsentant = erste Route, alle Collectoren) bzw. entfernt sie"""
+        entry = self.path_routes.get(as_path)
+        if entry is None:
+            return
+        row = self._path_rows.get(as_path)
+        keys = entry[1]
+        key = next(iter(keys))
+        timestamp, peer_as, _, additional_info = self.routes[key]
+        values = (as_path, timestamp, key[0], peer_as, key[1], additional_info, [k[2] for k in keys])
+        if row is None:
+            self._path_rows[as_path] = self._rows.add(*values)
+            self._row_alive.append(1)
+        else:
+            self._rows.replace(row, *values)
+
+    def _sync_rows(self):
+        """
+        Bringt die Zeilen auf den Stand der Tabelle: nur Pfade mit Änderungen seit dem letzten
+        Aufruf werden geschrieben. Beim ersten Aufruf (z. B. nach dem Laden) und wenn mehr als
+        die Hälfte der Zeilen bzw. internierten Pfade veraltet ist, wird neu aufgebaut.
+        """
+        rows = self._rows
+        live = len(self.path_routes)
+        if rows is None or len(rows) > 2 * live + 1024 or len(rows.path_hits) > 4 * live + 4096:
+            self._rows = RouteStoreBuilder()
+            self._row_alive = array("B")
+            self._path_rows = {}
+            for as_path in self.path_routes:
+                self._write_row(as_path)
+        else:
+            for as_path in self._dirty_paths:
+                self._write_row(as_path)
+        self._dirty_paths.clear()
+
+    def active_routes(self, is_legit=0, announcements=None):
+        """
+        Aktive Routen, nach AS-Pfad dedupliziert, als RouteStore (in der Reihenfolge,
+        in der die Pfade aktiv wurden). Stammen die Routen von benannten Collectoren,
+        listet 'collectors' deren Quellen. announcements (aus apply) werden als
+        Ankündigungen des Zyklus übernommen. Der Store ist eine Kopie der Zeilen und
+        bleibt gültig, wenn die Tabelle weiter verändert wird.
+        """
+        self._sync_rows()
+        rows = self._rows
+        cycle_announcements = None
+        if announcements is not None:
+            cycle_announcements = {}
+            for (prefix, as_path), timestamp in announcements.items():
+                cycle_announcements.setdefault((prefix, rows.intern_path(as_path)), timestamp)
+
+        alive = _copy(self._row_alive, np.uint8).view(bool)
+        columns = {name: _copy(rows.columns[name], dtype, alive) for name, _, dtype in ROUTE_COLUMNS}
+        if is_legit:
+            columns["is_legit"][:] = is_legit
+        return RouteStore(columns, _copy(rows.path_offsets, np.int64), _copy(rows.path_asns, np.int64),
+                          _copy(rows.path_hits, np.int64), list(rows.texts), list(rows.peers), list(rows.infos),
+                          list(rows.collectors), cycle_announcements)
+
+    def _snapshot_state(self):
+        return (RIB_CHECKPOINT_VERSION, self._generation, self.routes, self.path_routes, self.as_refs,
+                self.outgoing, self.last_source, self.state_id)
+
+    def save(self, path=RIB_CHECKPOINT_PATH):
+        """
+        Sichert die Änderungen seit dem letzten Checkpoint als Eintrag im Journal; nach
+        RIB_SNAPSHOT_EVERY Einträgen (oder ohne Snapshot) wird stattdessen ein vollständiger
+        Snapshot geschrieben (temporäre Datei + atomares Umbenennen) und das Journal geleert.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        journal_path = path + ".journal"
+        if self._generation == 0 or self._journal_entries >= RIB_SNAPSHOT_EVERY or not os.path.exists(path):
+            # Neue Generation: Einträge eines alten Journals passen nicht mehr zum Snapshot
+            self._generation += 1
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(self._snapshot_state(), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            if os.path.exists(journal_path):
+                os.remove(journal_path)
+            self._journal_entries = 0
+        else:
+            with open(journal_path, "ab") as f:
+                pickle.dump((self._generation, self._changes, self.last_source, self.state_id),
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+            self._journal_entries += 1
+        self._changes = []
+
+    def _replay(self, changes):
+        """Wendet die Änderungen eines Journal-Eintrags in derselben Reihenfolge wie apply an"""
+        for key, route in changes:
+            if route is None:
+                old = self.routes.pop(key, None)
+                if old is not None:
+                    self._remove_path_ref(old[2], key)
+                continue
+            old = self.routes.get(key)
+            timestamp, peer_as, as_path, additional_info = route
+            if old is not None and old[2] == as_path:
+                as_path = old[2]
+            else:
+                if old is not None:
+                    self._remove_path_ref(old[2], key)
+                as_path = self._add_path_ref(as_path, key)
+            self.routes[key] = (timestamp, peer_as, as_path, additional_info)
+
+    def _replay_journal(self, journal_path):
+        """Spielt die Journal-Einträge der aktuellen Generation ein; ein abgeschnittenes Ende wird entfernt"""
+        try:
+            f = open(journal_path, "r+b")
+        except OSError:
+            return
+        with f:
+            valid_end = 0
+            while True:
+                try:
+                    generation, changes, last_source, state_id = pickle.load(f)
+                except EOFError:
+                    break
+                except (pickle.UnpicklingError, ValueError, TypeError, AttributeError) as e:
+                    logger.warning("RIB-Journal %s ab Byte %d unlesbar (%s), Rest wird verworfen.",
+                                   journal_path, valid_end, e)
+                    f.truncate(valid_end)
+                    break
+                valid_end = f.tell()
+                if generation != self._generation:
+                    continue
+                self._replay(changes)
+                self.last_source, self.state_id = last_source, state_id
+                self._journal_entries += 1
+
+    @classmethod
+    def load(cls, path=RIB_CHECKPOINT_PATH):
+        """Lädt Snapshot und Journal; ohne (gültigen) Snapshot wird eine leere Tabelle geliefert"""
+        table = cls()
+        try:
+            with open(path, "rb") as f:
+                version, *state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError) as e:
+            if os.path.exists(path):
+                logger.warning("RIB-Checkpoint %s nicht lesbar (%s), starte mit leerer Tabelle.", path, e)
+            return table
+        if version != RIB_CHECKPOINT_VERSION:
+            logger.warning("RIB-Checkpoint %s hat eine alte Version, starte mit leerer Tabelle.", path)
+            return table
+        (table._generation, table.routes, table.path_routes, table.as_refs, table.outgoing,
+         table.last_source, table.state_id) = state
+        table._replay_journal(path + ".journal")
+        return table
+
+
+def _copy(buffer, dtype, keep=None):
+    """Kopie eines array.array-Puffers (optional nur die Elemente der Maske keep) als numpy-Array;
+       die Quelle darf danach weiter wachsen"""
+    if not len(buffer):
+        return np.empty(0, dtype=dtype)
+    values = np.frombuffer(buffer, dtype=dtype)
+    return values[keep] if keep is not None else values.copy()
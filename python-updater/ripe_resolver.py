@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# Endpunkt und Einstellungen (per Umgebungsvariable überschreibbar, z. B. für einen lokalen Stub-Server)
+RIPESTAT_URL = os.getenv("RIPESTAT_URL", "https://stat.ripe.net/data/announced-prefixes/data.json")
+RIPE_WORKERS = int(os.getenv("RIPE_WORKERS", "8"))
+RIPE_RATE = float(os.getenv("RIPE_RATE", "8"))  # maximale Anfragen pro Sekunde
+RIPE_TIMEOUT = float(os.getenv("RIPE_TIMEOUT", "10"))  # Sekunden pro Anfrage
+RIPE_TTL = int(os.getenv("RIPE_TTL", str(24 * 3600)))  # Gültigkeit gefundener Prefixe
+RIPE_NEGATIVE_TTL = int(os.getenv("RIPE_NEGATIVE_TTL", str(3600)))  # Gültigkeit von "nichts gefunden"
+RIPE_RETRIES = int(os.getenv("RIPE_RETRIES", "2"))  # Wiederholungen bei Verbindungsfehlern und 429/5xx
+RIPE_BACKOFF = float(os.getenv("RIPE_BACKOFF", "0.5"))  # Wartezeit vor der ersten Wiederholung, verdoppelt sich
+RETRY_STATUS = (429, 500, 502, 503, 504)
+RIPE_CACHE_PATH = "../data/cache/ripestat.sqlite"
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Einfacher, threadsicherer Limiter: höchstens 'rate' Freigaben pro Sekunde"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class RipeResolver:
+    """
+    Löst ASNs gebündelt über den RIPEstat-Endpunkt 'announced-prefixes' auf.
+    Anfragen laufen parallel über eine gemeinsame Session mit Connection-Pool,
+    werden auf RIPE_RATE Anfragen pro Sekunde begrenzt und inklusive negativer
+    Ergebnisse mit TTL in SQLite gecacht. Wiederholungen laufen ebenfalls über
+    den Limiter und zählen gegen das Limit.
+    """
+
+    def __init__(self, url=RIPESTAT_URL, workers=RIPE_WORKERS, rate=RIPE_RATE, timeout=RIPE_TIMEOUT,
+                 ttl=RIPE_TTL, negative_ttl=RIPE_NEGATIVE_TTL, cache_path=RIPE_CACHE_PATH,
+                 retries=RIPE_RETRIES, backoff=RIPE_BACKOFF):
+        self.url = url
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.limiter = RateLimiter(rate)
+
+        self.session = requests.Session()
+        # Keine Wiederholungen im Adapter: sie würden am RateLimiter vorbei gesendet
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(cache_path, timeout=30)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS ripe_prefixes (asn TEXT PRIMARY KEY, prefixes TEXT, fetched_at REAL)"
+        )
+
+    def _cached(self, asns):
+        """Liefert gültige Cache-Einträge als Dict ASN -> Prefix-Liste oder None"""
+        now = time.time()
+        found = {}
+        for i in range(0, len(asns), 500):
+            chunk = asns[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for asn, prefixes, fetched_at in self.conn.execute(
+                f"SELECT asn, prefixes, fetched_at FROM ripe_prefixes WHERE asn IN ({placeholders})", chunk
+            ):
+                prefixes = json.loads(prefixes) if prefixes else None
+                ttl = self.ttl if prefixes else self.negative_ttl
+                if now - fetched_at < ttl:
+                    found[asn] = prefixes
+        return found
+
+    def _fetch(self, asn):
+        """
+        Anfrage für ein AS mit bis zu self.retries Wiederholungen (Verbindungsfehler,
+        429/5xx); jeder Versuch wartet auf den RateLimiter. Fehler werden wie
+        'nichts gefunden' behandelt, aber nicht gecacht.
+        """
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            self.limiter.wait()
+            try:
+                response = self.session.get(self.url, params={"resource": asn}, timeout=self.timeout)
+                if response.status_code in RETRY_STATUS and attempt < self.retries:
+                    continue
+                response.raise_for_status()
+                prefixes = response.json().get("data", {}).get("prefixes", [])
+                return asn, (prefixes or None), True
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt < self.retries:
+                    continue
+                error = e
+            except (requests.RequestException, ValueError) as e:
+                error = e
+            logger.warning("RIPEstat-Anfrage für AS%s fehlgeschlagen: %s", asn, error)
+            return asn, None, False
+
+    def resolve_many(self, asns):
+        """
+        Liefert ein Dict ASN -> Prefix-Liste (oder None, wenn RIPEstat nichts kennt).
+        ASNs, deren Anfrage fehlgeschlagen ist, fehlen im Ergebnis.
+        """
+        asns = list(dict.fromkeys(str(asn) for asn in asns))
+        results = self._cached(asns)
+        missing = [asn for asn in asns if asn not in results]
+        metrics.count(ripe_cache_hits=len(results), ripe_cache_misses=len(missing))
+        if not missing:
+            return results
+
+        logger.info("Frage %d ASNs bei RIPEstat an (%d aus dem Cache)...", len(missing), len(results))
+        now = time.time()
+        rows = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for asn, prefixes, answered in pool.map(self._fetch, missing):
+                if answered:
+                    results[asn] = prefixes
+                    rows.append((asn, json.dumps(prefixes) if prefixes else None, now))
+
+        self.conn.executemany("INSERT OR REPLACE INTO ripe_prefixes (asn, prefixes, fetched_at) VALUES (?, ?, ?)", rows)
+        self.conn.commit()
+        return results
+
+    def close(self):
+        self.session.close()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
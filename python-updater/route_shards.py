@@ -0,0 +1,123 @@
+import hashlib
+import json
+import logging
+import os
+
+from json_writer import SIDECAR_SUFFIX, dumps_compact, write_bytes_atomic
+
+# Routen, aufgeteilt nach Start-AS, plus Manifest ASN -> {file, count, bytes, digest}
+SHARD_DIR = "../data/routes_by_asn/"
+MANIFEST_FILENAME = "manifest.json"
+
+logger = logging.getLogger(__name__)
+
+
+def shard_filename(asn):
+    return f"AS{asn}.json"
+
+
+def group_routes_by_start_as(routes):
+    """Gruppiert Routen nach dem ersten AS im Pfad (entspricht dem Filter im Frontend)"""
+    groups = {}
+    for route in routes:
+        as_path = route.get("as_path")
+        if as_path:
+            groups.setdefault(str(as_path[0]), []).append(route)
+    return groups
+
+
+def load_manifest(shard_dir=SHARD_DIR):
+    try:
+        with open(os.path.join(shard_dir, MANIFEST_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_route_shards(routes, shard_dir=SHARD_DIR):
+    """
+    Schreibt pro Start-AS eine eigene Routen-Datei und ein Manifest mit
+    Dateiname, Anzahl und Größe (siehe write_shards).
+    Gibt (geschrieben, unverändert, gelöscht) zurück.
+    """
+    return write_shards(group_routes_by_start_as(routes), shard_dir, "Routen-Shards")
+
+
+def _write_shard(asn, content, shard_dir, old_entry, count):
+    """Schreibt die Datei eines ASN, falls sich ihr Inhalt (SHA-1) geändert hat – Rückgabe (Manifest-Eintrag, geschrieben)"""
+    data = dumps_compact(content)
+    digest = hashlib.sha1(data).hexdigest()
+    filename = shard_filename(asn)
+    path = os.path.join(shard_dir, filename)
+    written = not (old_entry and old_entry.get("digest") == digest and os.path.exists(path))
+    if written:
+        write_bytes_atomic(data, path)
+    return {"file": filename, "count": count(content), "bytes": len(data), "digest": digest}, written
+
+
+def _remove_shard(asn, entry, shard_dir):
+    path = os.path.join(shard_dir, entry.get("file", shard_filename(asn)))
+    for suffix in ("",) + tuple(SIDECAR_SUFFIX.values()):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def write_shards(groups, shard_dir, label, count=len):
+    """
+    Schreibt pro ASN eine eigene JSON-Datei aus groups (ASN -> Inhalt) und ein
+    Manifest ASN -> {file, count, bytes, digest}. Dateien, deren Inhalt (SHA-1)
+    sich seit dem letzten Zyklus nicht geändert hat, werden nicht neu geschrieben;
+    Dateien von ASNs, die nicht mehr vorkommen, werden gelöscht.
+    Gibt (geschrieben, unverändert, gelöscht) zurück.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    old_manifest = load_manifest(shard_dir)
+    manifest = {}
+    written = 0
+
+    for asn, content in groups.items():
+        manifest[asn], changed = _write_shard(asn, content, shard_dir, old_manifest.get(asn), count)
+        written += changed
+
+    # Manifest vor dem Aufräumen schreiben: es verweist nur auf vollständige Dateien
+    write_bytes_atomic(dumps_compact(manifest), os.path.join(shard_dir, MANIFEST_FILENAME))
+
+    # Dateien von ASNs entfernen, die nicht mehr vorkommen
+    removed = 0
+    for asn, entry in old_manifest.items():
+        if asn not in manifest:
+            _remove_shard(asn, entry, shard_dir)
+            removed += 1
+
+    unchanged = len(manifest) - written
+    logger.info("%s: %d geschrieben, %d unverändert, %d gelöscht (%s)", label, written, unchanged, removed, shard_dir)
+    return written, unchanged, removed
+
+
+def update_shards(changes, shard_dir, label, count=len):
+    """
+    Wie write_shards, aber nur für die ASNs in changes (ASN -> Inhalt, None = ASN
+    entfernen); alle übrigen Dateien und Manifest-Einträge bleiben unverändert.
+    Gibt (geschrieben, unverändert, gelöscht) zurück.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    manifest = load_manifest(shard_dir)
+    written = unchanged = 0
+    stale = []
+
+    for asn, content in changes.items():
+        if content is None:
+            entry = manifest.pop(asn, None)
+            if entry is not None:
+                stale.append((asn, entry))
+            continue
+        manifest[asn], changed = _write_shard(asn, content, shard_dir, manifest.get(asn), count)
+        written += changed
+        unchanged += not changed
+
+    write_bytes_atomic(dumps_compact(manifest), os.path.join(shard_dir, MANIFEST_FILENAME))
+    for asn, entry in stale:
+        _remove_shard(asn, entry, shard_dir)
+
+    logger.info("%s: %d geschrieben, %d unverändert, %d gelöscht (%s)", label, written, unchanged, len(stale), shard_dir)
+    return written, unchanged, len(stale)
@@ -0,0 +1,449 @@
+import math
+import socket
+from array import array
+
+import numpy as np
+
+# Spalten pro Route: Name, Typcode für array.array beim Aufbau, numpy-Datentyp im fertigen Store
+ROUTE_COLUMNS = (
+    ("path_id", "I", np.uint32),        # Index in die internierten AS-Pfade
+    ("timestamp", "d", np.float64),     # Zeitstempel des Updates (NaN = unbekannt)
+    ("peer_id", "I", np.uint32),        # Index in die Tabelle der Peers
+    ("start_as", "q", np.int64),        # Peer-AS (ASN-Code, siehe asn_code)
+    ("prefix_hi", "Q", np.uint64),      # obere 64 Bit des Netzes (nur IPv6)
+    ("prefix_lo", "Q", np.uint64),      # untere 64 Bit des Netzes bzw. IPv4-Adresse
+    ("prefix_len", "h", np.int16),      # Prefix-Länge
+    ("prefix_family", "B", np.uint8),   # 4, 6 oder 0 (nicht parsebar, prefix_lo = Index in texts)
+    ("info_id", "I", np.uint32),        # Index in die Tabelle der Communities (additional_info)
+    ("collector_mask", "Q", np.uint64),  # Bitmaske der Collectoren, die die Route gesehen haben
+    ("is_legit", "i", np.int32),        # Verdachts-Score
+)
+MAX_COLLECTORS = 64
+
+_LOW_MASK = (1 << 64) - 1
+
+
+def parse_address(text):
+    """(Version, Ganzzahl) einer IPv4-/IPv6-Adresse oder None"""
+    try:
+        if ":" in text:
+            return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, text), "big")
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, text), "big")
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+def format_address(version, value):
+    if version == 6:
+        return socket.inet_ntop(socket.AF_INET6, value.to_bytes(16, "big"))
+    return socket.inet_ntop(socket.AF_INET, value.to_bytes(4, "big"))
+
+
+def _format_timestamp(value):
+    """Zeitstempel wie im Dump: ganze Sekunden bzw. mit Mikrosekunden (BGP4MP_ET)"""
+    if math.isnan(value):
+        return None
+    if value.is_integer():
+        return str(int(value))
+    return f"{value:.6f}"
+
+
+class RouteStoreBuilder:
+    """
+    Baut einen RouteStore spaltenweise in array.array-Puffern auf. ASNs werden
+    als Ganzzahlen gespeichert, AS-Pfade einmalig interniert (Pfad-ID → Offset
+    in ein flaches ASN-Array), Peers, Communities und Collectoren als Tabellen.
+    Mit track_announcements=True werden zusätzlich alle eindeutigen Paare
+    (Prefix, Pfad-ID) der A-Records mit ihrem ersten Zeitstempel gesammelt.
+    """
+
+    def __init__(self, track_announcements=False):
+        self.columns = {name: array(typecode) for name, typecode, _ in ROUTE_COLUMNS}
+        # Pfad i belegt path_asns[path_offsets[i]:path_offsets[i + 1]]
+        self.path_offsets = array("q", [0])
+        self.path_asns = array("q")
+        # Anzahl A-Records pro Pfad (für first_as_count) und erste Route mit diesem Pfad
+        self.path_hits = array("q")
+        self.path_route = array("q")
+        # AS-Pfad als Text -> Pfad-ID (-1 = leerer Pfad)
+        self._path_ids = {}
+        self.texts = []
+        self._text_ids = {}
+        self.peers = []
+        self._peer_ids = {}
+        self.infos = []
+        self._info_ids = {}
+        self.collectors = []
+        self._collector_bits = {}
+        # (Prefix, Pfad-ID) -> Zeitstempel der ersten Ankündigung
+        self.announcements = {} if track_announcements else None
+
+    def __len__(self):
+        return len(self.columns["path_id"])
+
+    def _text_id(self, text):
+        text_id = self._text_ids.get(text)
+        if text_id is None:
+            text_id = self._text_ids[text] = len(self.texts)
+            self.texts.append(text)
+        return text_id
+
+    def asn_code(self, token):
+        """ASN als Ganzzahl; AS_SETs wie "{1,2}" und None werden als negative Codes in texts abgelegt"""
+        if isinstance(token, str) and token.isdigit() and len(token) <= 18 and (token[0] != "0" or token == "0"):
+            return int(token)
+        return -1 - self._text_id(token)
+
+    def _peer_id(self, peer_ip):
+        peer_id = self._peer_ids.get(peer_ip)
+        if peer_id is None:
+            peer_id = self._peer_ids[peer_ip] = len(self.peers)
+            self.peers.append(peer_ip)
+        return peer_id
+
+    def _info_id(self, info):
+        info_id = self._info_ids.get(info)
+        if info_id is None:
+            info_id = self._info_ids[info] = len(self.infos)
+            self.infos.append(info)
+        return info_id
+
+    def collector_bit(self, collector):
+        """Bit des Collectors in collector_mask (0 ohne Collector)"""
+        if collector is None:
+            return 0
+        bit = self._collector_bits.get(collector)
+        if bit is None:
+            if len(self.collectors) >= MAX_COLLECTORS:
+                raise ValueError(f"Höchstens {MAX_COLLECTORS} Collectoren pro RouteStore")
+            bit = self._collector_bits[collector] = 1 << len(self.collectors)
+            self.collectors.append(collector)
+        return bit
+
+    def _prefix_columns(self, prefix):
+        address, _, length = prefix.partition("/") if isinstance(prefix, str) else (None, "", "")
+        parsed = parse_address(address)
+        if parsed is None or not length.isdigit():
+            return 0, self._text_id(prefix), 0, 0
+        version, value = parsed
+        return value >> 64, value & _LOW_MASK, int(length), version
+
+    def intern_path(self, as_path):
+        """Pfad-ID eines AS-Pfads (Folge von ASN-Texten); neue Pfade werden angehängt"""
+        key = " ".join(as_path)
+        path_id = self._path_ids.get(key)
+        if path_id is None:
+            path_id = self._path_ids[key] = self._append_path(as_path, key)
+        return path_id
+
+    def _append_path(self, as_list, key):
+        # Schneller Weg für rein numerische Pfade ohne führende Nullen, sonst Token für Token
+        codes = None
+        if key.replace(" ", "").isdigit() and " 0" not in " " + key:
+            codes = list(map(int, as_list))
+            if codes and max(codes) >= 1 << 62:
+                codes = None
+        self.path_asns.extend(codes if codes is not None else map(self.asn_code, as_list))
+        self.path_offsets.append(len(self.path_asns))
+        self.path_hits.append(0)
+        self.path_route.append(-1)
+        return len(self.path_hits) - 1
+
+    def add(self, as_path, timestamp, peer_ip, peer_as, prefix, additional_info, collectors=(), is_legit=0):
+        """Hängt eine Route an und liefert ihren Index"""
+        path_id = self.intern_path(as_path or ())
+        return self._add_route(path_id, timestamp, peer_ip, peer_as, prefix, additional_info,
+                               sum(self.collector_bit(c) for c in set(collectors)), is_legit)
+
+    def add_announcement(self, prefix, as_path, timestamp):
+        """Vermerkt eine Ankündigung, deren Route nicht im Store liegen muss (z. B. Delta der Routing-Tabelle)"""
+        if self.announcements is not None:
+            self.announcements.setdefault((prefix, self.intern_path(as_path)), timestamp)
+
+    def replace(self, index, as_path, timestamp, peer_ip, peer_as, prefix, additional_info, collectors=(), is_legit=0):
+        """Überschreibt die Route an index (z. B. wenn sich die Repräsentanten-Route eines Pfads ändert)"""
+        try:
+            timestamp = float(timestamp)
+        except (TypeError, ValueError):
+            timestamp = math.nan
+        hi, lo, length, family = self._prefix_columns(prefix)
+        columns = self.columns
+        columns["path_id"][index] = self.intern_path(as_path or ())
+        columns["timestamp"][index] = timestamp
+        columns["peer_id"][index] = self._peer_id(peer_ip)
+        columns["start_as"][index] = self.asn_code(peer_as)
+        columns["prefix_hi"][index] = hi
+        columns["prefix_lo"][index] = lo
+        columns["prefix_len"][index] = length
+        columns["prefix_family"][index] = family
+        columns["info_id"][index] = self._info_id(additional_info)
+        columns["collector_mask"][index] = sum(self.collector_bit(c) for c in set(collectors))
+        columns["is_legit"][index] = is_legit
+
+    def _add_route(self, path_id, timestamp, peer_ip, peer_as, prefix, additional_info, mask, is_legit=0):
+        try:
+            timestamp = float(timestamp)
+        except (TypeError, ValueError):
+            timestamp = math.nan
+        hi, lo, length, family = self._prefix_columns(prefix)
+        columns = self.columns
+        columns["path_id"].append(path_id)
+        columns["timestamp"].append(timestamp)
+        columns["peer_id"].append(self._peer_id(peer_ip))
+        columns["start_as"].append(self.asn_code(peer_as))
+        columns["prefix_hi"].append(hi)
+        columns["prefix_lo"].append(lo)
+        columns["prefix_len"].append(length)
+        columns["prefix_family"].append(family)
+        columns["info_id"].append(self._info_id(additional_info))
+        columns["collector_mask"].append(mask)
+        columns["is_legit"].append(is_legit)
+        index = len(columns["path_id"]) - 1
+        if self.path_route[path_id] < 0:
+            self.path_route[path_id] = index
+        return index
+
+    def ingest(self, records, collector=None):
+        """
+        Einmaliger, streamender Durchlauf über bgpdump-kompatible Update-Records:
+        pro eindeutigem AS-Pfad wird die erste Route (A-Record) übernommen, weitere
+        Records mit demselben Pfad erhöhen nur dessen Zähler und ergänzen den Collector.
+        Gibt die Anzahl gelesener Records zurück.
+        """
+        bit = self.collector_bit(collector)
+        path_ids = self._path_ids
+        path_hits = self.path_hits
+        path_route = self.path_route
+        masks = self.columns["collector_mask"]
+        announcements = self.announcements
+        record_count = 0
+
+        for parts in records:
+            record_count += 1
+            # Nur Announcements mit vorhandenem AS-Pfad sind relevant
+            if len(parts) <= 6 or parts[2] != "A":
+                continue
+            path_text = parts[6]
+            path_id = path_ids.get(path_text)
+            if path_id is None:
+                # Schlüssel ist der Pfad-Text; bei abweichenden Leerzeichen entscheidet die normierte Form
+                as_list = path_text.split()
+                path_id = self.intern_path(as_list) if as_list else -1
+                path_ids[path_text] = path_id
+            if path_id < 0:
+                continue
+
+            path_hits[path_id] += 1
+            if announcements is not None and (parts[5], path_id) not in announcements:
+                announcements[parts[5], path_id] = parts[1]
+            route = path_route[path_id]
+            if route < 0:
+                self._add_route(path_id, parts[1], parts[3], parts[4], parts[5],
+                                parts[11] if len(parts) > 11 else None, bit)
+            elif bit:
+                masks[route] |= bit
+        return record_count
+
+    def build(self):
+        """Friert die Puffer als numpy-Arrays ein (ohne Kopie)"""
+        columns = {name: np.frombuffer(self.columns[name], dtype=dtype) if len(self.columns[name]) else
+                   np.empty(0, dtype=dtype) for name, _, dtype in ROUTE_COLUMNS}
+        return RouteStore(
+            columns,
+            np.frombuffer(self.path_offsets, dtype=np.int64),
+            np.frombuffer(self.path_asns, dtype=np.int64) if len(self.path_asns) else np.empty(0, dtype=np.int64),
+            np.frombuffer(self.path_hits, dtype=np.int64) if len(self.path_hits) else np.empty(0, dtype=np.int64),
+            self.texts, self.peers, self.infos, self.collectors, self.announcements,
+        )
+
+
+class RouteStore:
+    """
+    Kompakte, spaltenorientierte Routen-Darstellung: eine numpy-Spalte pro Feld
+    (siehe ROUTE_COLUMNS), AS-Pfade als flaches ASN-Array mit Offsets. Gruppieren,
+    Zählen und Filtern laufen vektorisiert über die Spalten; Dictionaries im Format
+    von routes.json entstehen erst beim Veröffentlichen (iter_routes).
+    """
+
+    def __init__(self, columns, path_offsets, path_asns, path_hits, texts, peers, infos, collectors,
+                 announcements=None):
+        for name, _, _ in ROUTE_COLUMNS:
+            setattr(self, name, columns[name])
+        self.path_offsets = path_offsets
+        self.path_asns = path_asns
+        self.path_hits = path_hits
+        self.texts = texts
+        self.peers = peers
+        self.infos = infos
+        self.collectors = collectors
+        # (Prefix, Pfad-ID) -> Zeitstempel aller Ankündigungen des Zyklus oder None (siehe RouteStoreBuilder)
+        self.announcements = announcements
+        self._text_codes = None
+
+    @classmethod
+    def from_routes(cls, routes):
+        """Baut einen RouteStore aus Routen im Format von routes.json"""
+        builder = RouteStoreBuilder()
+        for route in routes:
+            builder.add(route.get("as_path"), route.get("timestamp"), route.get("ip"), route.get("start_system"),
+                        route.get("prefix"), route.get("additional_info"), route.get("collectors", ()),
+                        route.get("is_legit", 0))
+        return builder.build()
+
+    def __len__(self):
+        return len(self.path_id)
+
+    def columns(self):
+        return {name: getattr(self, name) for name, _, _ in ROUTE_COLUMNS}
+
+    def select(self, keep):
+        """Teilmenge der Routen (boolesche Maske oder Indizes); Pfade und Tabellen werden geteilt"""
+        columns = {name: column[keep] for name, column in self.columns().items()}
+        return RouteStore(columns, self.path_offsets, self.path_asns, self.path_hits,
+                          self.texts, self.peers, self.infos, self.collectors, self.announcements)
+
+    def asn_text(self, code):
+        """Gegenstück zu RouteStoreBuilder.asn_code"""
+        return str(code) if code >= 0 else self.texts[-1 - code]
+
+    def asn_code(self, asn):
+        """Code einer ASN (String oder int) in diesem Store oder None, falls unbekannt"""
+        text = str(asn) if asn is not None else None
+        if text is not None and text.isdigit() and len(text) <= 18 and (text[0] != "0" or text == "0"):
+            return int(text)
+        if self._text_codes is None or len(self._text_codes) != len(self.texts):
+            self._text_codes = {t: -1 - i for i, t in enumerate(self.texts)}
+        return self._text_codes.get(text)
+
+    def _path_bounds(self):
+        path_id = self.path_id.astype(np.int64)
+        return self.path_offsets[path_id], self.path_offsets[path_id + 1]
+
+    def path_members(self):
+        """Alle ASNs der Pfade als flache Arrays: (ASN-Codes, Index der Route)"""
+        starts, ends = self._path_bounds()
+        lengths = ends - starts
+        route_index = np.repeat(np.arange(len(self)), lengths)
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return self.path_asns[np.arange(int(lengths.sum())) + offsets], route_index
+
+    def _edge_codes(self, last):
+        """Erstes bzw. letztes AS des Pfads pro Route (None-Code bei leerem Pfad)"""
+        starts, ends = self._path_bounds()
+        empty = starts == ends
+        positions = np.where(empty, 0, ends - 1 if last else starts)
+        codes = self.path_asns[positions] if len(self.path_asns) else np.zeros(len(self), dtype=np.int64)
+        if empty.any():
+            codes = np.where(empty, self._none_code(), codes)
+        return codes
+
+    def _none_code(self):
+        if None not in self.texts:
+            self.texts.append(None)
+        return -1 - self.texts.index(None)
+
+    def path_origin(self, path_id):
+        """Letztes AS (Origin) eines Pfads als Text oder None bei leerem Pfad"""
+        start, end = self.path_offsets[path_id], self.path_offsets[path_id + 1]
+        return self.asn_text(int(self.path_asns[end - 1])) if end > start else None
+
+    def first_as(self):
+        return self._edge_codes(last=False)
+
+    def target_as(self):
+        return self._edge_codes(last=True)
+
+    def _count_by(self, codes, weights=None):
+        values, inverse = np.unique(codes, return_inverse=True)
+        counts = np.bincount(inverse, weights=weights, minlength=len(values))
+        return {self.asn_text(code): int(count) for code, count in zip(values.tolist(), counts.tolist())}
+
+    def unique_as(self):
+        """Alle AS, die in mindestens einem Pfad vorkommen (als Text sortiert)"""
+        return sorted(self.asn_text(code) for code in np.unique(self.path_members()[0]).tolist())
+
+    def outgoing_counts(self):
+        """Anzahl Routen (eindeutiger AS-Pfade) pro erstem AS im Pfad"""
+        return self._count_by(self.first_as()) if len(self) else {}
+
+    def start_counts(self):
+        """Anzahl Routen pro Start-System (Peer-AS)"""
+        return self._count_by(self.start_as) if len(self) else {}
+
+    def first_as_count(self):
+        """Häufigkeit des ersten AS über alle gelesenen A-Records (nicht nur eindeutige Pfade)"""
+        starts, ends = self.path_offsets[:-1], self.path_offsets[1:]
+        used = (self.path_hits > 0) & (ends > starts)
+        if not used.any():
+            return {}
+        return self._count_by(self.path_asns[starts[used]], weights=self.path_hits[used])
+
+    def unique_peer_pairs(self):
+        """Eindeutige (Peer-ID, Start-AS)-Paare und pro Route der Index ihres Paars"""
+        pairs = np.column_stack((self.peer_id.astype(np.int64), self.start_as))
+        if not len(pairs):
+            return pairs, np.empty(0, dtype=np.intp)
+        unique, inverse = np.unique(pairs, axis=0, return_inverse=True)
+        return unique, inverse.reshape(-1)
+
+    def as_collectors(self):
+        """ASN-Text -> sortierte Liste der Collectoren, über die Routen mit diesem AS gesehen wurden"""
+        result = {}
+        if not self.collectors:
+            return result
+        codes, route_index = self.path_members()
+        masks = self.collector_mask[route_index]
+        for bit, collector in enumerate(self.collectors):
+            for code in np.unique(codes[(masks & np.uint64(1 << bit)) != 0]).tolist():
+                result.setdefault(self.asn_text(code), []).append(collector)
+        for collectors in result.values():
+            collectors.sort()
+        return result
+
+    def _collector_names(self, mask):
+        return sorted(c for bit, c in enumerate(self.collectors) if mask >> bit & 1)
+
+    def _prefix_text(self, hi, lo, length, family):
+        if family == 0:
+            return self.texts[lo]
+        return f"{format_address(family, hi << 64 | lo)}/{length}"
+
+    def as_paths(self):
+        """AS-Pfade aller Routen als Tupel von ASN-Texten"""
+        text = self.asn_text
+        if len(self) * 8 < len(self.path_offsets):
+            # Wenige Routen (z. B. eine Seite einer Abfrage): nur die benötigten Pfade umwandeln
+            for path_id in self.path_id.tolist():
+                start, end = self.path_offsets[path_id], self.path_offsets[path_id + 1]
+                yield tuple(text(code) for code in self.path_asns[start:end].tolist())
+            return
+        asns = self.path_asns.tolist()
+        offsets = self.path_offsets.tolist()
+        for path_id in self.path_id.tolist():
+            yield tuple(text(code) for code in asns[offsets[path_id]:offsets[path_id + 1]])
+
+    def iter_routes(self):
+        """Routen als Dictionaries im Format von routes.json (Generator)"""
+        with_collectors = bool(self.collectors)
+        columns = zip(self.as_paths(), self.timestamp.tolist(), self.peer_id.tolist(), self.start_as.tolist(),
+                      self.prefix_hi.tolist(), self.prefix_lo.tolist(), self.prefix_len.tolist(),
+                      self.prefix_family.tolist(), self.info_id.tolist(), self.collector_mask.tolist(),
+                      self.is_legit.tolist())
+        for as_path, timestamp, peer_id, start_as, hi, lo, length, family, info_id, mask, is_legit in columns:
+            route = {
+                "timestamp": _format_timestamp(timestamp),
+                "status": "A",
+                "ip": self.peers[peer_id],
+                "start_system": self.asn_text(start_as),
+                "target_system": as_path[-1] if as_path else None,
+                "prefix": self._prefix_text(hi, lo, length, family),
+                "as_path": list(as_path),
+                "is_legit": is_legit,
+                "additional_info": self.infos[info_id]
+            }
+            if with_collectors:
+                route["collectors"] = self._collector_names(mask)
+            yield route
+
+    def to_routes(self):
+        return list(self.iter_routes())
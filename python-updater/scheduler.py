@@ -2,10 +2,42 @@ import subprocess
 import schedule
 import time
 import argparse
+import atexit
+import json
+import logging
 import os
+import signal
+from datetime import datetime
+
+import requests
+
+import metrics
+import pipeline
+import update_routeviews
+from json_writer import dumps_compact, write_bytes_atomic
+from query_service import QueryService
+from update_geolite import RELOAD_PIDFILE
+from update_routeviews import INTERVAL, floor_interval, interval_stamp
 
 LOCAL_DIR = ""
 
+# Nächstes zu verarbeitendes Intervall; überlebt Neustarts, damit verpasste Dumps nachgeholt werden
+SCHEDULER_STATE_PATH = "../data/scheduler_state.json"
+# Backoff der HEAD-Proben auf den erwarteten Dump (Sekunden): beginnt bei MIN, verdoppelt sich bis MAX
+PROBE_BACKOFF_MIN = float(os.getenv("PROBE_BACKOFF_MIN", "15"))
+PROBE_BACKOFF_MAX = float(os.getenv("PROBE_BACKOFF_MAX", "120"))
+# Bei mehreren Collectoren: so lange (Sekunden nach Intervallende) auf fehlende Collectoren warten,
+# sobald mindestens einer seinen Dump veröffentlicht hat
+PROBE_GRACE = float(os.getenv("PROBE_GRACE", "1800"))
+# Fehlt ein Dump so lange nach Intervallende bei allen Collectoren, wird das Intervall übersprungen
+PROBE_GIVE_UP = float(os.getenv("PROBE_GIVE_UP", "10800"))
+# Höchstens so viele Intervalle werden nach einer Pause nachgeholt (96 = ein Tag)
+MAX_CATCHUP = int(os.getenv("SCHEDULER_MAX_CATCHUP", "96"))
+# Versuche pro Intervall, falls der Zyklus selbst fehlschlägt (z. B. abgebrochener Download)
+CYCLE_ATTEMPTS = int(os.getenv("SCHEDULER_CYCLE_ATTEMPTS", "3"))
+
+logger = logging.getLogger("scheduler")
+
 def run_module(module_name, quiet):
     # Erstelle den vollständigen Pfad zum Modul
     module_path = os.path.join(LOCAL_DIR, module_name)
@@ -16,35 +48,177 @@ def run_module(module_name, quiet):
         subprocess.run(["python", module_path])
 
 def job_a(quiet):
-    print("[Scheduler] Starte Update_Geolite")
+    logger.info("Starte Update_Geolite")
     run_module("update_geolite.py", quiet)
 
-def job_b(quiet):
-    print("[Scheduler] Starte Update_Routeviews")
-    run_module("update_routeviews.py", quiet)
-    print("[Scheduler] Starte Updater")
-    run_module("updater.py", quiet)
-    print("[Scheduler] Starte Eval_Attack")
-    run_module("eval_attack.py", quiet)
+def job_b(ctx, interval=None, profile=False):
+    """Ein Pipeline-Zyklus für das Intervall; gibt False zurück, wenn er fehlgeschlagen ist"""
+    logger.info("Starte Pipeline (fetch → parse → enrich → evaluate → publish) für %s",
+                interval_stamp(interval) if interval else "den aktuellsten Dump")
+    try:
+        pipeline.run_cycle(ctx, profile=profile, interval=interval)
+    except Exception:
+        # Ein fehlgeschlagener Zyklus darf den Scheduler nicht beenden
+        logger.exception("Pipeline-Zyklus fehlgeschlagen")
+        return False
+    return True
+
+def register_reload_signal(ctx, pidfile=RELOAD_PIDFILE):
+    """
+    Hinterlegt die eigene PID für update_geolite.py: nach einem GeoLite-Update sendet es
+    SIGHUP, und der nächste Zyklus öffnet Reader, ASN-Index und Geo-Cache neu.
+    """
+    sighup = getattr(signal, "SIGHUP", None)
+    if sighup is None:
+        return
+    signal.signal(sighup, lambda signum, frame: ctx.request_reload())
+    os.makedirs(os.path.dirname(pidfile) or ".", exist_ok=True)
+    with open(pidfile, "w", encoding="utf-8") as f:
+        f.write(str(os.getpid()))
+    atexit.register(lambda: os.path.exists(pidfile) and os.remove(pidfile))
+
+def newest_interval(now=None):
+    """Jüngstes Intervall, dessen Dump bereits veröffentlicht sein kann (es ist vollständig vorbei)"""
+    return floor_interval(now or datetime.utcnow()) - INTERVAL
+
+def load_cursor(state_path=SCHEDULER_STATE_PATH):
+    """Nächstes zu verarbeitendes Intervall aus dem Zustand des letzten Laufs (oder None)"""
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return datetime.strptime(json.load(f)["next_interval"], "%Y%m%d.%H%M")
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def save_cursor(interval, state_path=SCHEDULER_STATE_PATH):
+    os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+    write_bytes_atomic(dumps_compact({"next_interval": interval_stamp(interval)}), state_path, compression=())
+
+def start_cursor(saved, now=None, max_catchup=MAX_CATCHUP):
+    """
+    Startpunkt nach dem Hochfahren: das gespeicherte Intervall, sofern es nicht mehr als
+    max_catchup Intervalle zurückliegt; ohne Zustand das jüngste veröffentlichte Intervall.
+    """
+    newest = newest_interval(now)
+    if saved is None:
+        return newest
+    oldest = newest - (max_catchup - 1) * INTERVAL
+    if saved < oldest:
+        logger.warning("Zustand steht auf %s, hole nur die letzten %d Intervalle ab %s nach",
+                       interval_stamp(saved), max_catchup, interval_stamp(oldest))
+        return oldest
+    return saved
+
+def probe_interval(interval, collectors, session=None):
+    """Collectoren, deren Dump für das Intervall bereits veröffentlicht ist (HEAD-Anfragen)"""
+    return [collector for collector in collectors
+            if update_routeviews.dump_available(update_routeviews.update_url_for(collector, interval), session)]
+
+def wait(seconds):
+    """Wartet, arbeitet dabei aber fällige Tagesjobs (GeoLite) ab"""
+    deadline = time.monotonic() + seconds
+    while True:
+        schedule.run_pending()
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(min(1.0, remaining))
+
+def wait_for_interval(interval, collectors, session=None):
+    """
+    Wartet, bis der Dump des Intervalls erscheint: zuerst bis zum Intervallende, danach
+    HEAD-Proben mit exponentiellem Backoff. Gibt die verfügbaren Collectoren zurück,
+    sobald alle ihren Dump veröffentlicht haben (nach PROBE_GRACE oder wenn das Folgeintervall
+    schon vorliegt: die vorhandenen), bzw. None, wenn keiner mehr zu erwarten ist.
+    """
+    published = interval + INTERVAL
+    pending = (published - datetime.utcnow()).total_seconds()
+    if pending > 0:
+        logger.info("Warte %.0f s bis zum Ende von %s", pending, interval_stamp(interval))
+        wait(pending)
+
+    backoff = PROBE_BACKOFF_MIN
+    while True:
+        available = probe_interval(interval, collectors, session)
+        waited = (datetime.utcnow() - published).total_seconds()
+        if len(available) == len(collectors):
+            return available
+        # Die Dumps erscheinen in zeitlicher Reihenfolge: liegt schon das Folgeintervall vor,
+        # kommt der fehlende nicht mehr und muss beim Nachholen nicht abgewartet werden
+        overtaken = waited >= INTERVAL.total_seconds() and bool(probe_interval(interval + INTERVAL, collectors, session))
+        if available and (overtaken or waited >= PROBE_GRACE):
+            logger.warning("Intervall %s: keine Dumps von %s, verarbeite %s", interval_stamp(interval),
+                           ", ".join(c for c in collectors if c not in available), ", ".join(available))
+            return available
+        if not available and (overtaken or waited >= PROBE_GIVE_UP):
+            return None
+        logger.debug("Dump %s noch nicht verfügbar, nächste Probe in %.0f s", interval_stamp(interval), backoff)
+        wait(backoff)
+        backoff = min(backoff * 2, PROBE_BACKOFF_MAX)
+
+def process_interval(ctx, interval, profile=False):
+    """Führt den Zyklus aus; schlägt er fehl, wird er mit Backoff bis CYCLE_ATTEMPTS-mal wiederholt"""
+    backoff = PROBE_BACKOFF_MIN
+    for attempt in range(1, CYCLE_ATTEMPTS + 1):
+        if job_b(ctx, interval, profile=profile and attempt == 1):
+            return True
+        if attempt < CYCLE_ATTEMPTS:
+            wait(backoff)
+            backoff = min(backoff * 2, PROBE_BACKOFF_MAX)
+    return False
+
+def run_forever(ctx, state_path=SCHEDULER_STATE_PATH, profile=False):
+    """
+    Verarbeitet die Intervalle streng der Reihe nach in einer einzigen Schleife: Zyklen
+    können sich dadurch nicht überlappen. Dauert einer länger als 15 Minuten, liegen die
+    folgenden Dumps schon vor und werden direkt danach nachgeholt.
+    """
+    cursor = start_cursor(load_cursor(state_path))
+    logger.info("Starte bei Intervall %s", interval_stamp(cursor))
+    with requests.Session() as session:
+        while True:
+            if wait_for_interval(cursor, ctx.collectors, session) is None:
+                logger.warning("Kein Dump für %s veröffentlicht, Intervall übersprungen", interval_stamp(cursor))
+            elif not process_interval(ctx, cursor, profile):
+                logger.error("Intervall %s nach %d Versuchen übersprungen", interval_stamp(cursor), CYCLE_ATTEMPTS)
+            profile = False
+            cursor += INTERVAL
+            save_cursor(cursor, state_path)
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--quiet", action="store_true", help="Unterdrückt die Ausgaben der Module")
+    parser.add_argument("--quiet", action="store_true", help="Nur Warnungen und Fehler ausgeben")
+    parser.add_argument("--profile", action="store_true", help="Den ersten Pipeline-Zyklus mit cProfile/tracemalloc profilieren")
+    parser.add_argument("--no-query-service", action="store_true", help="Abfragedienst (QUERY_HOST:QUERY_PORT) nicht starten")
     args = parser.parse_args()
 
-    # Zeitpläne einrichten
-    schedule.every().day.at("00:00").do(job_a, quiet=args.quiet)     # A einmal täglich
-    schedule.every(15).minutes.do(job_b, quiet=args.quiet)         # B alle 15 Minuten
+    metrics.setup_logging("WARNING" if args.quiet else None)
+
+    # Langlebiger Pipeline-Kontext: GeoLite-Reader und Indizes bleiben zwischen den Zyklen warm
+    ctx = pipeline.PipelineContext()
+
+    # Abfragedienst im selben Prozess: erhält nach jedem Publish den neuen Index,
+    # bis dahin die Routen des letzten Laufs
+    if not args.no_query_service:
+        service = QueryService()
+        service.serve()
+        ctx.query_service = service
+        if os.path.exists(ctx.routes_path):
+            try:
+                service.load_routes_file(ctx.routes_path)
+            except (OSError, ValueError) as e:
+                logger.warning("Routen des letzten Laufs nicht lesbar: %s", e)
+
+    register_reload_signal(ctx)
+
+    # GeoLite einmal täglich; läuft zwischen den Proben im selben Thread wie die Zyklen
+    schedule.every().day.at("00:00").do(job_a, quiet=args.quiet)
 
     # *** Direktstart beim Hochfahren ***
-    print("[Scheduler] Initialer Direktstart aller Module")
+    logger.info("Initialer Direktstart von Update_Geolite")
     job_a(args.quiet)
-    job_b(args.quiet)
 
-    print("[Scheduler] Starte Zeitplan...")
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    # Pipeline ereignisgesteuert: jedes Intervall, sobald sein Dump veröffentlicht ist
+    run_forever(ctx, profile=args.profile)
 
 if __name__ == "__main__":
     main()
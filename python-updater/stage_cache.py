@@ -0,0 +1,78 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+
+# Ablage der Stage-Artefakte: <dir>/<stage>/<fingerprint>.pickle
+STAGE_CACHE_DIR = "../data/cache/stages/"
+# Bei inkompatiblen Änderungen an den Stage-Ergebnissen erhöhen
+STAGE_CACHE_VERSION = 2
+
+logger = logging.getLogger(__name__)
+
+# Kennzeichnet einen Cache-Fehltreffer (None kann ein gültiges Ergebnis sein)
+MISSING = object()
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 einer Datei, blockweise gelesen"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(stage, *inputs):
+    """Fingerprint einer Stage aus ihren Eingaben (Digests, Build-Kennungen, Konfiguration)"""
+    payload = json.dumps([STAGE_CACHE_VERSION, stage, inputs], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class StageCache:
+    """
+    Inhaltsadressierter Cache für Stage-Ergebnisse. Stimmt der Fingerprint der
+    Eingaben mit einem früheren Lauf überein, wird das damals erzeugte Artefakt
+    wiederverwendet. Pro Stage bleiben nur die letzten 'keep' Artefakte erhalten.
+    """
+
+    def __init__(self, cache_dir=STAGE_CACHE_DIR, keep=2):
+        self.cache_dir = cache_dir
+        self.keep = keep
+
+    def _path(self, stage, key):
+        return os.path.join(self.cache_dir, stage, f"{key}.pickle")
+
+    def has(self, stage, key):
+        return os.path.exists(self._path(stage, key))
+
+    def load(self, stage, key):
+        """Liefert das gespeicherte Ergebnis oder MISSING"""
+        try:
+            with open(self._path(stage, key), "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return MISSING
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError) as e:
+            logger.warning("Stage-Artefakt %s/%s nicht lesbar: %s", stage, key[:12], e)
+            return MISSING
+        logger.info("Stage %s: Eingaben unverändert, verwende Artefakt %s", stage, key[:12])
+        return value
+
+    def store(self, stage, key, value):
+        """Speichert das Ergebnis atomar und entfernt ältere Artefakte der Stage"""
+        path = self._path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self._prune(stage)
+
+    def _prune(self, stage):
+        stage_dir = os.path.join(self.cache_dir, stage)
+        entries = [os.path.join(stage_dir, name) for name in os.listdir(stage_dir) if name.endswith(".pickle")]
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for path in entries[self.keep:]:
+            os.remove(path)
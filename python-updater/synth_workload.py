@@ -0,0 +1,152 @@
+import argparse
+import csv
+import ipaddress
+import json
+import os
+import random
+
+# Zielverzeichnis für synthetische Fixtures
+FIXTURE_DIR = "../data/bench/fixtures/"
+
+# Verteilung der AS-Pfadlängen (grob an öffentlichen RouteViews-Statistiken orientiert)
+PATH_LENGTH_WEIGHTS = {1: 2, 2: 8, 3: 20, 4: 25, 5: 20, 6: 12, 7: 7, 8: 4, 9: 2}
+
+
+class SyntheticInternet:
+    """
+    Zufälliges, aber reproduzierbares Modell aus AS, Adressblöcken, Peers und Prefixen.
+    Daraus werden Update-Dump, ASN-CSV und Punkte-Fixture konsistent erzeugt.
+    """
+
+    def __init__(self, n_asns=5000, n_peers=40, n_prefixes=50000, seed=42):
+        self.rng = random.Random(seed)
+        rng = self.rng
+
+        # ASNs aus dem 16- und 32-Bit-Bereich, einige Transit-AS sind deutlich häufiger
+        self.asns = rng.sample(range(1, 400000), n_asns)
+        self.transit = self.asns[:max(1, n_asns // 50)]
+
+        # Jedes AS bekommt 1–4 /24-Blöcke aus einem fortlaufenden Adressraum
+        self.blocks = []  # (Netz, ASN)
+        base = int(ipaddress.IPv4Address("11.0.0.0"))
+        cursor = 0
+        for asn in self.asns:
+            for _ in range(rng.randint(1, 4)):
+                network = ipaddress.IPv4Network((base + cursor * 256, 24))
+                self.blocks.append((network, asn))
+                cursor += 1
+        self.blocks_by_asn = {}
+        for network, asn in self.blocks:
+            self.blocks_by_asn.setdefault(asn, []).append(network)
+
+        # Peers: 90 % mit IP aus dem eigenen Block, der Rest "verdächtig" außerhalb
+        self.peers = []
+        for peer_as in rng.sample(self.transit + self.asns, n_peers):
+            if rng.random() < 0.9:
+                network = rng.choice(self.blocks_by_asn[peer_as])
+                peer_ip = str(network.network_address + rng.randint(1, 254))
+            else:
+                peer_ip = f"198.51.100.{rng.randint(1, 254)}"
+            self.peers.append((peer_ip, peer_as))
+
+        # Prefixe mit Ursprungs-AS (/16 bis /24)
+        self.prefixes = []
+        for _ in range(n_prefixes):
+            bits = rng.choice((16, 18, 20, 22, 23, 24, 24, 24))
+            address = rng.randint(1 << 24, 223 << 24) & ~((1 << (32 - bits)) - 1)
+            self.prefixes.append((f"{ipaddress.IPv4Address(address)}/{bits}", rng.choice(self.asns)))
+
+        lengths, weights = zip(*PATH_LENGTH_WEIGHTS.items())
+        self.path_lengths = lengths
+        self.path_weights = weights
+
+    def as_path(self, peer_as, origin):
+        """Pfad: Peer-AS, zufällige Transit-AS, Ursprungs-AS"""
+        length = self.rng.choices(self.path_lengths, self.path_weights)[0]
+        if length == 1:
+            return [peer_as]
+        middle = [self.rng.choice(self.transit) for _ in range(max(0, length - 2))]
+        return [peer_as] + middle + [origin]
+
+    def write_updates(self, path, lines, withdraw_ratio=0.1, start_ts=1760473800.0):
+        """Schreibt einen 'bgpdump -m'-kompatiblen Update-Dump mit A/W-Mix"""
+        rng = self.rng
+        announced = []
+        ts = start_ts
+        with open(path, "w") as f:
+            for _ in range(lines):
+                ts += rng.random() * 0.01
+                peer_ip, peer_as = rng.choice(self.peers)
+                if announced and rng.random() < withdraw_ratio:
+                    w_peer_ip, w_peer_as, w_prefix = announced[rng.randrange(len(announced))]
+                    f.write(f"BGP4MP_ET|{ts:.6f}|W|{w_peer_ip}|{w_peer_as}|{w_prefix}\n")
+                    continue
+                prefix, origin = rng.choice(self.prefixes)
+                as_path = " ".join(str(asn) for asn in self.as_path(peer_as, origin))
+                communities = f"{peer_as}:{rng.randint(1, 5000)}" if peer_as < 65536 else ""
+                f.write(f"BGP4MP_ET|{ts:.6f}|A|{peer_ip}|{peer_as}|{prefix}|{as_path}|IGP|{peer_ip}|0|0|{communities}|NAG||\n")
+                if len(announced) < 100000:
+                    announced.append((peer_ip, peer_as, prefix))
+
+    def write_asn_csv(self, path):
+        """Schreibt eine GeoLite2-ASN-Blocks-IPv4.csv mit Header"""
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["network", "autonomous_system_number", "autonomous_system_organization"])
+            for network, asn in sorted(self.blocks, key=lambda b: int(b[0].network_address)):
+                writer.writerow([str(network), asn, f"SYNTH-AS{asn}"])
+
+    def points(self):
+        """Punkte im Format von points.json (Koordinaten gehäuft um einige Städte)"""
+        rng = self.rng
+        hubs = [(50.1, 8.7), (52.4, 4.9), (51.5, -0.1), (40.7, -74.0), (37.4, -122.1), (1.35, 103.8), (35.7, 139.7)]
+        result = []
+        for asn in self.asns:
+            lat, lon = rng.choice(hubs)
+            result.append({
+                "asn": str(asn),
+                "as_name": f"SYNTH-AS{asn}",
+                "routes_count": 0,
+                "ip": str(self.blocks_by_asn[asn][0].network_address),
+                "city": "Synth",
+                "region": "Synth",
+                "coordinates": [lat + rng.uniform(-2, 2), lon + rng.uniform(-2, 2)]
+            })
+        return result
+
+
+def generate_fixtures(lines, output_dir=FIXTURE_DIR, seed=42, withdraw_ratio=0.1, n_asns=None, n_peers=40):
+    """Erzeugt updates-<lines>.txt, asn-blocks.csv und points.json; gibt die Pfade zurück"""
+    os.makedirs(output_dir, exist_ok=True)
+    # Anzahl AS und Prefixe wächst moderat mit der Dump-Größe
+    n_asns = n_asns or min(70000, max(2000, lines // 50))
+    model = SyntheticInternet(n_asns=n_asns, n_peers=n_peers, n_prefixes=min(900000, max(10000, lines // 4)), seed=seed)
+
+    paths = {
+        "updates": os.path.join(output_dir, f"updates-{lines}.txt"),
+        "asn_csv": os.path.join(output_dir, f"asn-blocks-{lines}.csv"),
+        "points": os.path.join(output_dir, f"points-{lines}.json"),
+    }
+    model.write_updates(paths["updates"], lines, withdraw_ratio=withdraw_ratio)
+    model.write_asn_csv(paths["asn_csv"])
+    with open(paths["points"], "w", encoding="utf-8") as f:
+        json.dump(model.points(), f)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Erzeugt synthetische bgpdump-Dumps und GeoLite-Fixtures")
+    parser.add_argument("--lines", type=int, nargs="+", default=[10000], help="Anzahl Zeilen pro Dump (10k bis 10M)")
+    parser.add_argument("--output", default=FIXTURE_DIR, help="Zielverzeichnis")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--withdraw-ratio", type=float, default=0.1, help="Anteil der W-Records")
+    parser.add_argument("--peers", type=int, default=40, help="Anzahl BGP-Peers")
+    args = parser.parse_args()
+
+    for lines in args.lines:
+        paths = generate_fixtures(lines, args.output, args.seed, args.withdraw_ratio, n_peers=args.peers)
+        print(f"{lines} Zeilen: {paths}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+# Die Module arbeiten mit Pfaden relativ zu python-updater/ (z. B. "../data/")
+UPDATER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(UPDATER_DIR)
+sys.path.insert(0, UPDATER_DIR)
+
+
+@pytest.fixture
+def stub_server():
+    """Startet lokale HTTP-Stub-Server mit dem übergebenen Handler; liefert deren Basis-URL"""
+    servers = []
+
+    def start(handler):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,79 @@
+import json
+import os
+import random
+
+import numpy as np
+
+from as_stats import AsStats, build_as_stats, write_as_stats
+from rib import RouteTable
+from route_shards import MANIFEST_FILENAME, load_manifest
+
+
+def published(stats_dir):
+    """Manifest und Inhalt aller AS-Dateien (ohne komprimierte Begleitdateien)"""
+    manifest = load_manifest(stats_dir)
+    files = sorted(name for name in os.listdir(stats_dir) if name.endswith(".json") and name != MANIFEST_FILENAME)
+    assert files == sorted(entry["file"] for entry in manifest.values())
+    contents = {}
+    for asn, entry in manifest.items():
+        with open(os.path.join(stats_dir, entry["file"]), "r", encoding="utf-8") as f:
+            contents[asn] = json.load(f)
+    return manifest, contents
+
+
+def random_delta(rng, paths, count, timestamp):
+    records = []
+    for i in range(count):
+        peer, prefix = f"10.0.0.{rng.randrange(6)}", f"192.{rng.randrange(40)}.0.0/16"
+        if rng.random() < 0.3:
+            records.append(["BGP4MP", str(timestamp + i), "W", peer, "65000", prefix])
+        else:
+            path = rng.choice(paths)
+            records.append(["BGP4MP", str(timestamp + i), "A", peer, path.split()[0], prefix, path,
+                            "IGP", peer, "0", "0", ""])
+    return records
+
+
+def test_incremental_stats_match_full_build(tmp_path):
+    rng = random.Random(3)
+    mask_rng = np.random.default_rng(3)
+    # Mit Prepending und AS_SETs, die über die Texte des Stores kodiert sind
+    paths = [" ".join(str(rng.randint(1, 30)) for _ in range(rng.randint(1, 5))) for _ in range(150)]
+    paths += ["1 {2,3} 4", "5 5 6", "7 {8}"]
+    table = RouteTable()
+    stats = AsStats()
+    incremental_dir, full_dir = str(tmp_path / "incremental"), str(tmp_path / "full")
+
+    for cycle in range(20):
+        table.apply(random_delta(rng, paths, rng.randint(0, 150), cycle * 1000))
+        routes = table.active_routes()
+        if cycle % 3 == 1:
+            # wie der Geo-Filter: nur ein Teil der aktiven Routen wird veröffentlicht
+            routes = routes.select(mask_rng.random(len(routes)) < 0.7)
+        stats.publish(routes, incremental_dir)
+        write_as_stats(build_as_stats(routes), full_dir)
+
+        manifest, contents = published(incremental_dir)
+        expected_manifest, expected_contents = published(full_dir)
+        assert manifest == expected_manifest
+        for asn, content in expected_contents.items():
+            assert list(contents[asn]["traversed"].items()) == list(content["traversed"].items())
+            assert list(contents[asn]["neighbors"].items()) == list(content["neighbors"].items())
+
+
+def test_only_changed_asns_are_rewritten(tmp_path):
+    table = RouteTable()
+    table.apply([
+        ["BGP4MP", "1", "A", "10.0.0.1", "64500", "192.0.2.0/24", "64500 64501 64502", "IGP", "10.0.0.1", "0", "0", ""],
+        ["BGP4MP", "2", "A", "10.0.0.2", "64510", "198.51.100.0/24", "64510 64511", "IGP", "10.0.0.2", "0", "0", ""],
+    ])
+    stats = AsStats()
+    stats_dir = str(tmp_path / "as_stats")
+    stats.publish(table.active_routes(), stats_dir)
+    assert sorted(load_manifest(stats_dir)) == ["64500", "64501", "64502", "64510", "64511"]
+
+    # Nur der Pfad 64510 64511 fällt weg: seine ASNs werden entfernt, die übrigen nicht angefasst
+    table.apply([["BGP4MP", "3", "W", "10.0.0.2", "64510", "198.51.100.0/24"]])
+    assert stats.publish(table.active_routes(), stats_dir) == (0, 0, 2)
+    assert sorted(load_manifest(stats_dir)) == ["64500", "64501", "64502"]
+    assert not os.path.exists(os.path.join(stats_dir, "AS64510.json"))
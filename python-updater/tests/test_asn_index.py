@@ -0,0 +1,35 @@
+import os
+
+from asn_index import ASN_ARTIFACT_FILE, compile_asn_artifact, load_asn_index
+
+HEADER = "network,autonomous_system_number,autonomous_system_organization\n"
+
+
+def write_csvs(directory, v4_rows):
+    paths = tuple(os.path.join(directory, f"GeoLite2-ASN-Blocks-IPv{version}.csv") for version in (4, 6))
+    with open(paths[0], "w", encoding="utf-8") as f:
+        f.write(HEADER + v4_rows)
+    with open(paths[1], "w", encoding="utf-8") as f:
+        f.write(HEADER + "2001:4860::/32,15169,GOOGLE\n")
+    return paths
+
+
+def test_artifact_lives_next_to_its_csvs(tmp_path):
+    first, second = tmp_path / "a", tmp_path / "b"
+    first.mkdir()
+    second.mkdir()
+    first_csvs = write_csvs(str(first), "8.8.8.0/24,15169,GOOGLE\n")
+    second_csvs = write_csvs(str(second), "8.8.8.0/24,64500,OTHER\n")
+
+    assert compile_asn_artifact(first_csvs) == str(first / ASN_ARTIFACT_FILE)
+    index = load_asn_index(first_csvs)
+    try:
+        assert index.mapping is not None
+        assert index.lookup("8.8.8.8") == 15169
+    finally:
+        index.close()
+
+    # Ohne eigenes Binärformat werden die CSVs gelesen, nicht das Artefakt eines anderen Verzeichnisses
+    index = load_asn_index(second_csvs)
+    assert index.mapping is None
+    assert index.lookup("8.8.8.8") == 64500
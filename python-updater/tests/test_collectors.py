@@ -0,0 +1,127 @@
+import bz2
+import ipaddress
+import struct
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import pipeline
+import update_routeviews
+from mrt_reader import (ATTR_AS_PATH, ATTR_NEXT_HOP, ATTR_ORIGIN, BGP4MP_MESSAGE_AS4, BGP_UPDATE, MRT_BGP4MP,
+                        MRT_HEADER)
+
+INTERVAL = datetime(2026, 10, 18, 10, 0)
+MISSING = "route-views.sydney"
+
+
+def _nlri(prefix):
+    network = ipaddress.ip_network(prefix)
+    return bytes([network.prefixlen]) + network.network_address.packed[:(network.prefixlen + 7) // 8]
+
+
+def _attribute(code, value):
+    return struct.pack("!BBB", 0x40, code, len(value)) + value
+
+
+def mrt_update(timestamp, peer_ip, peer_as, as_path, announced=(), withdrawn=()):
+    """Ein BGP4MP_MESSAGE_AS4-Record mit einem IPv4-UPDATE (AS_SEQUENCE, 4-Byte-ASNs)"""
+    attributes = (_attribute(ATTR_ORIGIN, b"\x00")
+                  + _attribute(ATTR_AS_PATH, bytes([2, len(as_path)]) + b"".join(struct.pack("!I", a) for a in as_path))
+                  + _attribute(ATTR_NEXT_HOP, ipaddress.ip_address(peer_ip).packed))
+    withdrawn = b"".join(map(_nlri, withdrawn))
+    body = (struct.pack("!H", len(withdrawn)) + withdrawn + struct.pack("!H", len(attributes)) + attributes
+            + b"".join(map(_nlri, announced)))
+    message = b"\xff" * 16 + struct.pack("!HB", 19 + len(body), BGP_UPDATE) + body
+    bgp4mp = (struct.pack("!IIHH", peer_as, 65000, 0, 1) + ipaddress.ip_address(peer_ip).packed + bytes(4)
+              + message)
+    return MRT_HEADER.pack(timestamp, MRT_BGP4MP, BGP4MP_MESSAGE_AS4, len(bgp4mp)) + bgp4mp
+
+
+# Beide Collectoren sehen den Pfad 64500 64501 64502 (von verschiedenen Peers), dazu je einen eigenen
+DUMPS = {
+    update_routeviews.DEFAULT_COLLECTOR: [
+        mrt_update(1760781600, "10.0.0.1", 64500, [64500, 64501, 64502], announced=["192.0.2.0/24", "198.51.100.0/24"]),
+        mrt_update(1760781601, "10.0.0.2", 64510, [64510, 64502], announced=["203.0.113.0/24"]),
+        mrt_update(1760781602, "10.0.0.2", 64510, [64510, 64502], withdrawn=["203.0.113.0/24"]),
+    ],
+    "route-views.linx": [
+        mrt_update(1760781605, "10.1.0.1", 64500, [64500, 64501, 64502], announced=["192.0.2.0/24"]),
+        mrt_update(1760781606, "10.1.0.2", 64520, [64520, 64521], announced=["100.64.0.0/10"]),
+    ],
+}
+
+
+def archive_handler(files, requests_seen):
+    """Stub des RouteViews-Archivs: liefert die .bz2-Dumps unter ihrem Pfad, sonst 404"""
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with lock:
+                requests_seen.append(self.path)
+            body = files.get(self.path)
+            self.send_response(200 if body is not None else 404)
+            self.send_header("Content-Length", str(len(body or b"")))
+            self.end_headers()
+            self.wfile.write(body or b"")
+
+    return Handler
+
+
+@pytest.fixture
+def archive(stub_server, tmp_path, monkeypatch):
+    """RouteViews-Stub mit je einem Dump für zwei Collectoren; liefert die angefragten Pfade"""
+    files, requests_seen = {}, []
+    base_url = stub_server(archive_handler(files, requests_seen))
+    monkeypatch.setattr(update_routeviews, "ROUTEVIEWS_ARCHIVE", base_url)
+    for collector, records in DUMPS.items():
+        files[update_routeviews.update_url_for(collector, INTERVAL)[len(base_url):]] = bz2.compress(b"".join(records))
+    monkeypatch.setattr(update_routeviews, "PARSER_BACKEND", "mrt")
+    monkeypatch.setattr(update_routeviews, "LOCAL_DIR_TMP", str(tmp_path / "tmp"))
+    return requests_seen
+
+
+def test_collectors_merged_and_missing_skipped(archive, tmp_path):
+    collectors = [update_routeviews.DEFAULT_COLLECTOR, "route-views.linx", MISSING]
+    ctx = pipeline.PipelineContext(rib_path=None, stage_cache_dir=None, origin_history_path=None,
+                                   collectors=collectors)
+
+    per_collector = pipeline.stage_fetch(ctx, interval=INTERVAL)
+    assert list(per_collector) == collectors[:2]
+    assert f"/{MISSING}/bgpdata/2026.10/UPDATES/updates.20261018.1000.bz2" in archive
+    assert not any((tmp_path / "tmp").iterdir())  # Arbeitsverzeichnisse der Worker entfernt
+
+    unique_as, _, routes, outgoing = pipeline.stage_parse(ctx, per_collector)
+    by_path = {tuple(route["as_path"]): route for route in routes.to_routes()}
+    # Pro AS-Pfad eine Route; die erste Route des Pfads ist der Repräsentant
+    assert sorted(by_path) == [("64500", "64501", "64502"), ("64510", "64502"), ("64520", "64521")]
+    shared = by_path["64500", "64501", "64502"]
+    assert (shared["ip"], shared["prefix"]) == ("10.0.0.1", "192.0.2.0/24")
+    assert shared["collectors"] == ["route-views.linx", update_routeviews.DEFAULT_COLLECTOR]
+    assert by_path["64510", "64502"]["collectors"] == [update_routeviews.DEFAULT_COLLECTOR]
+    assert by_path["64520", "64521"]["collectors"] == ["route-views.linx"]
+    assert unique_as == sorted(["64500", "64501", "64502", "64510", "64520", "64521"])
+    assert outgoing == {"64500": 1, "64510": 1, "64520": 1}
+    assert routes.as_collectors()["64502"] == ["route-views.linx", update_routeviews.DEFAULT_COLLECTOR]
+
+
+def test_collectors_with_route_table(archive, tmp_path):
+    collectors = [update_routeviews.DEFAULT_COLLECTOR, "route-views.linx", MISSING]
+    ctx = pipeline.PipelineContext(rib_path=str(tmp_path / "rib.pickle"), stage_cache_dir=None,
+                                   origin_history_path=None, collectors=collectors)
+
+    per_collector = pipeline.stage_fetch(ctx, interval=INTERVAL)
+    _, _, routes, outgoing = pipeline.stage_parse(ctx, per_collector, pipeline.source_fingerprint(per_collector))
+    by_path = {tuple(route["as_path"]): route for route in routes.to_routes()}
+    # Der Withdraw nimmt 203.0.113.0/24 zurück; die Routen werden pro Collector geführt
+    assert sorted(by_path) == [("64500", "64501", "64502"), ("64520", "64521")]
+    assert by_path["64500", "64501", "64502"]["collectors"] == ["route-views.linx",
+                                                                 update_routeviews.DEFAULT_COLLECTOR]
+    assert outgoing == {"64500": 1, "64520": 1}
+    # (Peer, Prefix, Collector): zwei Routen von route-views2, zwei von route-views.linx
+    assert len(ctx.route_table) == 4
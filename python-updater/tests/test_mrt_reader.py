@@ -0,0 +1,136 @@
+import bz2
+import ipaddress
+import struct
+
+import pytest
+
+import updater
+from mrt_reader import (AFI_IPV4, AFI_IPV6, AS_SET, ATTR_AS4_PATH, ATTR_AS_PATH, ATTR_COMMUNITIES,
+                        ATTR_MP_REACH_NLRI, ATTR_MP_UNREACH_NLRI, ATTR_NEXT_HOP, ATTR_ORIGIN, BGP4MP_MESSAGE,
+                        BGP4MP_MESSAGE_AS4, BGP_UPDATE, MRT_BGP4MP, MRT_BGP4MP_ET, MRT_HEADER)
+
+AS_SEQUENCE = 2
+# AS_TRANS: Platzhalter für 4-Byte-ASNs in AS_PATH einer 2-Byte-Session (RFC 6793)
+AS_TRANS = 23456
+
+
+def nlri(prefix):
+    network = ipaddress.ip_network(prefix)
+    return bytes([network.prefixlen]) + network.network_address.packed[:(network.prefixlen + 7) // 8]
+
+
+def attribute(code, value, flags=0x40):
+    if len(value) > 255:
+        return struct.pack("!BBH", flags | 0x10, code, len(value)) + value
+    return struct.pack("!BBB", flags, code, len(value)) + value
+
+
+def as_path_value(segments, asn_size):
+    """Segmente als Liste von (Typ, [ASNs])"""
+    fmt = "!I" if asn_size == 4 else "!H"
+    return b"".join(bytes([kind, len(asns)]) + b"".join(struct.pack(fmt, asn) for asn in asns)
+                    for kind, asns in segments)
+
+
+def mrt_update(peer_ip, peer_as, segments=(), announced=(), withdrawn=(), as4_segments=None, communities=(),
+               timestamp=1760781600, microseconds=None, asn_size=4):
+    """
+    Ein BGP4MP-Record mit einem UPDATE. IPv6-Prefixe werden über MP_REACH_NLRI bzw.
+    MP_UNREACH_NLRI übertragen, IPv4-Prefixe im UPDATE selbst. Mit microseconds
+    entsteht ein BGP4MP_ET-Record, mit asn_size=2 eine 2-Byte-Session (BGP4MP_MESSAGE).
+    """
+    v4 = [p for p in announced if ipaddress.ip_network(p).version == 4]
+    v6 = [p for p in announced if ipaddress.ip_network(p).version == 6]
+    v4_withdrawn = [p for p in withdrawn if ipaddress.ip_network(p).version == 4]
+    v6_withdrawn = [p for p in withdrawn if ipaddress.ip_network(p).version == 6]
+
+    attributes = b""
+    if announced:
+        attributes += attribute(ATTR_ORIGIN, b"\x00") + attribute(ATTR_AS_PATH, as_path_value(segments, asn_size))
+        if v4:
+            attributes += attribute(ATTR_NEXT_HOP, ipaddress.ip_address(peer_ip).packed)
+        if communities:
+            attributes += attribute(ATTR_COMMUNITIES, b"".join(struct.pack("!HH", *c) for c in communities), 0xC0)
+        if as4_segments is not None:
+            attributes += attribute(ATTR_AS4_PATH, as_path_value(as4_segments, 4), 0xC0)
+        if v6:
+            next_hop = ipaddress.ip_address("2001:db8::1").packed
+            attributes += attribute(ATTR_MP_REACH_NLRI, struct.pack("!HBB", AFI_IPV6, 1, len(next_hop)) + next_hop
+                                    + b"\x00" + b"".join(map(nlri, v6)), 0x80)
+    if v6_withdrawn:
+        attributes += attribute(ATTR_MP_UNREACH_NLRI, struct.pack("!HB", AFI_IPV6, 1)
+                                + b"".join(map(nlri, v6_withdrawn)), 0x80)
+
+    withdrawn_v4 = b"".join(map(nlri, v4_withdrawn))
+    body = (struct.pack("!H", len(withdrawn_v4)) + withdrawn_v4 + struct.pack("!H", len(attributes)) + attributes
+            + b"".join(map(nlri, v4)))
+    message = b"\xff" * 16 + struct.pack("!HB", 19 + len(body), BGP_UPDATE) + body
+
+    peer = ipaddress.ip_address(peer_ip)
+    afi = AFI_IPV4 if peer.version == 4 else AFI_IPV6
+    header = struct.pack("!IIHH" if asn_size == 4 else "!HHHH", peer_as, 65000, 0, afi)
+    bgp4mp = header + peer.packed + bytes(len(peer.packed)) + message
+    subtype = BGP4MP_MESSAGE_AS4 if asn_size == 4 else BGP4MP_MESSAGE
+    if microseconds is None:
+        return MRT_HEADER.pack(timestamp, MRT_BGP4MP, subtype, len(bgp4mp)) + bgp4mp
+    return (MRT_HEADER.pack(timestamp, MRT_BGP4MP_ET, subtype, len(bgp4mp) + 4) + struct.pack("!I", microseconds)
+            + bgp4mp)
+
+
+# Jeder Fall: MRT-Record und die Zeilen, die 'bgpdump -m' dafür ausgibt
+CASES = {
+    "ipv4": (
+        mrt_update("10.0.0.1", 64500, [(AS_SEQUENCE, [64500, 3356, 13335])], announced=["1.1.1.0/24", "1.0.0.0/24"],
+                   withdrawn=["192.0.2.0/24"], communities=[(3356, 100)]),
+        ["BGP4MP|1760781600|W|10.0.0.1|64500|192.0.2.0/24",
+         "BGP4MP|1760781600|A|10.0.0.1|64500|1.1.1.0/24|64500 3356 13335|IGP|10.0.0.1|0|0|3356:100|NAG||",
+         "BGP4MP|1760781600|A|10.0.0.1|64500|1.0.0.0/24|64500 3356 13335|IGP|10.0.0.1|0|0|3356:100|NAG||"],
+    ),
+    "ipv6_extended_timestamp": (
+        mrt_update("2001:db8::2", 64501, [(AS_SEQUENCE, [64501, 6939])], announced=["2a00:1450::/32"],
+                   withdrawn=["2001:db8:1::/48"], microseconds=123456),
+        ["BGP4MP_ET|1760781600.123456|W|2001:db8::2|64501|2001:db8:1::/48",
+         "BGP4MP_ET|1760781600.123456|A|2001:db8::2|64501|2a00:1450::/32|64501 6939|IGP|2001:db8::1|0|0||NAG||"],
+    ),
+    "as_set": (
+        mrt_update("10.0.0.3", 64502, [(AS_SEQUENCE, [64502, 174]), (AS_SET, [64510, 64511])],
+                   announced=["198.51.100.0/24"]),
+        ["BGP4MP|1760781600|A|10.0.0.3|64502|198.51.100.0/24|64502 174 {64510,64511}|IGP|10.0.0.3|0|0||NAG||"],
+    ),
+    # 2-Byte-Session: AS4_PATH ist kürzer, das erste AS (Start-AS) stammt aus AS_PATH
+    "as4_path_shorter": (
+        mrt_update("10.0.0.4", 701, [(AS_SEQUENCE, [701, 3356, AS_TRANS, AS_TRANS])], announced=["203.0.113.0/24"],
+                   as4_segments=[(AS_SEQUENCE, [196608, 196609])], asn_size=2),
+        ["BGP4MP|1760781600|A|10.0.0.4|701|203.0.113.0/24|701 3356 196608 196609|IGP|10.0.0.4|0|0||NAG||"],
+    ),
+    "as4_path_with_set": (
+        mrt_update("10.0.0.5", 701, [(AS_SEQUENCE, [701, AS_TRANS]), (AS_SET, [1, 2])], announced=["100.64.0.0/10"],
+                   as4_segments=[(AS_SEQUENCE, [196608]), (AS_SET, [1, 2])], asn_size=2),
+        ["BGP4MP|1760781600|A|10.0.0.5|701|100.64.0.0/10|701 196608 {1,2}|IGP|10.0.0.5|0|0||NAG||"],
+    ),
+    # AS4_PATH länger als AS_PATH ist ungültig: AS_PATH wird unverändert übernommen
+    "as4_path_longer": (
+        mrt_update("10.0.0.6", 701, [(AS_SEQUENCE, [701, AS_TRANS])], announced=["192.0.2.0/24"],
+                   as4_segments=[(AS_SEQUENCE, [196608, 196609, 196610])], asn_size=2),
+        ["BGP4MP|1760781600|A|10.0.0.6|701|192.0.2.0/24|701 23456|IGP|10.0.0.6|0|0||NAG||"],
+    ),
+}
+
+
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_mrt_records_match_bgpdump(tmp_path, case):
+    record, bgpdump_lines = CASES[case]
+    dump = tmp_path / "updates.bz2"
+    dump.write_bytes(bz2.compress(record))
+    text = tmp_path / "updates.txt"
+    text.write_text("\n".join(bgpdump_lines) + "\n")
+
+    assert list(updater.iter_update_records(str(dump))) == list(updater.iter_update_records(str(text)))
+
+
+def test_truncated_dump_keeps_complete_records(tmp_path):
+    records = CASES["ipv4"][0] + CASES["as_set"][0]
+    dump = tmp_path / "updates.bz2"
+    dump.write_bytes(bz2.compress(records[:-10]))
+    parsed = list(updater.iter_update_records(str(dump)))
+    assert [fields[5] for fields in parsed] == ["192.0.2.0/24", "1.1.1.0/24", "1.0.0.0/24"]
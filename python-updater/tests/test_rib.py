@@ -0,0 +1,90 @@
+import os
+import pickle
+import random
+
+import pytest
+
+import rib
+from rib import RouteTable
+
+PEERS = [f"10.0.0.{i}" for i in range(6)]
+PREFIXES = [f"192.{i}.0.0/16" for i in range(30)] + ["2001:db8::/32"]
+
+
+def random_delta(rng, paths, count, timestamp):
+    """bgpdump-kompatible Records: überwiegend Announcements, etwa ein Drittel Withdrawals"""
+    records = []
+    for i in range(count):
+        peer, prefix = rng.choice(PEERS), rng.choice(PREFIXES)
+        if rng.random() < 0.3:
+            records.append(["BGP4MP", str(timestamp + i), "W", peer, "65000", prefix])
+        else:
+            records.append(["BGP4MP", str(timestamp + i), "A", peer, "6500" + peer[-1], prefix,
+                            rng.choice(paths), "IGP", peer, "0", "0", rng.choice(["", "1:1"])])
+    return records
+
+
+def announcement_set(store):
+    """Ankündigungen mit AS-Pfad als Text statt Pfad-ID (die IDs hängen von der Aufbau-Reihenfolge ab)"""
+    offsets, asns = store.path_offsets, store.path_asns
+    return {(prefix, " ".join(store.asn_text(code) for code in asns[offsets[path_id]:offsets[path_id + 1]].tolist())):
+            timestamp for (prefix, path_id), timestamp in store.announcements.items()}
+
+
+@pytest.fixture
+def paths():
+    rng = random.Random(7)
+    return [" ".join(str(rng.randint(1, 40)) for _ in range(rng.randint(1, 4))) for _ in range(80)]
+
+
+def test_incremental_rows_match_rebuild(tmp_path, paths, monkeypatch):
+    monkeypatch.setattr(rib, "RIB_SNAPSHOT_EVERY", 3)
+    rng = random.Random(1)
+    checkpoint = str(tmp_path / "rib.pickle")
+    table = RouteTable()
+    for cycle in range(12):
+        announcements = {}
+        for collector in ("rv2", "linx") if cycle % 2 else (None,):
+            table.apply(random_delta(rng, paths, rng.randint(0, 150), cycle * 1000), collector, announcements)
+        table.mark_applied(f"dump{cycle}")
+        table.save(checkpoint)
+        incremental = table.active_routes(announcements=announcements)
+
+        # Referenz: frisch aus Snapshot + Journal geladen, Zeilen komplett neu aufgebaut
+        loaded = RouteTable.load(checkpoint)
+        assert loaded.routes == table.routes
+        assert (loaded.state_id, loaded.last_source) == (table.state_id, table.last_source)
+        assert loaded.unique_as() == table.unique_as()
+        assert loaded.outgoing_counts() == table.outgoing_counts()
+        rebuilt = loaded.active_routes(announcements=announcements)
+        assert incremental.to_routes() == rebuilt.to_routes()
+        assert announcement_set(incremental) == announcement_set(rebuilt)
+
+
+def test_checkpoint_journal_and_snapshot(tmp_path, paths, monkeypatch):
+    monkeypatch.setattr(rib, "RIB_SNAPSHOT_EVERY", 2)
+    rng = random.Random(2)
+    checkpoint = str(tmp_path / "rib.pickle")
+    table = RouteTable()
+    sizes = []
+    for cycle in range(4):
+        table.apply(random_delta(rng, paths, 50, cycle * 100))
+        table.mark_applied(f"dump{cycle}")
+        table.save(checkpoint)
+        sizes.append(os.path.getsize(checkpoint + ".journal") if os.path.exists(checkpoint + ".journal") else 0)
+    # Snapshot, zwei Journal-Einträge, danach wieder ein Snapshot (Journal geleert)
+    assert sizes[0] == 0 and 0 < sizes[1] < sizes[2] and sizes[3] == 0
+
+    table.apply(random_delta(rng, paths, 50, 1000))
+    table.mark_applied("dump4")
+    table.save(checkpoint)
+    expected = dict(table.routes), table.state_id
+    journal_size = os.path.getsize(checkpoint + ".journal")
+
+    # Ein halb geschriebener Eintrag am Ende wird verworfen, der Rest bleibt gültig
+    with open(checkpoint + ".journal", "ab") as f:
+        f.write(pickle.dumps((table._generation, [], "dump5", "x"))[:-5])
+    loaded = RouteTable.load(checkpoint)
+    assert (loaded.routes, loaded.state_id) == expected
+    assert loaded.last_source == "dump4"
+    assert os.path.getsize(checkpoint + ".journal") == journal_size
@@ -0,0 +1,115 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from ripe_resolver import RipeResolver
+
+ENDPOINT = "/data/announced-prefixes/data.json"
+# Antworten des Stubs: Prefixe, leere Liste ("nichts gefunden"); alle anderen ASNs liefern HTTP 500
+PREFIXES = {"3333": [{"prefix": "193.0.0.0/21"}], "4444": []}
+PREFIXES.update({str(asn): [{"prefix": f"10.{asn % 256}.0.0/16"}] for asn in range(64500, 64520)})
+
+
+def announced_prefixes_handler(hits):
+    """Stub für RIPEstat 'announced-prefixes'; protokolliert (ASN, Zeitpunkt) jeder Anfrage"""
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            asn = parse_qs(url.query)["resource"][0]
+            with lock:
+                hits.append((asn, time.monotonic()))
+            if url.path != ENDPOINT or asn not in PREFIXES:
+                self.send_response(500)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = json.dumps({"data": {"prefixes": PREFIXES[asn]}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+@pytest.fixture
+def ripe(stub_server, tmp_path):
+    """Fabrik für RipeResolver gegen den Stub, alle mit demselben SQLite-Cache"""
+    hits = []
+    url = stub_server(announced_prefixes_handler(hits)) + ENDPOINT
+    resolvers = []
+
+    def make(**kwargs):
+        kwargs.setdefault("backoff", 0)
+        resolver = RipeResolver(url=url, cache_path=str(tmp_path / "ripestat.sqlite"), **kwargs)
+        resolvers.append(resolver)
+        return resolver
+
+    make.hits = hits
+    yield make
+    for resolver in resolvers:
+        resolver.close()
+
+
+def requested(hits):
+    return sorted(asn for asn, _ in hits)
+
+
+def test_positive_and_negative_results_are_cached(ripe):
+    resolver = ripe()
+    assert resolver.resolve_many(["3333", 4444]) == {"3333": PREFIXES["3333"], "4444": None}
+    assert requested(ripe.hits) == ["3333", "4444"]
+
+    assert resolver.resolve_many([3333, "4444"]) == {"3333": PREFIXES["3333"], "4444": None}
+    assert requested(ripe.hits) == ["3333", "4444"]
+
+
+def test_positive_and_negative_ttls_expire_separately(ripe):
+    ripe().resolve_many(["3333", "4444"])
+    del ripe.hits[:]
+
+    ripe(ttl=0, negative_ttl=3600).resolve_many(["3333", "4444"])
+    assert requested(ripe.hits) == ["3333"]
+    del ripe.hits[:]
+
+    ripe(ttl=3600, negative_ttl=0).resolve_many(["3333", "4444"])
+    assert requested(ripe.hits) == ["4444"]
+
+
+def test_failed_requests_are_retried_but_not_cached(ripe):
+    resolver = ripe(retries=2)
+    assert resolver.resolve_many(["5555", "3333"]) == {"3333": PREFIXES["3333"]}
+    assert requested(ripe.hits) == ["3333", "5555", "5555", "5555"]
+    del ripe.hits[:]
+
+    assert resolver.resolve_many(["5555", "3333"]) == {"3333": PREFIXES["3333"]}
+    assert requested(ripe.hits) == ["5555", "5555", "5555"]
+
+
+def test_rate_limit_holds_across_workers(ripe):
+    rate = 20
+    asns = [str(asn) for asn in range(64500, 64520)]
+    ripe(rate=rate, workers=8).resolve_many(asns)
+
+    times = sorted(t for _, t in ripe.hits)
+    assert len(times) == len(asns)
+    assert times[-1] - times[0] >= (len(times) - 1) / rate * 0.9
+
+
+def test_retries_go_through_the_rate_limiter(ripe):
+    rate = 10
+    ripe(rate=rate, workers=1, retries=4).resolve_many(["5555"])
+
+    times = [t for _, t in ripe.hits]
+    assert len(times) == 5
+    assert times[-1] - times[0] >= (len(times) - 1) / rate * 0.9
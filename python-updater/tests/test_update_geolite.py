@@ -0,0 +1,170 @@
+import hashlib
+import io
+import json
+import os
+import tarfile
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import update_geolite
+from asn_index import load_asn_index
+
+ASN_HEADER = "network,autonomous_system_number,autonomous_system_organization\n"
+
+
+def city_archive(version):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, data in ((f"GeoLite2-City_{version}/GeoLite2-City.mmdb", f"mmdb {version}".encode()),
+                           (f"GeoLite2-City_{version}/COPYRIGHT.txt", b"copyright")):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def asn_archive(version, asn):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, network in zip(update_geolite.ASN_CSV_FILES, ("1.0.0.0/24", "2001:db8::/32")):
+            archive.writestr(f"GeoLite2-ASN-CSV_{version}/{name}", ASN_HEADER + f"{network},{asn},Test\n")
+        archive.writestr(f"GeoLite2-ASN-CSV_{version}/LICENSE.txt", "license")
+    return buffer.getvalue()
+
+
+class MaxMindStub:
+    """Stub des MaxMind-Downloads: Archive mit ETag, .sha256-Dateien und bedingte Requests (304)"""
+
+    def __init__(self):
+        self.editions = {}
+        self.bad_checksum = set()
+        self.hits = []
+        self.lock = threading.Lock()
+
+    def publish(self, edition, data, etag):
+        self.editions[edition] = (data, f'"{etag}"')
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                edition, suffix = query["edition_id"][0], query["suffix"][0]
+                data, etag = stub.editions[edition]
+                if suffix.endswith(".sha256"):
+                    digest = "0" * 64 if edition in stub.bad_checksum else hashlib.sha256(data).hexdigest()
+                    body, status = f"{digest}  {edition}.{suffix[:-len('.sha256')]}\n".encode(), "sha256"
+                elif self.headers.get("If-None-Match") == etag:
+                    body, status = None, 304
+                else:
+                    body, status = data, 200
+                with stub.lock:
+                    stub.hits.append((edition, status))
+                if body is None:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+@pytest.fixture
+def maxmind(stub_server, monkeypatch):
+    stub = MaxMindStub()
+    stub.publish("GeoLite2-City", city_archive(1), "city-1")
+    stub.publish("GeoLite2-ASN-CSV", asn_archive(1, 64500), "asn-1")
+    monkeypatch.setattr(update_geolite, "GEOLITE_DOWNLOAD_URL", stub_server(stub.handler()) + "/app/geoip_download")
+    monkeypatch.setattr(update_geolite, "LICENSE_KEY", "test")
+    return stub
+
+
+@pytest.fixture
+def refresh(tmp_path):
+    local_dir = tmp_path / "geolite_database"
+
+    def run():
+        return update_geolite.refresh_geolite(local_dir=str(local_dir) + "/", state_path=str(tmp_path / "state.json"),
+                                              pidfile=str(tmp_path / "scheduler.pid"))
+
+    run.local_dir = local_dir
+    run.state_path = tmp_path / "state.json"
+    return run
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_first_install_then_not_modified(maxmind, refresh):
+    assert refresh() is True
+    local_dir = refresh.local_dir
+    assert local_dir.is_symlink()
+    assert sorted(os.listdir(local_dir)) == ["GeoLite2-ASN-Blocks-IPv4.csv", "GeoLite2-ASN-Blocks-IPv6.csv",
+                                             update_geolite.ASN_ARTIFACT_FILE, "GeoLite2-City.mmdb"]
+    assert read(local_dir / "GeoLite2-City.mmdb") == b"mmdb 1"
+    index = load_asn_index(tuple(str(local_dir / name) for name in update_geolite.ASN_CSV_FILES))
+    try:
+        assert index.mapping is not None
+        assert index.lookup("1.0.0.1") == 64500
+    finally:
+        index.close()
+    state = json.loads(read(refresh.state_path))
+    assert state["GeoLite2-City"]["etag"] == '"city-1"'
+    assert state["GeoLite2-ASN-CSV"]["sha256"] == hashlib.sha256(maxmind.editions["GeoLite2-ASN-CSV"][0]).hexdigest()
+
+    # Zweiter Lauf: beide Editionen unverändert (304), nichts wird installiert
+    release = os.readlink(local_dir)
+    maxmind.hits.clear()
+    assert refresh() is False
+    assert sorted(maxmind.hits) == [("GeoLite2-ASN-CSV", 304), ("GeoLite2-City", 304)]
+    assert os.readlink(local_dir) == release
+    assert sorted(os.listdir(local_dir.parent)) == ["geolite_database", os.path.basename(release), "state.json"]
+
+
+def test_changed_edition_replaces_release_and_keeps_the_other(maxmind, refresh):
+    refresh()
+    local_dir = refresh.local_dir
+    release = os.readlink(local_dir)
+    asn_inode = os.stat(local_dir / "GeoLite2-ASN-Blocks-IPv4.csv").st_ino
+
+    maxmind.publish("GeoLite2-City", city_archive(2), "city-2")
+    assert refresh() is True
+    assert os.readlink(local_dir) != release
+    assert not os.path.exists(local_dir.parent / release)
+    assert read(local_dir / "GeoLite2-City.mmdb") == b"mmdb 2"
+    # Die unveränderte ASN-Edition wird aus dem bisherigen Release übernommen
+    assert os.stat(local_dir / "GeoLite2-ASN-Blocks-IPv4.csv").st_ino == asn_inode
+    assert (local_dir / update_geolite.ASN_ARTIFACT_FILE).exists()
+
+
+def test_checksum_mismatch_keeps_installed_release(maxmind, refresh):
+    refresh()
+    local_dir = refresh.local_dir
+    release = os.readlink(local_dir)
+    state = read(refresh.state_path)
+    csv_before = read(local_dir / "GeoLite2-ASN-Blocks-IPv4.csv")
+
+    maxmind.publish("GeoLite2-ASN-CSV", asn_archive(2, 64511), "asn-2")
+    maxmind.bad_checksum.add("GeoLite2-ASN-CSV")
+    with pytest.raises(update_geolite.ChecksumMismatch):
+        refresh()
+
+    assert os.readlink(local_dir) == release
+    assert read(local_dir / "GeoLite2-ASN-Blocks-IPv4.csv") == csv_before
+    assert read(refresh.state_path) == state
+    # Kein Staging-Verzeichnis bleibt zurück
+    assert sorted(os.listdir(local_dir.parent)) == ["geolite_database", os.path.basename(release), "state.json"]
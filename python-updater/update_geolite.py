@@ -1,85 +1,286 @@
+import argparse
+import hashlib
+import json
+import logging
 import os
-import requests
 import shutil
-from datetime import datetime
-from zipfile import ZipFile
-import gzip
+import signal
 import tarfile
+import tempfile
+from datetime import datetime, timezone
+from zipfile import ZipFile
+
+import requests
 from dotenv import load_dotenv
 
+import metrics
+from asn_index import ASN_ARTIFACT_FILE, compile_asn_artifact
+from json_writer import dumps_compact, write_bytes_atomic
+
 # .env Datei laden
 load_dotenv()
 
-# Lizenzschlüssel sicher aus Umgebungsvariable holen
+# Lizenzschlüssel sicher aus Umgebungsvariable holen (geprüft in main)
 LICENSE_KEY = os.getenv("MAXMIND_LICENSE_KEY")
-if not LICENSE_KEY:
-    raise ValueError("Lizenzschlüssel nicht gefunden! Setze MAXMIND_LICENSE_KEY in einer .env Datei.")
 
-# URLs für GeoIP Daten
-GEOIP_URL_CITY = f"https://download.maxmind.com/app/geoip_download?edition_id=GeoLite2-City&license_key={LICENSE_KEY}&suffix=tar.gz"
-GEOIP_URL_ASN_CSV = f"https://download.maxmind.com/app/geoip_download?edition_id=GeoLite2-ASN-CSV&license_key={LICENSE_KEY}&suffix=zip"
+# Download-Endpunkt von MaxMind (per Umgebungsvariable überschreibbar, z. B. für einen lokalen Stub-Server)
+GEOLITE_DOWNLOAD_URL = os.getenv("GEOLITE_DOWNLOAD_URL", "https://download.maxmind.com/app/geoip_download")
+# Editionen und ihr Archivformat; übernommen werden nur die .mmdb- und .csv-Dateien daraus
+EDITIONS = {"GeoLite2-City": "tar.gz", "GeoLite2-ASN-CSV": "zip"}
+EXTRACT_SUFFIXES = (".mmdb", ".csv")
 
-# Lokales Verzeichnis zum Speichern
+# Lokales Verzeichnis zum Speichern. Es ist ein Symlink auf das aktuelle Release
+# (geolite_database.<zeitstempel>), der beim Update atomar umgesetzt wird.
 LOCAL_DIR = "../data/geolite_database/"
-os.makedirs(LOCAL_DIR, exist_ok=True)
-
-def download_and_extract(url, local_dir):
-    """Lädt die Datei herunter und extrahiert sie basierend auf dem Dateityp (.tar.gz, .zip, .gz)"""
-
-    # Bestimme den Dateinamen
-    filename = os.path.join(local_dir, url.split("=")[1] + ".tar.gz" if url.endswith("tar.gz") else ".zip")
-
-    print(f"Lade {url} herunter...")
-    with requests.get(url, stream=True) as r:
-        r.raise_for_status()
-        with open(filename, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
-
-    # Entpacken basierend auf Dateityp
-    if filename.endswith(".tar.gz"):
-        print(f"Entpacke {filename} als tar.gz...")
-        with tarfile.open(filename, "r:gz") as tar:
-            tar.extractall(local_dir)
-    elif filename.endswith(".zip"):
-        print(f"Entpacke {filename} als zip...")
-        with ZipFile(filename, "r") as zip_ref:
-            zip_ref.extractall(local_dir)
-    elif filename.endswith(".gz"):
-        print(f"Entpacke {filename} als gz...")
-        with gzip.open(filename, "rb") as f_in:
-            extracted_file_path = filename[:-3]  # Entfernt das .gz Suffix
-            with open(extracted_file_path, "wb") as f_out:
-                shutil.copyfileobj(f_in, f_out)
-
-    # Lösche die heruntergeladene Datei nach dem Entpacken
-    os.remove(filename)
-
-    # Verschiebe alle .mmdb oder .csv-Dateien eine Ebene höher
-    for root, dirs, files in os.walk(local_dir):
-        for file in files:
-            if file.endswith(".mmdb") or file.endswith(".csv"):
-                extracted_file_path = os.path.join(root, file)
-                print(f"Verschiebe {extracted_file_path} nach {os.path.dirname(local_dir)}")
-                shutil.move(extracted_file_path, os.path.join(os.path.dirname(local_dir), file))
-
-def delete_subdirectories(directory):
-    """Löscht alle Unterverzeichnisse (Ordner) im angegebenen Verzeichnis, aber behält Dateien."""
-    if os.path.exists(directory):
-        # Iteriere über alle Elemente im Verzeichnis
-        for item in os.listdir(directory):
-            item_path = os.path.join(directory, item)
-            # Überprüfe, ob es ein Verzeichnis ist
-            if os.path.isdir(item_path):
-                print(f"Lösche das Verzeichnis: {item_path}")
-                shutil.rmtree(item_path)  # Löscht das Unterverzeichnis und seinen Inhalt
-            else:
-                pass
-                #print(f"Behalte die Datei: {item_path}")
-    else:
-        print(f"Das Verzeichnis {directory} existiert nicht.")
+ASN_CSV_FILES = ("GeoLite2-ASN-Blocks-IPv4.csv", "GeoLite2-ASN-Blocks-IPv6.csv")
+# ETag, Last-Modified und SHA-256 der installierten Archive für bedingte Requests
+STATE_PATH = "../data/geolite_state.json"
+# PID-Datei des Schedulers; er erhält nach einem Update SIGHUP und lädt die GeoLite-Dateien neu
+RELOAD_PIDFILE = os.getenv("GEOLITE_RELOAD_PIDFILE", "../data/scheduler.pid")
+
+CHUNK_SIZE = 1 << 16
+
+logger = logging.getLogger(__name__)
+
+
+class ChecksumMismatch(ValueError):
+    """Das geladene Archiv passt nicht zur von MaxMind veröffentlichten SHA-256"""
+
+
+class _HashingReader:
+    """Datei-Wrapper, der beim Lesen die SHA-256 des Streams mitberechnet"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.sha256.update(data)
+        self.size += len(data)
+        return data
+
+    def drain(self):
+        """Liest den Rest des Streams (z. B. Padding hinter dem tar-Ende) für den vollständigen Digest"""
+        while self.read(CHUNK_SIZE):
+            pass
+        return self.sha256.hexdigest()
+
+
+def edition_url(edition, suffix):
+    return f"{GEOLITE_DOWNLOAD_URL}?edition_id={edition}&license_key={LICENSE_KEY}&suffix={suffix}"
+
+
+def load_state(state_path=STATE_PATH):
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state, state_path=STATE_PATH):
+    write_bytes_atomic(dumps_compact(state), state_path, compression=())
+
+
+def _wanted(name):
+    """Zielname eines Archiv-Members (ohne Verzeichnisse) oder None, wenn er nicht gebraucht wird"""
+    base = os.path.basename(name)
+    return base if base.endswith(EXTRACT_SUFFIXES) else None
+
+
+def _write_member(source, target_dir, name):
+    with open(os.path.join(target_dir, name), "wb") as f:
+        shutil.copyfileobj(source, f, CHUNK_SIZE)
+    return name
+
+
+def extract_tar_stream(fileobj, target_dir):
+    """Entpackt die benötigten Dateien direkt aus dem .tar.gz-Stream, ohne das Archiv abzulegen"""
+    extracted = []
+    with tarfile.open(fileobj=fileobj, mode="r|gz") as tar:
+        for member in tar:
+            name = _wanted(member.name)
+            if member.isfile() and name:
+                extracted.append(_write_member(tar.extractfile(member), target_dir, name))
+    return extracted
+
+
+def extract_zip_stream(fileobj, target_dir):
+    """
+    Zip hat sein Inhaltsverzeichnis am Ende und lässt sich nicht vorwärts lesen: der Stream
+    wird in eine temporäre Datei im Zielverzeichnis gespoolt und danach gelöscht.
+    """
+    extracted = []
+    with tempfile.TemporaryFile(dir=target_dir) as spool:
+        shutil.copyfileobj(fileobj, spool, CHUNK_SIZE)
+        spool.seek(0)
+        with ZipFile(spool) as archive:
+            for info in archive.infolist():
+                name = _wanted(info.filename)
+                if not info.is_dir() and name:
+                    with archive.open(info) as source:
+                        extracted.append(_write_member(source, target_dir, name))
+    return extracted
+
+
+def fetch_checksum(session, edition, suffix):
+    """Von MaxMind veröffentlichte SHA-256 des Archivs (Format: "<hex>  <dateiname>")"""
+    response = session.get(edition_url(edition, suffix + ".sha256"), timeout=60)
+    response.raise_for_status()
+    return response.text.split()[0].lower()
+
+
+def download_edition(session, edition, suffix, target_dir, previous=None):
+    """
+    Lädt eine Edition bedingt (If-None-Match/If-Modified-Since aus previous) und entpackt
+    die benötigten Dateien während des Downloads nach target_dir. Gibt None zurück, wenn
+    sich das Archiv nicht geändert hat (HTTP 304), sonst den neuen Zustand der Edition.
+    Passt die SHA-256 nicht, wird ChecksumMismatch ausgelöst.
+    """
+    headers = {}
+    if previous:
+        if previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
+
+    with session.get(edition_url(edition, suffix), headers=headers, stream=True, timeout=60) as response:
+        if response.status_code == 304:
+            logger.info("%s unverändert", edition)
+            return None
+        response.raise_for_status()
+        expected = fetch_checksum(session, edition, suffix)
+
+        logger.info("Lade und entpacke %s", edition)
+        reader = _HashingReader(response.raw)
+        extract = extract_tar_stream if suffix == "tar.gz" else extract_zip_stream
+        files = extract(reader, target_dir)
+        digest = reader.drain()
+
+    if digest != expected:
+        raise ChecksumMismatch(f"{edition}: SHA-256 {digest} statt {expected}")
+    logger.info("%s: %d Bytes, SHA-256 geprüft, %s", edition, reader.size, ", ".join(files))
+    return {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified"),
+            "sha256": digest, "files": files}
+
+
+def _link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def swap_directory(staging_dir, local_dir=LOCAL_DIR):
+    """
+    Macht staging_dir zum neuen Inhalt von local_dir: das Release wird neben local_dir
+    abgelegt und der Symlink local_dir per os.replace atomar umgesetzt, Leser sehen also
+    immer einen vollständigen Stand. Ältere Releases werden danach entfernt; offene
+    Reader behalten ihre Dateien, bis sie geschlossen werden. Ohne Symlinks (Windows)
+    wird das Verzeichnis per Umbenennen getauscht.
+    """
+    link = os.path.normpath(local_dir)
+    release = f"{link}.{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S%f')}"
+    os.rename(staging_dir, release)
+
+    if os.path.isdir(link) and not os.path.islink(link):
+        # Bisheriges echtes Verzeichnis einmalig zum Release machen, damit es ersetzt werden kann
+        os.rename(link, f"{link}.legacy")
+    try:
+        os.symlink(os.path.basename(release), link + ".swap", target_is_directory=True)
+        os.replace(link + ".swap", link)
+    except (OSError, NotImplementedError):
+        if os.path.exists(link):
+            os.rename(link, link + ".old")
+        os.rename(release, link)
+        release = link
+
+    parent, name = os.path.split(link)
+    for entry in os.listdir(parent or "."):
+        path = os.path.join(parent, entry)
+        if entry.startswith(name + ".") and path != release and not entry.endswith(".swap"):
+            shutil.rmtree(path, ignore_errors=True)
+    logger.info("GeoLite-Dateien installiert: %s", release)
+
+
+def notify_reload(pidfile=RELOAD_PIDFILE):
+    """Signalisiert dem laufenden Scheduler (SIGHUP), die GeoLite-Dateien neu zu öffnen"""
+    sighup = getattr(signal, "SIGHUP", None)
+    try:
+        with open(pidfile, "r", encoding="utf-8") as f:
+            pid = int(f.read().strip())
+    except (OSError, ValueError):
+        return False
+    if sighup is None:
+        return False
+    try:
+        os.kill(pid, sighup)
+    except OSError as e:
+        logger.warning("Reload-Signal an PID %d nicht zugestellt: %s", pid, e)
+        return False
+    logger.info("Reload-Signal an PID %d gesendet", pid)
+    return True
+
+
+def refresh_geolite(local_dir=LOCAL_DIR, state_path=STATE_PATH, pidfile=RELOAD_PIDFILE, force=False):
+    """
+    Aktualisiert die GeoLite-Dateien: bedingte Downloads, Prüfung der SHA-256, Entpacken
+    nur der .mmdb/.csv-Dateien in ein Staging-Verzeichnis, neuer ASN-Index, atomarer
+    Tausch und Reload-Signal. Unveränderte Editionen werden aus dem aktuellen Stand
+    übernommen. Gibt True zurück, wenn ein neuer Stand installiert wurde.
+    """
+    state = {} if force else load_state(state_path)
+    current = os.path.normpath(local_dir)
+    parent = os.path.dirname(current) or "."
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=os.path.basename(current) + ".staging-", dir=parent)
+    os.chmod(staging, 0o755)  # mkdtemp legt 0700 an, das Release muss für alle Leser lesbar sein
+    try:
+        changed = {}
+        with requests.Session() as session:
+            for edition, suffix in EDITIONS.items():
+                previous = state.get(edition)
+                installed = previous and all(os.path.exists(os.path.join(current, name))
+                                             for name in previous.get("files", ()))
+                entry = download_edition(session, edition, suffix, staging, previous if installed else None)
+                if entry is not None:
+                    changed[edition] = entry
+        if not changed:
+            logger.info("GeoLite-Dateien aktuell, nichts zu tun")
+            return False
+
+        if "GeoLite2-ASN-CSV" in changed or not os.path.exists(os.path.join(current, ASN_ARTIFACT_FILE)):
+            # ASN-CSVs (IPv4 und IPv6) einmalig in das mmap-fähige Binärformat übersetzen
+            asn_dir = staging if "GeoLite2-ASN-CSV" in changed else current
+            compile_asn_artifact(tuple(os.path.join(asn_dir, name) for name in ASN_CSV_FILES),
+                                 os.path.join(staging, ASN_ARTIFACT_FILE))
+        if os.path.isdir(current):
+            for name in os.listdir(current):
+                source = os.path.join(current, name)
+                if (name.endswith((*EXTRACT_SUFFIXES, ".idx")) and os.path.isfile(source)
+                        and not os.path.exists(os.path.join(staging, name))):
+                    _link_or_copy(source, os.path.join(staging, name))
+
+        swap_directory(staging, local_dir)
+        save_state({**state, **changed}, state_path)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    notify_reload(pidfile)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aktualisiert GeoLite2-City und GeoLite2-ASN-CSV")
+    parser.add_argument("--force", action="store_true", help="Ohne bedingte Requests neu laden")
+    args = parser.parse_args()
+
+    metrics.setup_logging()
+    if not LICENSE_KEY:
+        raise ValueError("Lizenzschlüssel nicht gefunden! Setze MAXMIND_LICENSE_KEY in einer .env Datei.")
+    refresh_geolite(force=args.force)
+
 
 if __name__ == "__main__":
-    download_and_extract(GEOIP_URL_CITY, LOCAL_DIR)
-    download_and_extract(GEOIP_URL_ASN_CSV, LOCAL_DIR)
-    delete_subdirectories(LOCAL_DIR)
+    main()
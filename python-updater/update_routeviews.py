@@ -1,17 +1,33 @@
 import os
+import logging
 import requests
 import subprocess
 import platform
 import shutil
 import bz2
 from datetime import datetime, timedelta
-
-# Basis-URL für BGP-Updates
-BASE_URL = "http://archive.routeviews.org/bgpdata/{year}.{month}/UPDATES/"
+import metrics
+from stage_cache import file_digest
+
+# Archiv der BGP-Updates (per Umgebungsvariable überschreibbar, z. B. für einen lokalen Stub-Server)
+ROUTEVIEWS_ARCHIVE = os.getenv("ROUTEVIEWS_ARCHIVE", "http://archive.routeviews.org").rstrip("/")
+# Der Standard-Collector liegt direkt unter /bgpdata, alle anderen unter /<collector>/bgpdata
+DEFAULT_COLLECTOR = "route-views2"
+BASE_URL = "{archive}/{collector_dir}bgpdata/{year}.{month}/UPDATES/"
 LOCAL_DIR = "../data/"
 os.makedirs(LOCAL_DIR, exist_ok=True)
 LOCAL_DIR_TMP = "../data/.tmp"
 
+# Parser-Backend: "bgpdump" (externer Prozess) oder "mrt" (eingebauter Python-Parser)
+PARSER_BACKEND = os.getenv("BGP_PARSER_BACKEND", "bgpdump")
+MRT_DUMP_FILENAME = "updates.bz2"
+# Zeitlimit (Sekunden) für die HEAD-Anfragen, mit denen auf neue Dumps geprüft wird
+PROBE_TIMEOUT = float(os.getenv("ROUTEVIEWS_PROBE_TIMEOUT", "10"))
+# RouteViews veröffentlicht einen Update-Dump pro 15-Minuten-Intervall
+INTERVAL = timedelta(minutes=15)
+
+logger = logging.getLogger(__name__)
+
 def windows_to_wsl_path(win_path):
     """Konvertiert einen Windows-Pfad in das WSL-Format."""
     win_path = os.path.abspath(win_path)
@@ -23,43 +39,79 @@ def windows_to_wsl_path(win_path):
 
     return win_path
 
-def get_latest_update_url():
-    """Erzeugt die URL für das aktuellste BGP-Update basierend auf UTC-Zeit mit korrektem 15-Minuten-Intervall"""
-    now = datetime.utcnow() - timedelta(minutes=30)
+def floor_interval(when):
+    """Rundet auf den Beginn des 15-Minuten-Intervalls ab"""
+    return when.replace(minute=(when.minute // 15) * 15, second=0, microsecond=0)
+
+def interval_stamp(interval):
+    """Kennung wie im Dateinamen der Dumps, z. B. 20251014.1215"""
+    return interval.strftime("%Y%m%d.%H%M")
 
-    # Rundung auf das letzte 15-Minuten-Intervall
-    minute_block = (now.minute // 15) * 15  # 00, 15, 30, 45
-    rounded_time = now.replace(minute=minute_block, second=0, microsecond=0)
+def latest_interval():
+    """Beginn des aktuellsten verfügbaren 15-Minuten-Intervalls (UTC, 30 Minuten Verzögerung)"""
+    return floor_interval(datetime.utcnow() - timedelta(minutes=30))
 
-    year, month, day, hour, minute = rounded_time.strftime("%Y"), rounded_time.strftime("%m"), rounded_time.strftime("%d"), rounded_time.strftime("%H"), rounded_time.strftime("%M")
+def update_url_for(collector, interval):
+    """URL des Update-Dumps eines Collectors für ein 15-Minuten-Intervall"""
+    year, month, day, hour, minute = interval.strftime("%Y"), interval.strftime("%m"), interval.strftime("%d"), interval.strftime("%H"), interval.strftime("%M")
     filename = f"updates.{year}{month}{day}.{hour}{minute}.bz2"
+    collector_dir = "" if collector == DEFAULT_COLLECTOR else f"{collector}/"
 
-    return BASE_URL.format(year=year, month=month) + filename
+    return BASE_URL.format(archive=ROUTEVIEWS_ARCHIVE, collector_dir=collector_dir, year=year, month=month) + filename
 
-def download_update_dump(url, output_dir):
-    os.makedirs(LOCAL_DIR_TMP, exist_ok=True)
-    filename = os.path.join(LOCAL_DIR_TMP, url.split('/')[-1])
+def get_latest_update_url(collector=DEFAULT_COLLECTOR):
+    """Erzeugt die URL für das aktuellste BGP-Update basierend auf UTC-Zeit mit korrektem 15-Minuten-Intervall"""
+    return update_url_for(collector, latest_interval())
+
+def dump_available(url, session=None, timeout=PROBE_TIMEOUT):
+    """
+    Prüft per HEAD-Request, ob ein Dump bereits veröffentlicht ist, ohne ihn zu laden.
+    404 heißt „noch nicht da“; Netzwerkfehler und andere Statuscodes werden ebenfalls
+    als nicht verfügbar gewertet und nur protokolliert, damit der Aufrufer es später erneut versucht.
+    """
+    try:
+        response = (session or requests).head(url, timeout=timeout, allow_redirects=True)
+    except requests.RequestException as e:
+        logger.warning("HEAD %s fehlgeschlagen: %s", url, e)
+        return False
+    if response.status_code == 200:
+        return response.headers.get("Content-Length") != "0"
+    if response.status_code != 404:
+        logger.warning("HEAD %s: HTTP %d", url, response.status_code)
+    return False
+
+def download_update_dump(url, output_dir, decompress=True):
+    """Lädt den .bz2-Dump herunter; mit decompress=False bleibt er komprimiert (für das MRT-Backend)"""
+    os.makedirs(output_dir, exist_ok=True)
+    filename = os.path.join(output_dir, url.split('/')[-1])
 
     # Prüfen, ob Datei schon existiert
     if os.path.exists(filename):
-        print(f"{filename} existiert bereits.")
+        logger.info("%s existiert bereits.", filename)
         return filename
 
-    response = requests.get(url, stream=True)
-    with open(filename, 'wb') as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
-    print(f"Gespeichert unter: {filename}")
+    with requests.get(url, stream=True) as response:
+        response.raise_for_status()
+        with open(filename + ".part", 'wb') as f:
+            for chunk in response.iter_content(chunk_size=8192):
+                f.write(chunk)
+    os.replace(filename + ".part", filename)
+    logger.info("Gespeichert unter: %s", filename)
 
-    # Entpacke die .bz2 Datei und speichere sie als 'updates'
-    updates_file = os.path.join(LOCAL_DIR_TMP, 'updates')
+    if not decompress:
+        return filename
+    return decompress_update_dump(filename, output_dir)
+
+def decompress_update_dump(filename, output_dir):
+    """Entpackt den .bz2-Dump als 'updates' und löscht die komprimierte Datei"""
+    updates_file = os.path.join(output_dir, 'updates')
     with bz2.BZ2File(filename, 'rb') as f_in:
         with open(updates_file, 'wb') as f_out:
             shutil.copyfileobj(f_in, f_out)
 
     # Lösche die ursprüngliche .bz2 Datei nach dem Entpacken
     os.remove(filename)
-    print(f"Entpackt als {updates_file}")
+    logger.info("Entpackt als %s", updates_file)
 
     return updates_file
 
@@ -74,7 +126,7 @@ def parse_update_with_bgpdump(update_file, output_dir, output_filename):
         wsl_update_file = windows_to_wsl_path(update_file)
         wsl_output_file = windows_to_wsl_path(output_file)
 
-        print(f"[Windows/WSL] Verarbeite mit bgpdump: {wsl_update_file} -> {wsl_output_file}")
+        logger.info("[Windows/WSL] Verarbeite mit bgpdump: %s -> %s", wsl_update_file, wsl_output_file)
 
         #Erstelle das Verzeichnis für die Ausgabe in WSL in Windows
         subprocess.run(["wsl", "mkdir", "-p", windows_to_wsl_path(output_dir)], check=True)
@@ -83,7 +135,7 @@ def parse_update_with_bgpdump(update_file, output_dir, output_filename):
 
     else:
         #Unter Linux
-        print(f"[Linux] Verarbeite mit bgpdump: {update_file} -> {output_file}")
+        logger.info("[Linux] Verarbeite mit bgpdump: %s -> %s", update_file, output_file)
 
         subprocess.run(["bgpdump", "-m", update_file, "-O", output_file],  check=True)
 
@@ -93,12 +145,52 @@ def clean_old_files(dir):
     """Löscht alte Update-Dateien, behält nur die neueste"""
     if os.path.exists(dir):
         shutil.rmtree(dir)
-        print(f"Alte Dateien aus {dir} gelöscht.")
+        logger.info("Alte Dateien aus %s gelöscht.", dir)
+
+def _read_source_digest(parsed_file):
+    """SHA-256 des .bz2-Dumps, aus dem parsed_file erzeugt wurde (oder None)"""
+    try:
+        with open(parsed_file + ".sha256", "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def _write_source_digest(parsed_file, digest):
+    with open(parsed_file + ".sha256", "w") as f:
+        f.write(digest)
+
+def fetch_latest_update(update_url=None, collector=DEFAULT_COLLECTOR):
+    """
+    Lädt das aktuellste Update und bereitet es für das gewählte Backend vor.
+    Gibt den Pfad zurück, den updater.iter_update_records lesen kann
+    (.bz2 beim MRT-Backend, updates.txt bei bgpdump).
+    """
+    update_url = update_url or get_latest_update_url(collector)
+    parsed_file = None
+
+    if PARSER_BACKEND == "mrt":
+        # Komprimierten Dump behalten, updater.py dekodiert ihn direkt
+        update_file = download_update_dump(update_url, LOCAL_DIR_TMP, decompress=False)
+        if update_file:
+            parsed_file = os.path.join(LOCAL_DIR, MRT_DUMP_FILENAME)
+            shutil.move(update_file, parsed_file)
+    else:
+        update_file = download_update_dump(update_url, LOCAL_DIR_TMP, decompress=False)
+
+        if update_file:
+            parsed_file = os.path.join(LOCAL_DIR, "updates.txt")
+            digest = file_digest(update_file)
+            if os.path.exists(parsed_file) and _read_source_digest(parsed_file) == digest:
+                # Gleicher Dump wie beim letzten Lauf: bgpdump-Ausgabe ist noch aktuell
+                logger.info("%s unverändert, bgpdump wird übersprungen.", update_url)
+            else:
+                _write_source_digest(parsed_file, "")  # bis bgpdump fertig ist, gilt die Ausgabe als veraltet
+                updates = decompress_update_dump(update_file, LOCAL_DIR_TMP)
+                parsed_file = parse_update_with_bgpdump(updates, LOCAL_DIR, "updates.txt")
+                _write_source_digest(parsed_file, digest)
+    clean_old_files(LOCAL_DIR_TMP)
+    return parsed_file
 
 if __name__ == "__main__":
-    update_url = get_latest_update_url()
-    update_file = download_update_dump(update_url, LOCAL_DIR_TMP)
-
-    if update_file:
-        parsed_file = parse_update_with_bgpdump(update_file, LOCAL_DIR, "updates.txt")
-    clean_old_files(LOCAL_DIR_TMP)
+    metrics.setup_logging()
+    fetch_latest_update()
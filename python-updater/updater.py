@@ -1,202 +1,226 @@
-import geoip2.database
-import requests
-import json
-from tqdm import tqdm
-import csv
+import logging
+import os
+import metrics
+import mrt_reader
+from asn_index import load_asn_index, to_asn
+from ripe_resolver import RipeResolver
+from route_store import RouteStoreBuilder
+from json_writer import OUTPUT_COMPACT, compact_path, write_json_stream, write_routes_compact
+from geo_lookup import GeoLookup, open_city_reader
+from geo_cache import GEO_CACHE_PATH, GeoCache, geolite_build_id
 
 # Pfad zur entpackten GeoLite2-Datenbank
 geo_db_path_geo = "../data/geolite_database/GeoLite2-City.mmdb"
 geo_csv_path_ip = "../data/geolite_database/GeoLite2-ASN-Blocks-IPv4.csv"
+geo_csv_path_ip6 = "../data/geolite_database/GeoLite2-ASN-Blocks-IPv6.csv"
+geo_csv_paths = (geo_csv_path_ip, geo_csv_path_ip6)
+
+geo_cache_path = GEO_CACHE_PATH
 
 update_routes_list = "../data/updates.txt"
+update_dump_mrt = "../data/updates.bz2"
+
+# Parser-Backend: "bgpdump" (Textdatei von bgpdump -m) oder "mrt" (eingebauter Parser)
+PARSER_BACKEND = os.getenv("BGP_PARSER_BACKEND", "bgpdump")
+
+logger = logging.getLogger(__name__)
 
 # GeoIP2-Datenbank öffnen
 #reader = geoip2.database.Reader(geo_db_path_geo)
 
-def extract_unique_as(file_path):
-    """Findet alle uniquen AS in einem Update-Dump und zählt, wie oft ein AS an Platz [0] steht"""
-    unique_as = set()  # Set für einzigartige AS-Nummern
-    first_as_count = {}  # Dictionary für die Häufigkeit des ersten AS
-
+def iter_update_records(file_path):
+    """Liest einen bgpdump -m Dump zeilenweise (Generator) und liefert pro Zeile die Felder.
+       .bz2-Dateien werden als MRT-Dump direkt mit dem eingebauten Parser dekodiert."""
+    if file_path.endswith(".bz2"):
+        yield from mrt_reader.read_bz2_updates(file_path)
+        return
     with open(file_path, 'r') as file:
         for line in file:
-            parts = line.split('|')  # Teile die Zeile anhand von '|'
-            if len(parts) > 2:
-                status = parts[2]
-            else:
-                status = "unknown"
-            if len(parts) > 6 and status == "A":  # Überprüfe, ob der AS-Pfad vorhanden ist
-                as_path = parts[6]  # AS-Pfad (z.B. "3561 209 3356 ...")
-                if as_path:  # Wenn der AS-Pfad nicht leer ist
-                    as_list = as_path.split()  # Teile den AS-Pfad in einzelne AS
-                    unique_as.update(as_list)  # Füge alle AS in die Menge ein
-
-                    # Zähle, wie oft das erste AS im Pfad auftaucht
-                    first_as = as_list[0]
-                    if first_as in first_as_count:
-                        first_as_count[first_as] += 1
-                    else:
-                        first_as_count[first_as] = 1
-
-    # Gebe sowohl die einzigartigen AS als auch die Häufigkeit des ersten AS zurück
-    return sorted(unique_as), first_as_count
-
-def load_csv_data_asn(csv_path):
+            yield line.strip().split("|")
+
+def summarize_routes(routes):
+    """Rückgabe von ingest_updates aus einem fertigen RouteStore"""
+    return routes.unique_as(), routes.first_as_count(), routes, routes.outgoing_counts()
+
+@metrics.instrumented("ingest_updates", records_out=lambda result: len(result[2]))
+def ingest_updates(records, track_announcements=False):
     """
-    Lädt die CSV-Datei und baut ein Dictionary auf, in dem der Schlüssel
-    die ASN (als String) ist und der Wert eine Liste von IP-Ranges (hier wird
-    z. B. die erste IP als Anhaltspunkt genutzt).
+    Einmaliger, streamender Durchlauf über alle Update-Records.
+    Liefert die uniquen AS, die Häufigkeit des ersten AS, die nach AS-Pfad
+    deduplizierten Routen (als RouteStore) und die Anzahl ausgehender Routen pro Start-AS.
+    Der Speicherbedarf wächst mit der Anzahl eindeutiger Pfade, nicht mit der Zeilenanzahl.
+    Mit track_announcements=True enthält der RouteStore zusätzlich alle (Prefix, Pfad)-Paare.
     """
-    csv_data = {}
-    with open(csv_path, newline='', encoding="utf-8") as csvfile:
-        reader = csv.reader(csvfile)
-        for row in reader:
-            # Annahme: Spalte 0 = ip, 1 = as_number, 2 = as_name
-            asn = row[1].strip()
-            entry = {
-                "ip": row[0].strip().split("/")[0],
-                "name": row[2].strip()
-            }
-            csv_data.setdefault(asn, []).append(entry)
-    return csv_data
-
-def create_points(autonomous_systems, unique_routes):
-    """Für jede AS-Nummer: Versuche, zuerst die IP aus der CSV zu holen;
-       wenn nicht vorhanden, benutze RIPEstat, um eine IP zu ermitteln.
-       Anschließend werden Geodaten ermittelt und die Ergebnisse als JSON gespeichert."""
-    result = []
+    builder = RouteStoreBuilder(track_announcements)
+    metrics.count(records_read=builder.ingest(records))
+    return summarize_routes(builder.build())
 
+def extract_unique_as(file_path):
+    """Findet alle uniquen AS in einem Update-Dump und zählt, wie oft ein AS an Platz [0] steht"""
+    unique_as, first_as_count, _, _ = ingest_updates(iter_update_records(file_path))
+    return unique_as, first_as_count
+
+def count_outgoing_routes(unique_routes):
+    """Zählt die ausgehenden Routen pro Start-AS aus einer Menge von AS-Pfad-Tupeln"""
     asn_with_outgoing_routes = {}
-    # Einmal durch das Set gehen und Startzahlen zählen
     for tupel in unique_routes:
         if tupel:  # Sicherstellen, dass das Tuple nicht leer ist
-            asn_with_outgoing_route = tupel[0]
-            if asn_with_outgoing_route in asn_with_outgoing_routes:
-                asn_with_outgoing_routes[asn_with_outgoing_route] += 1
-            else:
-                asn_with_outgoing_routes[asn_with_outgoing_route] = 1
-
-    # CSV-Daten einmalig laden (effizienter als für jeden ASN die Datei zu öffnen)
-    csv_data = load_csv_data_asn(geo_csv_path_ip)
-
-    with geoip2.database.Reader(geo_db_path_geo) as reader:
-        for asn in tqdm(autonomous_systems, desc="Verarbeite AS-Nummern"):
+            asn_with_outgoing_routes[tupel[0]] = asn_with_outgoing_routes.get(tupel[0], 0) + 1
+    return asn_with_outgoing_routes
+
+def _prefix_weight(prefix):
+    """Gewicht eines RIPEstat-Prefix: Anzahl IPv4-Adressen bzw. /48-Netze bei IPv6"""
+    network, _, length = prefix.partition("/")
+    bits = 48 if ":" in network else 32
+    return 1 << max(0, bits - int(length or bits))
+
+def _span_weight(ip, size):
+    """Gewicht eines Blocks aus dem ASN-Index, in denselben Einheiten wie _prefix_weight"""
+    return max(1, size >> 80) if ":" in ip else size
+
+def resolve_asn_geo(asn, asn_index, reader, ripe_prefixes=None):
+    """Ermittelt IP, AS-Name und Geodaten für ein AS: zuerst aus dem ASN-Index,
+       sonst über RIPEstat (bereits gebündelt abgefragt in ripe_prefixes).
+       Alle Blöcke des AS werden geolokalisiert; als Standort gilt der Ort, der
+       die meisten Adressen abdeckt. Gibt None zurück, wenn keine IP gefunden wurde."""
+    as_name = "Unknown"  # Fallback, falls kein Name verfügbar ist
+    # Zuerst im ASN-Index nachsehen
+    spans = asn_index.block_spans(asn)
+    if spans:
+        as_name = spans[0][2]
+        blocks = [(ip, _span_weight(ip, size)) for ip, size, _ in spans]
+    else:
+        # Fallback: API-Abfrage über RIPEstat, alle Prefixe ohne CIDR-Part
+        prefixes = ripe_prefixes.get(str(asn)) if ripe_prefixes is not None else ripe_req(asn)
+        blocks = [(p['prefix'].split('/')[0], _prefix_weight(p['prefix'])) for p in prefixes or ()]
+
+    # Geodaten mit der GeoLite2-Datenbank abrufen (Cache pro GeoLite-Netz)
+    geo = reader if isinstance(reader, GeoLookup) else GeoLookup(reader)
+    located = geo.locate(blocks)
+    if located is None:
+        return None
+    ip, entry = located
+    return {"ip": ip, "as_name": as_name, **entry}
+
+@metrics.instrumented("build_points", records_in=lambda autonomous_systems, *a, **k: len(autonomous_systems))
+def build_points(autonomous_systems, asn_with_outgoing_routes, reader, cache, asn_index=None):
+    """Baut die Punkteliste mit bereits geöffnetem GeoLite-Reader (oder GeoLookup,
+       dessen Netz-Cache dann über mehrere Aufrufe erhalten bleibt) und Geo-Cache.
+       Der ASN-Index wird nur geladen, wenn er nicht übergeben wurde und
+       tatsächlich ASNs neu aufzulösen sind."""
+    result = []
+    geo = reader if isinstance(reader, GeoLookup) else GeoLookup(reader)
+    hits, misses = geo.hits, geo.misses
+
+    # Nur ASNs auflösen, die für den aktuellen GeoLite-Build noch nicht im Cache sind
+    # (auch nicht als negativer Eintrag)
+    geo_entries = cache.get_many(autonomous_systems)
+    missing = [asn for asn in autonomous_systems if str(asn) not in geo_entries]
+    metrics.count(geo_cache_hits=len(geo_entries), geo_cache_misses=len(missing),
+                  geo_cache_negative=sum(entry is None for entry in geo_entries.values()))
+    logger.info("%d ASNs aus dem Cache, %d werden neu aufgelöst.", len(geo_entries), len(missing))
+
+    if missing:
+        if asn_index is None:
+            asn_index = load_asn_index(geo_csv_paths)
+
+        # Alle ASNs ohne CSV-Eintrag vorab gebündelt und parallel bei RIPEstat abfragen
+        # (AS_SETs wie "{1,2}" haben weder Blöcke noch RIPEstat-Daten)
+        ripe_prefixes = {}
+        ripe_missing = {str(asn) for asn in missing if to_asn(asn) is not None and not asn_index.has_asn(asn)}
+        if ripe_missing:
+            with RipeResolver() as resolver:
+                ripe_prefixes = resolver.resolve_many(ripe_missing)
+
+        resolved = {}
+        for asn in missing:
+            if to_asn(asn) is None:
+                resolved[str(asn)] = None
+                continue
+            if str(asn) in ripe_missing and str(asn) not in ripe_prefixes:
+                # RIPEstat-Anfrage fehlgeschlagen: kein negativer Eintrag, nächster Zyklus fragt erneut
+                continue
             try:
-                ip = "Unknown" # Fallback, falls keine IP verfügbar ist
-                as_name = "Unknown"  # Fallback, falls kein Name verfügbar ist
-                asn_str = str(asn)
-                # Zuerst in der CSV nachsehen
-                if asn_str in csv_data:
-                    # Hier wird der erste Eintrag genutzt – du kannst die Logik bei Bedarf anpassen
-                    csv_entry = csv_data[asn_str][0]
-                    ip = csv_entry["ip"]
-                    as_name = csv_entry["name"]
-                else:
-                    # Fallback: API-Abfrage über RIPEstat
-                    prefixes = ripe_req(asn)
-                    # Nimm die erste Prefix, entferne den CIDR-Part
-                    if prefixes != None:
-                        ip = prefixes[0]['prefix'].split('/')[0]
-
-                # Geodaten mit der GeoLite2-Datenbank abrufen
-                if ip != "Unknown":
-                    geo_response = reader.city(ip)
-                    city = geo_response.city.name or "Unknown"
-                    region = geo_response.subdivisions.most_specific.name or "Unknown"
-                    coordinates = [geo_response.location.latitude, geo_response.location.longitude]
-
-                    # Anzahl der ausgehenden Routes, sofern vorhanden (10x Laufzeit der Schleife)
-                    #routes_count = sum(1 for route in unique_routes if route[0] == asn)
-                    routes_count = asn_with_outgoing_routes.get(asn,0)
-
-                    # Ergebnis hinzufügen
-                    result.append({
-                        "asn": asn,
-                        "as_name": as_name,
-                        "routes_count": routes_count,
-                        "ip": ip,
-                        "city": city,
-                        "region": region,
-                        "coordinates": coordinates
-                    })
+                resolved[str(asn)] = resolve_asn_geo(asn, asn_index, geo, ripe_prefixes)
             except Exception as e:
-                tqdm.write(f"Fehler bei AS{asn}: {e}")
+                logger.warning("Fehler bei AS%s: %s", asn, e)
+        cache.put_many(resolved)
+        geo_entries.update(resolved)
+        metrics.count(geo_lookup_hits=geo.hits - hits, geo_lookup_misses=geo.misses - misses)
+        logger.info("GeoLite-Abfragen: %d aus dem Netz-Cache, %d aus der Datenbank.",
+                    geo.hits - hits, geo.misses - misses)
+
+    for asn in autonomous_systems:
+        entry = geo_entries.get(str(asn))
+        if entry is None:
+            continue
+        # Ergebnis hinzufügen; routes_count ändert sich pro Zyklus und wird nicht gecacht
+        result.append({
+            "asn": asn,
+            "as_name": entry["as_name"],
+            "routes_count": asn_with_outgoing_routes.get(asn, 0),
+            "ip": entry["ip"],
+            "city": entry["city"],
+            "region": entry["region"],
+            "coordinates": entry["coordinates"]
+        })
+
+    return result
+
+def save_points(points, output_file="../data/points.json"):
+    """Speichert die Punkteliste als JSON-Datei (gestreamt, atomar, mit .gz/.br-Sidecars)"""
+    write_json_stream(points, output_file)
+
+    logger.info("JSON-Datei gespeichert: %s", output_file)
+
+def create_points(autonomous_systems, unique_routes=None, asn_with_outgoing_routes=None):
+    """Für jede AS-Nummer: Versuche, zuerst die IP aus der CSV zu holen;
+       wenn nicht vorhanden, benutze RIPEstat, um eine IP zu ermitteln.
+       Anschließend werden Geodaten ermittelt und die Ergebnisse als JSON gespeichert.
+       Bereits aufgelöste ASNs kommen aus dem persistenten Geo-Cache. Die Anzahl
+       ausgehender Routen kann bereits aus ingest_updates übergeben werden."""
+    if asn_with_outgoing_routes is None:
+        asn_with_outgoing_routes = count_outgoing_routes(unique_routes or ())
 
-    # Ergebnisse in eine JSON-Datei speichern
-    output_file = "../data/points.json"
-    with open(output_file, "w") as json_file:
-        json.dump(result, json_file, indent=4)
+    with open_city_reader(geo_db_path_geo) as reader, \
+            GeoCache(geolite_build_id(reader, geo_csv_paths), geo_cache_path) as cache:
+        result = build_points(autonomous_systems, asn_with_outgoing_routes, reader, cache)
 
-    print(f"JSON-Datei gespeichert: {output_file}")
+    # Ergebnisse in eine JSON-Datei speichern
+    save_points(result)
 
 def ripe_req(asn):
-    """Ripe Abfrage zu bestimmter ASN"""
-    ripe_url = f"https://stat.ripe.net/data/announced-prefixes/data.json?resource={asn}"
-    tqdm.write(f"Suche für AS{asn} bei ripe...")
-    ripe_response = requests.get(ripe_url).json()
-    prefixes = ripe_response.get('data', {}).get('prefixes', [])
+    """Ripe Abfrage zu bestimmter ASN (Einzelabfrage über den gecachten Resolver)"""
+    with RipeResolver() as resolver:
+        prefixes = resolver.resolve_many([asn]).get(str(asn))
     if not prefixes:
-        tqdm.write(f"Keine IPs für AS{asn} gefunden.")
+        logger.info("Keine IPs für AS%s gefunden.", asn)
         return None
     return prefixes
 
+def save_routes(routes, output_file='../data/routes.json'):
+    """Speichert die Routenliste als JSON-Datei (gestreamt, atomar, mit .gz/.br-Sidecars).
+       Optional zusätzlich in kompakter Kodierung als routes.compact.json.
+       routes ist eine Liste von Dictionaries (siehe RouteStore.to_routes)."""
+    write_json_stream(routes, output_file)
+    if OUTPUT_COMPACT:
+        write_routes_compact(routes, compact_path(output_file))
+
+    logger.info("JSON-Datei gespeichert: %s", output_file)
+
 def create_routes(file_path):
     """Input: Update-Dump, Output eine JSON mit allen neuen Routen"""
-    json_output = []
-    seen_routes = set()  # Set zum Speichern bereits verarbeiteter Routen
-    is_legit = 0 #Wertet den Verdacht auf einen Angriff
+    _, _, routes, _ = ingest_updates(iter_update_records(file_path))
+    save_routes(routes.to_routes())
 
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
-
-        for line in tqdm(lines, desc="Erstelle Routen"):
-            parts = line.strip().split("|")
-
-            # Extrahieren der relevanten Daten
-            timestamp = parts[1] if len(parts) > 1 else None
-            status = parts[2] if len(parts) > 2 else None
-            ip = parts[3] if len(parts) > 3 else None
-            start_as = parts[4] if len(parts) > 4 else None
-            prefix = parts[5] if len(parts) > 5 else None
-            asns = parts[6].split() if len(parts) > 6 else None  # Liste von AS-Nummern
-            target_as = asns[-1] if asns else None  # Letzte AS-Nummer als Ziel-AS
-            target_ip = parts[9] if len(parts) > 9 else None
-            additional_info = parts[11] if len(parts) > 11 else None
-
-            # Schlüssel zur Identifizierung eindeutiger Routen
-            route_key = tuple(asns) if asns else None
-
-            # Die JSON-Struktur für dieses Element
-            route = {
-                "timestamp": timestamp,
-                "status": status,
-                "ip": ip,
-                "start_system": start_as,
-                "target_system": target_as,  # Zielsystem ist nun die AS-Nummer
-                "prefix": prefix,
-                "as_path": asns,
-                "is_legit": is_legit,
-                "additional_info": additional_info
-            }
-
-            # Die Route zur Liste hinzufügen, wenn Status "A" ist
-            if status == "A" and route_key not in seen_routes:
-                json_output.append(route)
-                seen_routes.add(route_key)  # Neue Route speichern
-
-    # Die resultierende JSON-Ausgabe erstellen
-    json_data = json.dumps(json_output, indent=4)
-
-    # Optional: In eine Datei schreiben
-    output_file = '../data/routes.json'
-    with open(output_file, 'w') as out_file:
-        out_file.write(json_data)
-
-    print(f"JSON-Datei gespeichert: {output_file}")
-
-    return seen_routes
+    # Schlüssel der eindeutigen Routen (AS-Pfade) zurückgeben
+    return set(routes.as_paths())
 
 if __name__ == "__main__":
-    unique_autonomous_systems, first_as_count = extract_unique_as(update_routes_list)
-    unique_routes = create_routes(update_routes_list)
-    create_points(unique_autonomous_systems, unique_routes)
+    metrics.setup_logging()
+    # Ein einziger Durchlauf über den Dump liefert alle benötigten Zwischenergebnisse
+    update_source = update_dump_mrt if PARSER_BACKEND == "mrt" else update_routes_list
+    logger.info("Lese Updates aus %s", update_source)
+    unique_autonomous_systems, first_as_count, routes, asn_with_outgoing_routes = ingest_updates(iter_update_records(update_source))
+    save_routes(routes.to_routes())
+    create_points(unique_autonomous_systems, asn_with_outgoing_routes=asn_with_outgoing_routes)